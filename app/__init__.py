@@ -1,26 +1,36 @@
 from flask import Flask
 from app.config import Config
-from app.db import init_db
+from app.db import init_db, ensure_indexes
+from app import metrics
 
-def create_app():
-    """Flask application factory."""
+def create_app(overrides=None):
+    """Flask application factory; `overrides` are applied on top of Config."""
     app = Flask(
         __name__,
         template_folder="../templates",
         static_folder="../static",
     )
     app.config.from_object(Config)
+    if overrides:
+        app.config.update(overrides)
+    metrics.configure(app)
 
     # Init MongoDB
     init_db(app)
+    ensure_indexes(app)
+
+    from app.jobs import fail_stale_jobs
+    fail_stale_jobs(app)
 
     # Register blueprints
     from app.routes.api import api_bp
     from app.routes.ui import ui_bp
     from app.routes.auth import auth_bp
+    from app.routes.metrics import metrics_bp
 
     app.register_blueprint(auth_bp)                  # /login, /logout
     app.register_blueprint(ui_bp)                    # /
     app.register_blueprint(api_bp, url_prefix="/api")# /api/*
+    app.register_blueprint(metrics_bp)               # /metrics
 
     return app
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 
 def _parse_iso_time(ts):
@@ -10,162 +11,322 @@ def _parse_iso_time(ts):
         return None
 
 
-def detect_suspicious_events(events):
+class Rule:
     """
-    Advanced rule-based detection on a list of CloudTrail events.
-    Returns a list of alert dictionaries with embedded raw event.
+    A single detection rule.
+
+    Triggers (event_source / event_names) are used to build the dispatch
+    index; `match` is only called for events whose source/name can hit.
+    A rule with no triggers is evaluated for every event.
+
+    `columns` optionally restates `match` as equality checks on named
+    columns (see app.columnar) so batch mode can evaluate it as a vector
+    mask; {} means the triggers alone decide. None means batch mode must
+    call `match` per record.
     """
-    alerts = []
 
-    for event in events:
+    __slots__ = (
+        "name", "description", "category", "severity", "score",
+        "event_source", "event_names", "match", "order", "columns",
+    )
+
+    def __init__(self, name, description, category, severity, score,
+                 match, event_source=None, event_names=None, order=0, columns=None):
+        self.name = name
+        self.description = description
+        self.category = category
+        self.severity = severity
+        self.score = score
+        self.event_source = event_source
+        self.event_names = tuple(event_names or ())
+        self.match = match
+        self.order = order
+        self.columns = columns
+
+    def build_alert(self, event):
+        """Build the alert dictionary for an event this rule matched."""
+        user_identity = event.get("userIdentity") or {}
         event_name = event.get("eventName", "")
-        event_source = event.get("eventSource", "")
-        user_identity = event.get("userIdentity", {})
-        user_type = user_identity.get("type", "Unknown")
-        user_name = user_identity.get("userName", "Unknown")
-        event_time = event.get("eventTime")
-        aws_region = event.get("awsRegion", "Unknown")
-        source_ip = event.get("sourceIPAddress", "Unknown")
-        request_params = event.get("requestParameters", {}) or {}
-        response_elements = event.get("responseElements", {}) or {}
-        event_id = event.get("eventID", None)
-
-        # Common base alert structure
-        base_alert = {
-            "user": user_name,
-            "userType": user_type,
-            "sourceIP": source_ip,
+        return {
+            "user": user_identity.get("userName", "Unknown"),
+            "userType": user_identity.get("type", "Unknown"),
+            "sourceIP": event.get("sourceIPAddress", "Unknown"),
             "eventName": event_name,
-            "eventSource": event_source,
-            "eventTime": event_time,
-            "awsRegion": aws_region,
-            "eventId": event_id,
+            "eventSource": event.get("eventSource", ""),
+            "eventTime": event.get("eventTime"),
+            "awsRegion": event.get("awsRegion", "Unknown"),
+            "eventId": event.get("eventID", None),
             "rawEvent": event,   # embed full event for forensic evidence
+            "rule": self.name,
+            "description": self.description.format(event_name=event_name),
+            "category": self.category,
+            "severity": self.severity,
+            "score": self.score,
         }
 
-        # ---------- RULE 1: Failed Console Login ----------
-        if event_name == "ConsoleLogin":
-            login_result = response_elements.get("ConsoleLogin")
-            if login_result == "Failure":
-                alert = {
-                    **base_alert,
-                    "rule": "Failed Console Login",
-                    "description": "Console sign-in failure detected.",
-                    "category": "Authentication",
-                    "severity": "High",
-                    "score": 70,
-                }
-                alerts.append(alert)
-
-        # ---------- RULE 2: Root Account Activity ----------
-        if user_type == "Root":
-            alert = {
-                **base_alert,
-                "rule": "Root Account Activity",
-                "description": "AWS root account was used.",
-                "category": "Account Management",
-                "severity": "Critical",
-                "score": 95,
-            }
-            alerts.append(alert)
-
-        # ---------- RULE 3: CloudTrail Logging Disabled ----------
-        if event_source == "cloudtrail.amazonaws.com" and event_name in (
-            "StopLogging",
-            "DeleteTrail",
-        ):
-            alert = {
-                **base_alert,
-                "rule": "CloudTrail Logging Change",
-                "description": "CloudTrail logging was stopped or a trail was deleted.",
-                "category": "Monitoring Evasion",
-                "severity": "Critical",
-                "score": 90,
-            }
-            alerts.append(alert)
-
-        # ---------- RULE 4: IAM Privilege Escalation Operations ----------
-        if event_source == "iam.amazonaws.com" and event_name in (
-            "CreateUser",
-            "CreateAccessKey",
-            "AttachUserPolicy",
-            "PutUserPolicy",
-            "AddUserToGroup",
-        ):
-            alert = {
-                **base_alert,
-                "rule": "IAM Privilege Change",
-                "description": f"IAM operation '{event_name}' may indicate privilege escalation.",
-                "category": "Privilege Escalation",
-                "severity": "High",
-                "score": 80,
-            }
-            alerts.append(alert)
-
-        # ---------- RULE 5: Security Group Inbound 0.0.0.0/0 ----------
-        if event_source == "ec2.amazonaws.com" and event_name in (
-            "AuthorizeSecurityGroupIngress",
-            "RevokeSecurityGroupIngress",
-        ):
-            ip_permissions = request_params.get("ipPermissions") or request_params.get(
-                "IpPermissions"
-            )  # depends on log format
-            opened_to_world = False
-            if isinstance(ip_permissions, list):
-                for perm in ip_permissions:
-                    for rng in perm.get("ipRanges", []) + perm.get(
-                        "IpRanges", []
-                    ):
-                        cidr = rng.get("cidrIp") or rng.get("CidrIp")
-                        if cidr == "0.0.0.0/0":
-                            opened_to_world = True
-                            break
-
-            if opened_to_world:
-                alert = {
-                    **base_alert,
-                    "rule": "Security Group Open to World",
-                    "description": "Security group rule allows access from 0.0.0.0/0.",
-                    "category": "Network Exposure",
-                    "severity": "High",
-                    "score": 85,
-                }
-                alerts.append(alert)
-
-        # ---------- RULE 6: S3 Bucket Became Public ----------
-        if event_source == "s3.amazonaws.com" and event_name in (
-            "PutBucketAcl",
-            "PutBucketPolicy",
-        ):
-            # Very simple heuristic: check for AllUsers / AuthenticatedUsers
-            acl = request_params or {}
-            acl_text = str(acl)
-            if "AllUsers" in acl_text or "AuthenticatedUsers" in acl_text:
-                alert = {
-                    **base_alert,
-                    "rule": "Public S3 Bucket Configuration",
-                    "description": "S3 bucket ACL or policy may allow public access.",
-                    "category": "Data Exposure",
-                    "severity": "High",
-                    "score": 85,
-                }
-                alerts.append(alert)
-
-        # ---------- RULE 7: KMS Key Disabled or Scheduled for Deletion ----------
-        if event_source == "kms.amazonaws.com" and event_name in (
-            "DisableKey",
-            "ScheduleKeyDeletion",
-        ):
-            alert = {
-                **base_alert,
-                "rule": "KMS Key Deactivated",
-                "description": f"KMS key operation '{event_name}' detected.",
-                "category": "Encryption",
-                "severity": "Medium",
-                "score": 65,
-            }
-            alerts.append(alert)
-
-        # You can add more rules here: unusual region, high-rate API usage, etc.
-
-    return alerts
+
+# Registered rules, in evaluation (and therefore output) order
+RULES = []
+
+# Compiled dispatch tables, rebuilt by compile_rules()
+_BY_SOURCE_AND_NAME = {}   # (eventSource, eventName) -> tuple of rules
+_BY_NAME = {}              # eventName -> tuple of rules (any source)
+_ALWAYS = ()               # rules without triggers
+
+
+def register_rule(name, description, category, severity, score,
+                  event_source=None, event_names=None, columns=None):
+    """
+    Decorator registering a match function as a detection rule.
+    The function receives the raw CloudTrail event and returns True on a hit.
+    `columns` must be equivalent to the function (see Rule).
+    """
+    def decorator(match):
+        RULES.append(Rule(
+            name, description, category, severity, score, match,
+            event_source=event_source,
+            event_names=event_names,
+            order=len(RULES),
+            columns=columns,
+        ))
+        compile_rules()
+        return match
+    return decorator
+
+
+def compile_rules():
+    """
+    Build the lookup index from the registered rules.
+    Every candidate tuple keeps registration order so alerts for one event
+    come out in the same order as the rules were declared.
+    """
+    global _BY_SOURCE_AND_NAME, _BY_NAME, _ALWAYS
+
+    always = [r for r in RULES if not r.event_names]
+    name_only = {}
+    source_and_name = {}
+
+    for r in RULES:
+        for event_name in r.event_names:
+            if r.event_source is None:
+                name_only.setdefault(event_name, []).append(r)
+            else:
+                source_and_name.setdefault((r.event_source, event_name), []).append(r)
+
+    def _ordered(*groups):
+        merged = {r.order: r for group in groups for r in group}
+        return tuple(merged[k] for k in sorted(merged))
+
+    _ALWAYS = _ordered(always)
+    _BY_NAME = {
+        event_name: _ordered(rules, always)
+        for event_name, rules in name_only.items()
+    }
+    _BY_SOURCE_AND_NAME = {
+        key: _ordered(rules, name_only.get(key[1], ()), always)
+        for key, rules in source_and_name.items()
+    }
+
+
+def candidate_rules(event_source, event_name):
+    """Return the rules that can possibly match an event source/name pair."""
+    rules = _BY_SOURCE_AND_NAME.get((event_source, event_name))
+    if rules is None:
+        rules = _BY_NAME.get(event_name, _ALWAYS)
+    return rules
+
+
+def _contains_text(value, needles):
+    """
+    True if any needle occurs in any string key/value of a nested structure.
+    Equivalent to `needle in str(value)` for JSON data, without building the string.
+    """
+    if isinstance(value, str):
+        return any(n in value for n in needles)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            if _contains_text(k, needles) or _contains_text(v, needles):
+                return True
+        return False
+    if isinstance(value, (list, tuple)):
+        return any(_contains_text(v, needles) for v in value)
+    return False
+
+
+# ---------- RULE 1: Failed Console Login ----------
+@register_rule(
+    "Failed Console Login",
+    "Console sign-in failure detected.",
+    "Authentication", "High", 70,
+    event_names=("ConsoleLogin",),
+    columns={"consoleLogin": "Failure"},
+)
+def _failed_console_login(event):
+    response_elements = event.get("responseElements", {}) or {}
+    return response_elements.get("ConsoleLogin") == "Failure"
+
+
+# ---------- RULE 2: Root Account Activity ----------
+@register_rule(
+    "Root Account Activity",
+    "AWS root account was used.",
+    "Account Management", "Critical", 95,
+    columns={"userType": "Root"},
+)
+def _root_account_activity(event):
+    return (event.get("userIdentity") or {}).get("type") == "Root"
+
+
+# ---------- RULE 3: CloudTrail Logging Disabled ----------
+@register_rule(
+    "CloudTrail Logging Change",
+    "CloudTrail logging was stopped or a trail was deleted.",
+    "Monitoring Evasion", "Critical", 90,
+    event_source="cloudtrail.amazonaws.com",
+    event_names=("StopLogging", "DeleteTrail"),
+    columns={},
+)
+def _cloudtrail_logging_change(event):
+    return True
+
+
+# ---------- RULE 4: IAM Privilege Escalation Operations ----------
+@register_rule(
+    "IAM Privilege Change",
+    "IAM operation '{event_name}' may indicate privilege escalation.",
+    "Privilege Escalation", "High", 80,
+    event_source="iam.amazonaws.com",
+    event_names=(
+        "CreateUser",
+        "CreateAccessKey",
+        "AttachUserPolicy",
+        "PutUserPolicy",
+        "AddUserToGroup",
+    ),
+    columns={},
+)
+def _iam_privilege_change(event):
+    return True
+
+
+# ---------- RULE 5: Security Group Inbound 0.0.0.0/0 ----------
+@register_rule(
+    "Security Group Open to World",
+    "Security group rule allows access from 0.0.0.0/0.",
+    "Network Exposure", "High", 85,
+    event_source="ec2.amazonaws.com",
+    event_names=("AuthorizeSecurityGroupIngress", "RevokeSecurityGroupIngress"),
+)
+def _security_group_open_to_world(event):
+    request_params = event.get("requestParameters", {}) or {}
+    ip_permissions = request_params.get("ipPermissions") or request_params.get(
+        "IpPermissions"
+    )  # depends on log format
+    if not isinstance(ip_permissions, list):
+        return False
+    for perm in ip_permissions:
+        for rng in perm.get("ipRanges", []) + perm.get("IpRanges", []):
+            cidr = rng.get("cidrIp") or rng.get("CidrIp")
+            if cidr == "0.0.0.0/0":
+                return True
+    return False
+
+
+# ---------- RULE 6: S3 Bucket Became Public ----------
+@register_rule(
+    "Public S3 Bucket Configuration",
+    "S3 bucket ACL or policy may allow public access.",
+    "Data Exposure", "High", 85,
+    event_source="s3.amazonaws.com",
+    event_names=("PutBucketAcl", "PutBucketPolicy"),
+)
+def _public_s3_bucket(event):
+    # Very simple heuristic: check for AllUsers / AuthenticatedUsers
+    return _contains_text(
+        event.get("requestParameters", {}) or {},
+        ("AllUsers", "AuthenticatedUsers"),
+    )
+
+
+# ---------- RULE 7: KMS Key Disabled or Scheduled for Deletion ----------
+@register_rule(
+    "KMS Key Deactivated",
+    "KMS key operation '{event_name}' detected.",
+    "Encryption", "Medium", 65,
+    event_source="kms.amazonaws.com",
+    event_names=("DisableKey", "ScheduleKeyDeletion"),
+    columns={},
+)
+def _kms_key_deactivated(event):
+    return True
+
+# You can add more rules here: unusual region, etc.
+# Rate-based rules (high-rate API usage) live in app.windows.
+
+
+def iter_suspicious_events(events, window_detector=None, rule_stats=None):
+    """
+    Lazily run the detection rules over any iterable of CloudTrail events,
+    yielding alert dictionaries as they are found.
+    If a window_detector (app.windows.WindowedDetector) is given, every
+    event is also fed to it and its rate-based alerts are yielded too.
+    If rule_stats (app.metrics.RuleStats) is given, per-rule evaluation
+    counts, hits and time are recorded in it.
+    """
+    if rule_stats is not None:
+        yield from _iter_instrumented(events, window_detector, rule_stats)
+        return
+
+    for event in events:
+        rules = candidate_rules(
+            event.get("eventSource", ""), event.get("eventName", "")
+        )
+        for rule in rules:
+            if rule.match(event):
+                yield rule.build_alert(event)
+
+        if window_detector is not None:
+            yield from window_detector.observe(event)
+
+
+# RuleStats entry for the time spent in the window (rate) rules together
+WINDOW_RULES_STATS_KEY = "(window rules)"
+
+
+def _iter_instrumented(events, window_detector, rule_stats):
+    """iter_suspicious_events, timing every rule evaluation."""
+    clock = time.perf_counter
+    evaluations = rule_stats.evaluations
+    hits = rule_stats.hits
+    seconds = rule_stats.seconds
+
+    for event in events:
+        rules = candidate_rules(
+            event.get("eventSource", ""), event.get("eventName", "")
+        )
+        for rule in rules:
+            name = rule.name
+            start = clock()
+            matched = rule.match(event)
+            seconds[name] = seconds.get(name, 0.0) + clock() - start
+            evaluations[name] = evaluations.get(name, 0) + 1
+            if matched:
+                hits[name] = hits.get(name, 0) + 1
+                yield rule.build_alert(event)
+
+        if window_detector is not None:
+            start = clock()
+            window_alerts = window_detector.observe(event)
+            seconds[WINDOW_RULES_STATS_KEY] = seconds.get(WINDOW_RULES_STATS_KEY, 0.0) + clock() - start
+            evaluations[WINDOW_RULES_STATS_KEY] = evaluations.get(WINDOW_RULES_STATS_KEY, 0) + 1
+            for alert in window_alerts:
+                hits[alert["rule"]] = hits.get(alert["rule"], 0) + 1
+                yield alert
+
+
+def detect_suspicious_events(events):
+    """
+    Advanced rule-based detection on a list of CloudTrail events.
+    Returns a list of alert dictionaries with embedded raw event.
+    """
+    return list(iter_suspicious_events(events))
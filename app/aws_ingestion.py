@@ -1,60 +1,337 @@
-import json
 import gzip
-from io import BytesIO, TextIOWrapper
+import multiprocessing
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
 
 import boto3
+from botocore.config import Config as BotoConfig
 from flask import current_app
 
+from app.db import get_db
+from app.jsonparse import load_records
+from app.metrics import STAGE_S3_DOWNLOAD, STAGE_S3_LIST, timed_iter
 
-def read_cloudtrail_from_s3():
-    """
-    Read CloudTrail log files from S3 and return a list of events.
-    This assumes that AWS credentials and bucket/prefix are configured.
-    """
-    bucket = current_app.config.get("CLOUDTRAIL_S3_BUCKET")
-    prefix = current_app.config.get("CLOUDTRAIL_S3_PREFIX", "")
+# CloudTrail keys look like AWSLogs/<account>/CloudTrail/<region>/YYYY/MM/DD/<file>;
+# a "partition" is everything before the year directory.
+_YEAR_DIR = re.compile(r"^(19|20)\d{2}/$")
+_MAX_PARTITION_DEPTH = 6
 
-    if not bucket:
-        print("CLOUDTRAIL_S3_BUCKET not configured, returning empty list.")
-        return []
+# Within a partition: YYYY/MM/DD/<account>_CloudTrail_<region>_YYYYMMDDTHHMMZ_<suffix>
+_LOG_TIME = re.compile(r"^\d{4}/\d{2}/\d{2}/(?P<head>[^/]*_)(?P<time>\d{8}T\d{4})Z")
 
-    aws_access_key_id = current_app.config.get("AWS_ACCESS_KEY_ID")
-    aws_secret_access_key = current_app.config.get("AWS_SECRET_ACCESS_KEY")
-    aws_region = current_app.config.get("AWS_DEFAULT_REGION", "us-east-1")
 
-    # Create S3 client (uses explicit keys from config)
-    s3 = boto3.client(
+def _create_s3_client():
+    """
+    Create an S3 client from app config (uses explicit keys from config).
+    The connection pool is sized to the fetch concurrency so parallel
+    get_object calls reuse keep-alive connections instead of queueing.
+    """
+    fetch_workers = current_app.config.get("S3_FETCH_WORKERS", 1)
+    pool_size = current_app.config.get("S3_MAX_POOL_CONNECTIONS") or fetch_workers
+
+    return boto3.client(
         "s3",
-        region_name=aws_region,
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key,
+        region_name=current_app.config.get("AWS_DEFAULT_REGION", "us-east-1"),
+        aws_access_key_id=current_app.config.get("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=current_app.config.get("AWS_SECRET_ACCESS_KEY"),
+        config=BotoConfig(max_pool_connections=max(pool_size, 10)),
     )
 
-    events = []
 
-    # List objects under the prefix
+def _is_log_key(key):
+    return key.endswith(".json") or key.endswith(".json.gz")
+
+
+def _iter_log_keys(s3, bucket, prefix):
+    """Yield (None, key) for every CloudTrail log object under the prefix."""
     paginator = s3.get_paginator("list_objects_v2")
     pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
 
     for page in pages:
         for obj in page.get("Contents", []):
-            key = obj["Key"]
-            if not key.endswith(".json") and not key.endswith(".json.gz"):
-                continue
-
-            # Download the object
-            response = s3.get_object(Bucket=bucket, Key=key)
-            body = response["Body"].read()
-
-            # CloudTrail files are often gzipped
-            if key.endswith(".gz"):
-                with gzip.GzipFile(fileobj=BytesIO(body)) as gz:
-                    text = gz.read().decode("utf-8")
-                    data = json.loads(text)
-            else:
-                data = json.loads(body.decode("utf-8"))
-
-            if isinstance(data, dict) and "Records" in data:
-                events.extend(data["Records"])
-
-    return events
+            if _is_log_key(obj["Key"]):
+                yield None, obj["Key"]
+
+
+def _iter_partitions(s3, bucket, prefix, depth=0):
+    """
+    Walk the bucket with a "/" delimiter down to the date-partitioned
+    directories (one per account/region), yielding each partition prefix.
+    Anything that does not follow the CloudTrail layout is treated as a
+    single partition.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+    children = []
+    has_objects = False
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/"):
+        has_objects = has_objects or bool(page.get("Contents"))
+        children.extend(cp["Prefix"] for cp in page.get("CommonPrefixes", []))
+
+    is_leaf = (
+        has_objects
+        or not children
+        or depth >= _MAX_PARTITION_DEPTH
+        or any(_YEAR_DIR.match(child[len(prefix):]) for child in children)
+    )
+    if is_leaf:
+        yield prefix
+        return
+
+    for child in children:
+        yield from _iter_partitions(s3, bucket, child, depth + 1)
+
+
+def _lookback_start(partition, last_key, minutes):
+    """
+    Key to list a partition from: the key prefix of the log files written
+    `minutes` before `last_key`, or `last_key` itself if its name has no
+    CloudTrail timestamp.
+    """
+    match = _LOG_TIME.match(last_key[len(partition):]) if last_key.startswith(partition) else None
+    if match is None or not minutes:
+        return last_key
+    start = datetime.strptime(match["time"], "%Y%m%dT%H%M") - timedelta(minutes=minutes)
+    return f"{partition}{start:%Y/%m/%d}/{match['head']}{start:%Y%m%dT%H%M}"
+
+
+def _iter_new_log_keys(s3, bucket, prefix, watermarks, lookback_minutes):
+    """
+    Yield (partition, key) for log objects not read yet, per partition's
+    watermark ({"lastKey", "recentKeys"}). Keys inside a partition sort by
+    date, so StartAfter skips the history already processed; but
+    CloudTrail can deliver a file late, or in the same minute with a
+    suffix sorting lower, so listing starts `lookback_minutes` before the
+    last key and skips the recentKeys already read there.
+    """
+    paginator = s3.get_paginator("list_objects_v2")
+
+    for partition in _iter_partitions(s3, bucket, prefix):
+        mark = watermarks.get(partition)
+        start_after, recent = "", set()
+        if mark is not None:
+            start_after = _lookback_start(partition, mark["lastKey"], lookback_minutes)
+            recent = set(mark["recentKeys"]) | {mark["lastKey"]}
+        pages = paginator.paginate(Bucket=bucket, Prefix=partition, StartAfter=start_after)
+
+        for page in pages:
+            for obj in page.get("Contents", []):
+                if _is_log_key(obj["Key"]) and obj["Key"] not in recent:
+                    yield partition, obj["Key"]
+
+
+def _advance(watermarks, partition, key, lookback_minutes):
+    """Record a fully read key in its partition's watermark."""
+    mark = watermarks.setdefault(partition, {"lastKey": key, "recentKeys": []})
+    mark["lastKey"] = max(mark["lastKey"], key)
+    start = _lookback_start(partition, mark["lastKey"], lookback_minutes)
+    mark["recentKeys"] = [k for k in mark["recentKeys"] if k > start]
+    if key > start:
+        mark["recentKeys"].append(key)
+
+
+def _parse_log_object(key, body, timings=None):
+    """
+    Decompress (if needed) and parse one CloudTrail object.
+    Module-level so it can run in a worker process.
+    Gzipped objects are parsed from the decompression stream; large ones
+    record by record, so the decompressed text is never held whole.
+    `timings` (a dict) collects decompress/parse seconds.
+    Returns the list of records in the file.
+    """
+    # CloudTrail files are often gzipped
+    if key.endswith(".gz"):
+        with gzip.GzipFile(fileobj=BytesIO(body)) as gz:
+            return load_records(gz, size_hint=len(body), timings=timings)
+    return load_records(BytesIO(body), size_hint=len(body), timings=timings)
+
+
+def _parse_log_object_timed(key, body):
+    """Worker-process variant of _parse_log_object returning (records, timings)."""
+    timings = {}
+    return _parse_log_object(key, body, timings), timings
+
+
+def _fetch_and_parse(s3, bucket, key, parse_pool=None, timings=None):
+    """
+    Download one object and parse it, optionally in a worker process.
+    `timings` (a dict) collects download/decompress/parse seconds.
+    """
+    start = time.perf_counter() if timings is not None else None
+    response = s3.get_object(Bucket=bucket, Key=key)
+    body = response["Body"].read()
+    if timings is not None:
+        timings[STAGE_S3_DOWNLOAD] = time.perf_counter() - start
+
+    if parse_pool is not None:
+        if timings is None:
+            return parse_pool.submit(_parse_log_object, key, body).result()
+        records, worker_timings = parse_pool.submit(_parse_log_object_timed, key, body).result()
+        timings.update(worker_timings)
+        return records
+    return _parse_log_object(key, body, timings)
+
+
+def _iter_serial(s3, bucket, keys, timed=False):
+    """Fetch objects one by one, yielding (partition, key, records, timings)."""
+    for partition, key in keys:
+        timings = {} if timed else None
+        yield partition, key, _fetch_and_parse(s3, bucket, key, timings=timings), timings
+
+
+def _iter_concurrent(s3, bucket, keys, fetch_workers, parse_processes, timed=False):
+    """
+    Fetch objects on a bounded thread pool and yield
+    (partition, key, records, timings) in key order. At most
+    2 * fetch_workers objects are in flight at once, which keeps memory
+    bounded while hiding per-request latency.
+    """
+    parse_pool = None
+    if parse_processes > 0:
+        # spawn: forking a threaded web worker is not safe
+        parse_pool = ProcessPoolExecutor(
+            max_workers=parse_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    window = fetch_workers * 2
+    pending = deque()
+    pool = ThreadPoolExecutor(max_workers=fetch_workers)
+
+    try:
+        for partition, key in keys:
+            timings = {} if timed else None
+            future = pool.submit(_fetch_and_parse, s3, bucket, key, parse_pool, timings)
+            pending.append((partition, key, future, timings))
+            if len(pending) >= window:
+                partition, key, future, timings = pending.popleft()
+                yield partition, key, future.result(), timings
+
+        while pending:
+            partition, key, future, timings = pending.popleft()
+            yield partition, key, future.result(), timings
+    finally:
+        # Consumer stopped early or a fetch failed: drop queued work
+        for _, _, future, _ in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
+        if parse_pool is not None:
+            parse_pool.shutdown()
+
+
+def iter_cloudtrail_from_s3(s3=None, watermarks=None, progress=None, time_range=None):
+    """
+    Yield CloudTrail events from S3, one object at a time, so only a single
+    log file is held in memory.
+    This assumes that AWS credentials and bucket/prefix are configured.
+
+    With S3_FETCH_WORKERS > 1 objects are downloaded concurrently (and parsed
+    in S3_PARSE_PROCESSES worker processes, if set); records are still
+    yielded in key order. `s3` may be any client exposing get_paginator /
+    get_object, e.g. a local stand-in for testing.
+
+    If `watermarks` (partition prefix -> {"lastKey", "recentKeys"}, see
+    load_checkpoints) is given, only objects not read before are read,
+    looking S3_CHECKPOINT_LOOKBACK_MINUTES back for late deliveries, and
+    the dict is advanced in place as each object's records are fully
+    consumed. Persist it with
+    save_checkpoints() once the scan's alerts are stored.
+    `progress` (a ScanProgress) is told about every object read, and gets
+    list/download/decompress/parse timings when metrics are enabled.
+    With a `time_range` (app.timerange.TimeRange), objects in date
+    directories outside it are not downloaded and only events in it are
+    yielded.
+    """
+    bucket = current_app.config.get("CLOUDTRAIL_S3_BUCKET")
+    prefix = current_app.config.get("CLOUDTRAIL_S3_PREFIX", "")
+
+    if not bucket:
+        print("CLOUDTRAIL_S3_BUCKET not configured, nothing to read.")
+        return
+
+    if s3 is None:
+        s3 = _create_s3_client()
+
+    fetch_workers = current_app.config.get("S3_FETCH_WORKERS", 1)
+    parse_processes = current_app.config.get("S3_PARSE_PROCESSES", 0)
+
+    pipeline_metrics = progress.metrics if progress is not None else None
+    timed = pipeline_metrics is not None
+    lookback_minutes = current_app.config.get("S3_CHECKPOINT_LOOKBACK_MINUTES", 60)
+
+    if watermarks is None:
+        keys = _iter_log_keys(s3, bucket, prefix)
+    else:
+        keys = _iter_new_log_keys(s3, bucket, prefix, watermarks, lookback_minutes)
+    if time_range is not None:
+        keys = ((partition, key) for partition, key in keys if time_range.covers_path(key))
+    keys = timed_iter(keys, STAGE_S3_LIST, pipeline_metrics)
+
+    if fetch_workers <= 1:
+        objects = _iter_serial(s3, bucket, keys, timed)
+    else:
+        objects = _iter_concurrent(s3, bucket, keys, fetch_workers, parse_processes, timed)
+
+    for partition, key, records, timings in objects:
+        if time_range is not None:
+            records = list(time_range.filter(records))
+        if progress is not None:
+            progress.add_files(1)
+            progress.add_events(len(records))
+        if timed:
+            pipeline_metrics.observe_all(timings)
+        yield from records
+        if watermarks is not None:
+            _advance(watermarks, partition, key, lookback_minutes)
+
+
+def read_cloudtrail_from_s3(s3=None):
+    """
+    Read CloudTrail log files from S3 and return a list of events.
+    This assumes that AWS credentials and bucket/prefix are configured.
+    """
+    return list(iter_cloudtrail_from_s3(s3))
+
+
+def load_checkpoints(bucket):
+    """
+    Return the persisted watermarks for a bucket as {partition: {"lastKey":
+    last key read, "recentKeys": keys read within the lookback window}}.
+    """
+    if not bucket:
+        return {}
+
+    db = get_db()
+    cursor = db.scan_checkpoints.find({"bucket": bucket}, {"partition": 1, "lastKey": 1, "recentKeys": 1})
+    return {
+        doc["partition"]: {"lastKey": doc["lastKey"], "recentKeys": doc.get("recentKeys", [])}
+        for doc in cursor
+    }
+
+
+def save_checkpoints(bucket, watermarks):
+    """
+    Persist watermarks (one document per bucket/partition) so the next
+    scan resumes where this one stopped.
+    """
+    if not bucket or not watermarks:
+        return
+
+    db = get_db()
+    now = datetime.utcnow()
+    for partition, mark in watermarks.items():
+        db.scan_checkpoints.update_one(
+            {"_id": f"{bucket}/{partition}"},
+            {"$set": {
+                "bucket": bucket,
+                "partition": partition,
+                "lastKey": mark["lastKey"],
+                "recentKeys": mark["recentKeys"],
+                "updatedAt": now,
+            }},
+            upsert=True,
+        )
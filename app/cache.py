@@ -0,0 +1,156 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.db import get_db
+
+try:
+    import redis
+except ImportError:  # optional: only needed for ALERTS_CACHE_BACKEND=redis
+    redis = None
+
+
+class CachedResponse:
+    """A serialized API response: JSON body bytes, extra headers, ETag."""
+
+    __slots__ = ("body", "headers", "etag")
+
+    def __init__(self, body, headers=None, etag=None):
+        self.body = body
+        self.headers = headers or {}
+        self.etag = etag or hashlib.sha1(
+            body + json.dumps(self.headers, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def to_json(self):
+        return json.dumps({
+            "body": self.body.decode("utf-8"),
+            "headers": self.headers,
+            "etag": self.etag,
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        return cls(data["body"].encode("utf-8"), data["headers"], data["etag"])
+
+
+class MemoryCache:
+    """
+    Thread-safe in-process LRU cache with a per-entry TTL.
+    Each web worker process has its own.
+    """
+
+    def __init__(self, max_entries=256, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()   # key -> (expires at, CachedResponse)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """
+    Cache shared by all worker processes in a Redis-compatible server
+    (Redis, Valkey, KeyDB, ...). Entries expire after the TTL; eviction
+    beyond that is left to the server's maxmemory policy.
+    """
+
+    def __init__(self, url, ttl=60, prefix="alerts-cache:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        data = self._client.get(self._key(key))
+        return CachedResponse.from_json(data) if data is not None else None
+
+    def set(self, key, value):
+        self._client.set(self._key(key), value.to_json(), ex=self.ttl)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+def _create_cache(config):
+    ttl = config.get("ALERTS_CACHE_TTL", 60)
+    if config.get("ALERTS_CACHE_BACKEND", "memory") == "redis":
+        if redis is None:
+            print("redis package not installed, using the in-process alerts cache.")
+        else:
+            return RedisCache(config.get("ALERTS_CACHE_REDIS_URL", "redis://localhost:6379/0"), ttl)
+    return MemoryCache(config.get("ALERTS_CACHE_MAX_ENTRIES", 256), ttl)
+
+
+def get_cache(app=None):
+    """Return this app's alerts cache, or None when caching is disabled."""
+    app = app or current_app
+    if not app.config.get("ALERTS_CACHE_ENABLED", True):
+        return None
+    if "alerts_cache" not in app.extensions:
+        app.extensions["alerts_cache"] = _create_cache(app.config)
+    return app.extensions["alerts_cache"]
+
+
+def get_alerts_generation():
+    """
+    Current alerts generation: a counter bumped whenever alerts are
+    written. It is part of every cache key, so a write invalidates all
+    cached responses in every process at once.
+    """
+    doc = get_db().cache_state.find_one({"_id": "alerts"}, {"generation": 1})
+    return doc["generation"] if doc else 0
+
+
+def bump_alerts_generation(db=None):
+    """Invalidate cached alert responses after a write."""
+    db = db if db is not None else get_db()
+    db.cache_state.update_one({"_id": "alerts"}, {"$inc": {"generation": 1}}, upsert=True)
+
+
+def cached_response(key, build):
+    """
+    Return the CachedResponse for `key` (a tuple of normalized request
+    parameters), calling build() -> CachedResponse on a miss.
+    Responses larger than ALERTS_CACHE_MAX_ITEM_BYTES are not stored.
+    """
+    cache = get_cache()
+    if cache is None:
+        return build()
+
+    key = (get_alerts_generation(),) + tuple(key)
+    response = cache.get(key)
+    if response is None:
+        response = build()
+        if len(response.body) <= current_app.config.get("ALERTS_CACHE_MAX_ITEM_BYTES", 4 * 1024 * 1024):
+            cache.set(key, response)
+    return response
@@ -6,6 +6,17 @@ load_dotenv()
 class Config:
     """Flask configuration class."""
     MONGO_URI = os.getenv("MONGO_URI")
+    MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "cloudtrail_db")
+
+    # Shared MongoClient pool (one per process)
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))  # 0 = never close idle
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+    MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0"))  # 0 = no timeout
+    MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "true").lower() == "true"
+
     SECRET_KEY = os.getenv("SECRET_KEY", "devkey")
 
     # AWS + CloudTrail
@@ -16,6 +27,85 @@ class Config:
     CLOUDTRAIL_S3_BUCKET = os.getenv("CLOUDTRAIL_S3_BUCKET")
     CLOUDTRAIL_S3_PREFIX = os.getenv("CLOUDTRAIL_S3_PREFIX", "")
 
+    # S3 ingestion concurrency (1 = serial download)
+    S3_FETCH_WORKERS = int(os.getenv("S3_FETCH_WORKERS", "8"))
+    S3_PARSE_PROCESSES = int(os.getenv("S3_PARSE_PROCESSES", "0"))  # 0 = parse in fetch threads
+    S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "0"))  # 0 = match fetch workers
+    # Resumed S3 scans re-list this many minutes before the checkpoint, so log
+    # files CloudTrail delivered late (sorting below keys already read) are not missed
+    S3_CHECKPOINT_LOOKBACK_MINUTES = int(os.getenv("S3_CHECKPOINT_LOOKBACK_MINUTES", "60"))
+
+    # CloudTrail JSON parsing: auto = orjson, then ujson, then stdlib json
+    JSON_PARSER = os.getenv("JSON_PARSER", "auto")
+    JSON_STREAM_MIN_BYTES = int(os.getenv("JSON_STREAM_MIN_BYTES", str(8 * 1024 * 1024)))  # stored size; larger files are decoded record by record
+
+    # Local scanning (LOCAL_SCAN_WORKERS > 1 = process pool)
+    LOCAL_LOG_FOLDER = os.getenv("LOCAL_LOG_FOLDER", "sample_logs")
+    LOCAL_SCAN_WORKERS = int(os.getenv("LOCAL_SCAN_WORKERS", "1"))
+    LOCAL_SCAN_SHARD_SIZE = int(os.getenv("LOCAL_SCAN_SHARD_SIZE", "64"))  # files per worker task
+
+    # Columnar batch analysis (needs NumPy); 0 = evaluate event by event
+    ANALYZER_BATCH_SIZE = int(os.getenv("ANALYZER_BATCH_SIZE", "0"))
+
+    # Sliding-window (rate) detections
+    WINDOW_DETECTIONS_ENABLED = os.getenv("WINDOW_DETECTIONS_ENABLED", "true").lower() == "true"
+    WINDOW_BUCKET_SECONDS = int(os.getenv("WINDOW_BUCKET_SECONDS", "60"))
+    WINDOW_MAX_KEYS = int(os.getenv("WINDOW_MAX_KEYS", "100000"))  # tracked IPs/users per rule
+    WINDOW_FAILED_LOGIN_THRESHOLD = int(os.getenv("WINDOW_FAILED_LOGIN_THRESHOLD", "5"))
+    WINDOW_FAILED_LOGIN_MINUTES = int(os.getenv("WINDOW_FAILED_LOGIN_MINUTES", "10"))
+    WINDOW_IAM_BURST_THRESHOLD = int(os.getenv("WINDOW_IAM_BURST_THRESHOLD", "10"))
+    WINDOW_IAM_BURST_MINUTES = int(os.getenv("WINDOW_IAM_BURST_MINUTES", "5"))
+
+    # Replay guard: drop events whose eventID an earlier scan (or file) already
+    # analyzed. A Bloom filter persisted at REPLAY_GUARD_PATH, plus an exact LRU
+    # of recent IDs; a false positive means an unseen event is not analyzed.
+    REPLAY_GUARD_ENABLED = os.getenv("REPLAY_GUARD_ENABLED", "false").lower() == "true"
+    REPLAY_GUARD_PATH = os.getenv("REPLAY_GUARD_PATH", "replay_guard.bin")
+    REPLAY_GUARD_FP_RATE = float(os.getenv("REPLAY_GUARD_FP_RATE", "0.0001"))
+    REPLAY_GUARD_CAPACITY = int(os.getenv("REPLAY_GUARD_CAPACITY", "1000000"))  # IDs in the first filter
+    REPLAY_GUARD_MAX_BYTES = int(os.getenv("REPLAY_GUARD_MAX_BYTES", str(64 * 1024 * 1024)))  # then oldest IDs are forgotten
+    REPLAY_GUARD_LRU_SIZE = int(os.getenv("REPLAY_GUARD_LRU_SIZE", "100000"))  # exact recent IDs
+
+    # Scan pipeline
+    STORE_BATCH_SIZE = int(os.getenv("STORE_BATCH_SIZE", "1000"))
+    ALERT_SCAN_IDS_MAX = int(os.getenv("ALERT_SCAN_IDS_MAX", "20"))  # latest scans listed on a re-found alert
+    SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "2"))  # concurrent background scans per process
+    SCAN_JOB_RECOVERY = os.getenv("SCAN_JOB_RECOVERY", "true").lower() == "true"  # fail orphaned jobs at startup
+    SCAN_JOB_STALE_AFTER = int(os.getenv("SCAN_JOB_STALE_AFTER", "3600"))  # seconds without progress = failed
+    SCAN_PROGRESS_INTERVAL = float(os.getenv("SCAN_PROGRESS_INTERVAL", "1.0"))  # seconds between status writes
+
+    # /api/alerts paging
+    ALERTS_PAGE_SIZE = int(os.getenv("ALERTS_PAGE_SIZE", "500"))
+    ALERTS_MAX_PAGE_SIZE = int(os.getenv("ALERTS_MAX_PAGE_SIZE", "5000"))
+    ALERTS_EXPORT_BATCH_SIZE = int(os.getenv("ALERTS_EXPORT_BATCH_SIZE", "1000"))  # Mongo cursor batch
+
+    # Alert retention: alerts expire ALERTS_TTL_DAYS after ingestion (0 = never),
+    # their raw events and alert_stats counters with them, and whole months
+    # older than ALERTS_ARCHIVE_AFTER_DAYS can be moved out of the hot
+    # collection (POST /api/alerts/archive)
+    ALERTS_TTL_DAYS = int(os.getenv("ALERTS_TTL_DAYS", "0"))
+    ALERTS_ARCHIVE_AFTER_DAYS = int(os.getenv("ALERTS_ARCHIVE_AFTER_DAYS", "90"))
+    ALERTS_ARCHIVE_TARGET = os.getenv("ALERTS_ARCHIVE_TARGET", "collection")  # collection | ndjson | parquet
+    ALERTS_ARCHIVE_DIR = os.getenv("ALERTS_ARCHIVE_DIR", "archive")  # ndjson / parquet files
+    ALERTS_ARCHIVE_BATCH_SIZE = int(os.getenv("ALERTS_ARCHIVE_BATCH_SIZE", "1000"))
+
+    # /api/alerts response cache, invalidated on every alert write
+    ALERTS_CACHE_ENABLED = os.getenv("ALERTS_CACHE_ENABLED", "true").lower() == "true"
+    ALERTS_CACHE_BACKEND = os.getenv("ALERTS_CACHE_BACKEND", "memory")  # memory | redis
+    ALERTS_CACHE_REDIS_URL = os.getenv("ALERTS_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    ALERTS_CACHE_TTL = int(os.getenv("ALERTS_CACHE_TTL", "60"))  # seconds; bounds hours_back staleness
+    ALERTS_CACHE_MAX_ENTRIES = int(os.getenv("ALERTS_CACHE_MAX_ENTRIES", "256"))  # per process (memory)
+    ALERTS_CACHE_MAX_ITEM_BYTES = int(os.getenv("ALERTS_CACHE_MAX_ITEM_BYTES", str(4 * 1024 * 1024)))
+
+    # /api/alerts/stream (Server-Sent Events)
+    ALERTS_STREAM_SOURCE = os.getenv("ALERTS_STREAM_SOURCE", "auto")  # auto | change_stream | local
+    ALERTS_STREAM_MAX_PENDING = int(os.getenv("ALERTS_STREAM_MAX_PENDING", "1000"))  # per client, then resync
+    ALERTS_STREAM_HEARTBEAT = int(os.getenv("ALERTS_STREAM_HEARTBEAT", "15"))  # seconds between keep-alives
+
+    # Pipeline timings and per-rule counters, served at /metrics
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # bearer token for scrapers (else login required)
+
     # Login creds (local/dev)
     ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
     ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin")
\ No newline at end of file
@@ -1,24 +1,197 @@
+import os
+from datetime import datetime
+
 from flask import current_app, g
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import PyMongoError
+
+# Indexes on the alerts collection, one per query shape used by
+# get_recent_alerts: equality filters first, then the (ingestedAt, _id)
+# sort/range that keyset pagination walks.
+ALERT_INDEXES = [
+    ("ingestedAt_id", [("ingestedAt", DESCENDING), ("_id", DESCENDING)]),
+    ("severity_ingestedAt_id", [
+        ("severity", ASCENDING), ("ingestedAt", DESCENDING), ("_id", DESCENDING),
+    ]),
+    ("rule_ingestedAt_id", [
+        ("rule", ASCENDING), ("ingestedAt", DESCENDING), ("_id", DESCENDING),
+    ]),
+    # scan_id filters match scanIds: every scan that found the alert
+    ("scanIds_ingestedAt_id", [
+        ("scanIds", ASCENDING), ("ingestedAt", DESCENDING), ("_id", DESCENDING),
+    ]),
+    ("scanIds_severity_ingestedAt_id", [
+        ("scanIds", ASCENDING), ("severity", ASCENDING),
+        ("ingestedAt", DESCENDING), ("_id", DESCENDING),
+    ]),
+    # One alert per (event, rule); store_alerts upserts on this key.
+    # Partial so alerts stored before deduplication existed don't collide.
+    ("eventKey_rule_unique", [("eventKey", ASCENDING), ("rule", ASCENDING)], {
+        "unique": True,
+        "partialFilterExpression": {"eventKey": {"$exists": True}},
+    }),
+]
+
+
+# Indexes on the alert_stats counters (see app.stats): the upsert key,
+# which also serves scan-filtered summaries, and time-window summaries.
+STATS_INDEXES = [
+    ("scanId_hour_rule_severity_rescan_unique", [
+        ("scanId", ASCENDING), ("hour", ASCENDING),
+        ("rule", ASCENDING), ("severity", ASCENDING), ("rescan", ASCENDING),
+    ], {"unique": True}),
+    ("hour", [("hour", ASCENDING)]),
+]
+
+# Indexes replaced by the ones above, dropped where they still exist
+OBSOLETE_INDEXES = {
+    "alerts": ["scanId_ingestedAt_id", "scanId_severity_ingestedAt_id"],
+    "alert_stats": ["scanId_hour_rule_severity_unique"],
+}
+
+
+def _create_client(config):
+    """
+    Build the process-wide MongoClient from app config.
+    connect=False defers opening sockets until the first operation, so a
+    client created before gunicorn forks never shares connections with a child.
+    """
+    return MongoClient(
+        config["MONGO_URI"],
+        maxPoolSize=config.get("MONGO_MAX_POOL_SIZE", 50),
+        minPoolSize=config.get("MONGO_MIN_POOL_SIZE", 0),
+        maxIdleTimeMS=config.get("MONGO_MAX_IDLE_TIME_MS") or None,
+        serverSelectionTimeoutMS=config.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        connectTimeoutMS=config.get("MONGO_CONNECT_TIMEOUT_MS", 5000),
+        socketTimeoutMS=config.get("MONGO_SOCKET_TIMEOUT_MS") or None,
+        connect=False,
+    )
+
+
+def get_client(app=None):
+    """
+    Return the pooled MongoClient for this process.
+    If the process was forked after the client was created (e.g. gunicorn
+    preloading the app), a fresh client is created for the child.
+    """
+    app = app or current_app
+    state = app.extensions["mongo"]
+
+    if state["pid"] != os.getpid():
+        state["client"] = _create_client(app.config)
+        state["pid"] = os.getpid()
+
+    return state["client"]
+
 
 def get_db():
     """
     Get a MongoDB database instance for the current request.
-    Uses Flask's 'g' object to store it during the request.
+    The handle comes from the shared connection pool and is cached on
+    Flask's 'g' object for the rest of the request.
     """
     if "db" not in g:
-        mongo_uri = current_app.config["MONGO_URI"]
-        client = MongoClient(mongo_uri)
-        g.db = client["cloudtrail_db"]  # database name
+        db_name = current_app.config.get("MONGO_DB_NAME", "cloudtrail_db")
+        g.db = get_client()[db_name]
     return g.db
 
+
 def init_db(app):
     """
-    Initialize DB by attaching a teardown function
-    that closes the connection after each request.
+    Initialize DB by creating the process-wide pooled client and attaching
+    a teardown function that releases the request's handle (the client
+    itself stays open and its connections are reused).
     """
+    app.extensions["mongo"] = {
+        "client": _create_client(app.config),
+        "pid": os.getpid(),
+    }
+
     @app.teardown_appcontext
     def close_db(exception):
-        db = g.pop("db", None)
-        if db is not None:
-            db.client.close()
+        g.pop("db", None)
+
+
+# TTL indexes applying ALERTS_TTL_DAYS: alerts expire that long after
+# ingestion, and the raw events and counters referring to them with them
+ALERTS_TTL_INDEX = "ingestedAt_ttl"
+RAW_EVENTS_TTL_INDEX = "lastReferenced_ttl"
+STATS_TTL_INDEX = "lastIngestedAt_ttl"
+
+# Expiry field value of what outlives the TTL (alerts archived to collections)
+NEVER_EXPIRES = datetime(9999, 12, 31)
+
+
+def _ensure_ttl(collection, field, index_name, ttl_days):
+    """
+    Expire documents ALERTS_TTL_DAYS after `field` (0 = keep them): create
+    the TTL index, update its expiry if the setting changed, or drop it.
+    """
+    existing = collection.index_information().get(index_name)
+    seconds = ttl_days * 86400
+    if not ttl_days:
+        if existing:
+            collection.drop_index(index_name)
+    elif existing is None:
+        collection.create_index([(field, ASCENDING)], name=index_name, expireAfterSeconds=seconds)
+    elif existing.get("expireAfterSeconds") != seconds:
+        collection.database.command("collMod", collection.name, index={
+            "name": index_name, "expireAfterSeconds": seconds,
+        })
+
+
+def _backfill_scan_ids(db):
+    """
+    Give alerts stored before scanIds existed their scanId as scanIds
+    (MongoDB 4.2+). A one-off migration, recorded in cache_state so later
+    starts (every worker's) skip the collection scans.
+    """
+    if db.cache_state.find_one({"_id": "migrations", "scanIds": {"$exists": True}}, {"_id": 1}):
+        return
+    archives = [doc["collection"] for doc in db.alert_archives.find({"collection": {"$exists": True}})]
+    for name in ["alerts", *archives]:
+        db[name].update_many(
+            {"scanIds": {"$exists": False}, "scanId": {"$type": "string"}},
+            [{"$set": {"scanIds": ["$scanId"]}}],
+        )
+    db.cache_state.update_one({"_id": "migrations"}, {"$set": {"scanIds": datetime.utcnow()}}, upsert=True)
+
+
+def ensure_indexes(app):
+    """
+    Create the declared alert and alert_stats indexes (no-op if they
+    already exist), drop the ones they replace, backfill scanIds and set
+    up the TTL indexes (see app.retention.backfill_expiry_fields).
+    Failures are reported but do not stop the app from starting.
+    """
+    if not app.config.get("MONGO_ENSURE_INDEXES", True):
+        return
+
+    db_name = app.config.get("MONGO_DB_NAME", "cloudtrail_db")
+    db = get_client(app)[db_name]
+
+    try:
+        for name, indexes in OBSOLETE_INDEXES.items():
+            existing = db[name].index_information()
+            for index_name in indexes:
+                if index_name in existing:
+                    db[name].drop_index(index_name)
+        for collection, indexes in ((db.alerts, ALERT_INDEXES), (db.alert_stats, STATS_INDEXES)):
+            for name, keys, *options in indexes:
+                collection.create_index(keys, name=name, **(options[0] if options else {}))
+        _backfill_scan_ids(db)
+
+        ttl_days = app.config.get("ALERTS_TTL_DAYS", 0)
+        expiring = (
+            (db.alerts, "ingestedAt", ALERTS_TTL_INDEX),
+            (db.raw_events, "lastReferenced", RAW_EVENTS_TTL_INDEX),
+            (db.alert_stats, "lastIngestedAt", STATS_TTL_INDEX),
+        )
+        if ttl_days and any(name not in c.index_information() for c, _, name in expiring[1:]):
+            # Imported here: app.retention builds on this module
+            from app.retention import backfill_expiry_fields
+            backfill_expiry_fields(db)
+        for collection, field, index_name in expiring:
+            _ensure_ttl(collection, field, index_name, ttl_days)
+    except PyMongoError as exc:
+        print(f"Could not ensure MongoDB indexes: {exc}")
@@ -0,0 +1,168 @@
+import os
+import socket
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+from app.db import get_client, get_db
+from app.pipeline import ScanProgress, run_local_scan, run_s3_scan
+
+# Scan kinds that can be submitted as background jobs
+SCAN_RUNNERS = {
+    "local": run_local_scan,
+    "s3": run_s3_scan,
+}
+
+_executor = None
+_executor_pid = None
+
+
+def _get_executor(app):
+    """
+    Return this process's background executor, creating it on first use
+    (and again after a fork, since threads do not survive one).
+    """
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config.get("SCAN_JOB_WORKERS", 2),
+            thread_name_prefix="scan-job",
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def _update_job(scan_id, **fields):
+    get_db().scan_jobs.update_one(
+        {"_id": scan_id},
+        {"$set": {**fields, "updatedAt": datetime.utcnow()}},
+    )
+
+
+def _run_job(app, scan_id, kind, options):
+    """Executor entry point: run one scan inside an app context."""
+    with app.app_context():
+        progress = ScanProgress(
+            on_update=lambda p: _update_job(scan_id, progress=p.snapshot()),
+            interval=app.config.get("SCAN_PROGRESS_INTERVAL", 1.0),
+        )
+        try:
+            # Only if still queued: startup recovery may have failed it meanwhile
+            now = datetime.utcnow()
+            started = get_db().scan_jobs.update_one(
+                {"_id": scan_id, "status": "queued"},
+                {"$set": {"status": "running", "startedAt": now, "updatedAt": now}},
+            )
+            if not started.matched_count:
+                print(f"Scan job {scan_id} is no longer queued, not starting it.")
+                return
+            result = SCAN_RUNNERS[kind](scan_id, progress=progress, **options)
+        except Exception as exc:
+            traceback.print_exc()
+            _update_job(
+                scan_id,
+                status="failed",
+                error=str(exc),
+                progress=progress.snapshot(),
+                finishedAt=datetime.utcnow(),
+            )
+            return
+
+        _update_job(
+            scan_id,
+            status="completed",
+            alerts_detected=result["inserted"],
+            duplicates=result["duplicates"],
+            progress=progress.snapshot(),
+            finishedAt=datetime.utcnow(),
+        )
+
+
+def submit_scan(app, kind, **options):
+    """
+    Queue a scan of the given kind ("local" or "s3") on the background
+    executor and return its scanId immediately. Job status is kept in the
+    scan_jobs collection so any web worker can report on it.
+    """
+    scan_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+
+    get_db().scan_jobs.insert_one({
+        "_id": scan_id,
+        "kind": kind,
+        "options": options,
+        "status": "queued",
+        "host": socket.gethostname(),
+        "pid": os.getpid(),
+        "progress": ScanProgress().snapshot(),
+        "createdAt": now,
+        "updatedAt": now,
+    })
+
+    future = _get_executor(app).submit(_run_job, app, scan_id, kind, options)
+    future.add_done_callback(_report_job_error)
+    return scan_id
+
+
+def _report_job_error(future):
+    """Print what escaped _run_job (e.g. MongoDB down while marking the job failed)."""
+    exc = future.exception()
+    if exc is not None:
+        traceback.print_exception(type(exc), exc, exc.__traceback__)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by another user
+    return True
+
+
+def fail_stale_jobs(app):
+    """
+    Mark queued/running jobs that can no longer finish as failed, so
+    pollers stop waiting on them: jobs of a process on this host that
+    has exited (e.g. a restart), and running jobs anywhere with no
+    progress update for SCAN_JOB_STALE_AFTER seconds. A queued job whose
+    process may still be alive is left alone however long it waits in
+    that process's executor. Called at startup; failures are reported but
+    do not stop the app from starting.
+    """
+    if not app.config.get("SCAN_JOB_RECOVERY", True):
+        return
+
+    db_name = app.config.get("MONGO_DB_NAME", "cloudtrail_db")
+    jobs = get_client(app)[db_name].scan_jobs
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=app.config.get("SCAN_JOB_STALE_AFTER", 3600))
+    host = socket.gethostname()
+
+    try:
+        fields = {"status": 1, "host": 1, "pid": 1, "updatedAt": 1}
+        for job in jobs.find({"status": {"$in": ["queued", "running"]}}, fields):
+            owned_here = job.get("host") == host and job.get("pid") is not None
+            if owned_here and job["pid"] != os.getpid() and not _process_alive(job["pid"]):
+                reason = "Scan process exited before the scan finished"
+            elif job["status"] == "running" and (job.get("updatedAt") is None or job["updatedAt"] < stale_before):
+                reason = "Scan stopped reporting progress"
+            else:
+                continue
+            # Unless it moved on since it was read
+            jobs.update_one(
+                {"_id": job["_id"], "status": job["status"], "updatedAt": job.get("updatedAt")},
+                {"$set": {"status": "failed", "error": reason, "finishedAt": now, "updatedAt": now}},
+            )
+    except PyMongoError as exc:
+        print(f"Could not check for stale scan jobs: {exc}")
+
+
+def get_scan_job(scan_id):
+    """Return the job document for a scanId, or None."""
+    return get_db().scan_jobs.find_one({"_id": scan_id})
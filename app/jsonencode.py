@@ -0,0 +1,26 @@
+import json
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # optional: fastest encoder
+    orjson = None
+
+
+def _default(value):
+    """Values JSON has no type for: datetimes as ISO 8601, anything else (ObjectId) as str."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(obj):
+    """
+    Encode `obj` as compact UTF-8 JSON bytes, with orjson when installed.
+    ObjectIds become strings and datetimes ISO 8601 strings, as
+    _serialize_alert does, so stored alert documents can be encoded as
+    they are read, without copying them first.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,165 @@
+import codecs
+import json
+import re
+import time
+
+from app.config import Config
+
+try:
+    import orjson
+except ImportError:  # optional: fastest backend
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # optional: used when orjson is missing
+    ujson = None
+
+
+# name -> loads(bytes | str), in "auto" preference order
+BACKENDS = {}
+if orjson is not None:
+    BACKENDS["orjson"] = orjson.loads
+if ujson is not None:
+    BACKENDS["ujson"] = ujson.loads
+BACKENDS["json"] = json.loads
+
+# A CloudTrail document as AWS writes it: {"Records": [ ... ] ... }
+_RECORDS_START = re.compile(r'\s*\{\s*"Records"\s*:\s*\[')
+_SEPARATORS = re.compile(r"[\s,]*")
+_PREFIX_CHARS = 4096  # enough to see past leading whitespace to the Records key
+_END = object()
+
+
+def get_backend(name="auto"):
+    """
+    Return (name, loads) for a parser backend: "orjson", "ujson", "json",
+    or "auto" for the fastest one installed. An unavailable backend falls
+    back to auto with a message.
+    """
+    if name in BACKENDS:
+        return name, BACKENDS[name]
+    if name != "auto":
+        print(f"JSON parser '{name}' is not available, using the fastest installed one.")
+    name = next(iter(BACKENDS))
+    return name, BACKENDS[name]
+
+
+# Chosen at import from JSON_PARSER, so spawned worker processes agree
+BACKEND_NAME, loads = get_backend(Config.JSON_PARSER)
+
+
+def set_backend(name):
+    """Switch the parser used by this process; returns the backend name."""
+    global BACKEND_NAME, loads
+    BACKEND_NAME, loads = get_backend(name)
+    return BACKEND_NAME
+
+
+def records_from_bytes(data):
+    """Parse a whole CloudTrail document (bytes or str) and return its records."""
+    parsed = loads(data)
+    if isinstance(parsed, dict) and "Records" in parsed:
+        return parsed["Records"]
+    return []
+
+
+def iter_records_stream(stream, chunk_size=1 << 20):
+    """
+    Yield the records of a CloudTrail document read from a binary stream
+    (e.g. a GzipFile), decoding one record at a time, so only a chunk of
+    text and the current record are held in memory.
+    Documents that do not open with the Records key are parsed whole.
+    Raises ValueError on malformed or truncated JSON.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    raw_decode = json.JSONDecoder().raw_decode
+    buf = ""
+    eof = False
+
+    def _read():
+        nonlocal eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        return decoder.decode(chunk, final=eof)
+
+    while not eof and len(buf) < _PREFIX_CHARS:
+        buf += _read()
+
+    match = _RECORDS_START.match(buf)
+    if match is None:
+        # Unusual layout: fall back to a whole-document parse
+        while not eof:
+            buf += _read()
+        yield from records_from_bytes(buf)
+        return
+
+    pos = match.end()
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Truncated CloudTrail document")
+            buf = _read()
+            pos = 0
+            continue
+
+        if buf[pos] == "]":
+            return
+
+        try:
+            record, end = raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Most likely the record runs past the buffer: read more and retry
+            if eof:
+                raise
+            buf = buf[pos:] + _read()
+            pos = 0
+            continue
+
+        yield record
+        pos = end
+
+
+def iter_records(stream, size_hint=None, stream_min_bytes=None, timings=None):
+    """
+    Yield the records of one CloudTrail document from a binary stream.
+    Documents smaller than `stream_min_bytes` (by `size_hint`, the stored
+    size of the file or object) are read in one go and parsed with the
+    fast backend; larger ones, or ones of unknown size, are decoded
+    incrementally (see iter_records_stream).
+    If a `timings` dict is given, seconds spent are added to its
+    "decompress" (reading the stream) and "parse" keys; for streamed
+    documents the two are interleaved and all counted as "parse".
+    """
+    if stream_min_bytes is None:
+        stream_min_bytes = Config.JSON_STREAM_MIN_BYTES
+
+    if size_hint is not None and size_hint < stream_min_bytes:
+        if timings is None:
+            yield from records_from_bytes(stream.read())
+            return
+
+        start = time.perf_counter()
+        data = stream.read()
+        read_done = time.perf_counter()
+        records = records_from_bytes(data)
+        timings["decompress"] = timings.get("decompress", 0.0) + read_done - start
+        timings["parse"] = timings.get("parse", 0.0) + time.perf_counter() - read_done
+        yield from records
+    elif timings is None:
+        yield from iter_records_stream(stream)
+    else:
+        records = iter_records_stream(stream)
+        while True:
+            start = time.perf_counter()
+            record = next(records, _END)
+            timings["parse"] = timings.get("parse", 0.0) + time.perf_counter() - start
+            if record is _END:
+                return
+            yield record
+
+
+def load_records(stream, size_hint=None, stream_min_bytes=None, timings=None):
+    """List form of iter_records."""
+    return list(iter_records(stream, size_hint, stream_min_bytes, timings))
@@ -0,0 +1,184 @@
+import queue
+import threading
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.db import get_client
+
+# Change stream errors after which the resume token is useless:
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+_NON_RESUMABLE_CODES = {260, 280, 286}
+
+# Fields pushed to dashboards for each new alert (the list view's columns);
+# rawEvent and the playbook are fetched on demand from /api/alerts/<id>
+LIVE_FIELDS = (
+    "_id", "rule", "severity", "user", "sourceIP", "eventName",
+    "awsRegion", "eventTime", "scanId", "ingestedAt",
+)
+
+
+def live_view(alert):
+    """Reduce an alert document to the fields pushed to dashboards."""
+    return {k: alert[k] for k in LIVE_FIELDS if k in alert}
+
+
+class Subscription:
+    """
+    One connected dashboard: a bounded queue of alerts. If the client
+    falls more than `max_pending` alerts behind, further alerts are
+    dropped and `lagged` is set so it can be told to reload instead.
+    """
+
+    def __init__(self, max_pending):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.lagged = False
+
+    def offer(self, alert):
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            self.lagged = True
+
+    def resync(self):
+        """Drop everything pending and clear the lagged flag."""
+        self.lagged = False
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def get(self, timeout):
+        """Next alert, or None if none arrived within `timeout` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AlertBroker:
+    """
+    In-process fan-out of newly stored alerts to SSE subscribers.
+
+    Alerts come from one of two sources:
+    - "change_stream": a single background thread per process watches
+      inserts on the alerts collection, so alerts stored by any process
+      (web worker or offline scanner) reach every dashboard. Needs a
+      replica set or Atlas.
+    - "local": store_alerts publishes what it inserted in this process.
+      Used when change streams are unavailable; dashboards connected to
+      other processes do not see those alerts.
+    With source "auto" the change stream is tried first.
+    """
+
+    def __init__(self, app):
+        self._app = app
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.source = app.config.get("ALERTS_STREAM_SOURCE", "auto")
+        if self.source == "auto":
+            self.source = "change_stream" if self._change_streams_supported() else "local"
+
+    def _alerts(self):
+        db_name = self._app.config.get("MONGO_DB_NAME", "cloudtrail_db")
+        return get_client(self._app)[db_name].alerts
+
+    def _change_streams_supported(self):
+        try:
+            with self._alerts().watch(max_await_time_ms=1):
+                return True
+        except OperationFailure:
+            # e.g. code 40573: standalone servers have no change streams
+            return False
+        except PyMongoError as exc:
+            print(f"Could not open an alerts change stream: {exc}")
+            return False
+
+    def subscribe(self):
+        sub = Subscription(self._app.config.get("ALERTS_STREAM_MAX_PENDING", 1000))
+        with self._lock:
+            self._subscribers.add(sub)
+            if self.source == "change_stream" and self._watcher is None:
+                self._watcher = threading.Thread(
+                    target=self._watch, name="alerts-change-stream", daemon=True,
+                )
+                self._watcher.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, alerts):
+        """Hand new alerts (already reduced with live_view) to every subscriber."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for alert in alerts:
+            for sub in subscribers:
+                sub.offer(alert)
+
+    def resync_all(self):
+        """Tell every subscriber to reload, e.g. after alerts may have been missed."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            sub.lagged = True
+
+    def publish_local(self, alerts):
+        """Called by store_alerts; ignored when a change stream is the source."""
+        if self.source == "local" and self._subscribers:
+            self.publish([live_view(a) for a in alerts])
+
+    def _watch(self):
+        """
+        Background thread: relay inserts from the change stream, resuming
+        after errors. If the stream cannot resume where it stopped (e.g.
+        the oplog has rolled past the token), it restarts from now and
+        subscribers are told to reload, since alerts may have been missed.
+        """
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        project = {"$project": {f"fullDocument.{f}": 1 for f in LIVE_FIELDS}}
+        resume_token = None
+
+        while True:
+            try:
+                with self._alerts().watch(pipeline + [project], resume_after=resume_token) as stream:
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self.publish([change["fullDocument"]])
+            except OperationFailure as exc:
+                non_resumable = exc.code in _NON_RESUMABLE_CODES or exc.has_error_label("NonResumableChangeStreamError")
+                if non_resumable and resume_token is not None:
+                    print(f"Alerts change stream cannot resume, restarting from now: {exc}")
+                    resume_token = None
+                    self.resync_all()
+                    continue
+                print(f"Alerts change stream interrupted, retrying: {exc}")
+                time.sleep(5)
+            except PyMongoError as exc:
+                print(f"Alerts change stream interrupted, retrying: {exc}")
+                time.sleep(5)
+
+
+_broker_lock = threading.Lock()
+
+
+def get_broker(app):
+    """Return this app's AlertBroker, creating it on first use."""
+    with _broker_lock:
+        broker = app.extensions.get("alerts_broker")
+        if broker is None:
+            broker = app.extensions["alerts_broker"] = AlertBroker(app)
+        return broker
+
+
+def publish_new_alerts(app, alerts):
+    """
+    Publish alerts store_alerts inserted (with their _id), if anyone in
+    this process could be listening.
+    """
+    broker = app.extensions.get("alerts_broker")
+    if broker is not None:
+        broker.publish_local(alerts)
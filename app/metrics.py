@@ -0,0 +1,194 @@
+import threading
+import time
+
+from app.config import Config
+
+# Process-wide switch, set from app.config by create_app (configure below):
+# hot paths check it (or a None stats object) instead of looking up app
+# config per event
+ENABLED = Config.METRICS_ENABLED
+
+# Scan stages timed across the pipeline
+STAGE_S3_LIST = "s3_list"
+STAGE_S3_DOWNLOAD = "s3_download"
+STAGE_DECOMPRESS = "decompress"
+STAGE_PARSE = "parse"
+STAGE_MONGO_RAW_EVENTS = "mongo_raw_events"
+STAGE_MONGO_ALERTS = "mongo_alerts"
+STAGE_MONGO_STATS = "mongo_stats"
+
+
+def configure(app):
+    """Take METRICS_ENABLED from the app's config, after any overrides."""
+    global ENABLED
+    ENABLED = bool(app.config.get("METRICS_ENABLED", False))
+
+
+def enabled():
+    """Whether metrics are collected in this process."""
+    return ENABLED
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """
+    Process-wide counters and summaries (count + sum of seconds),
+    rendered in the Prometheus text format. Each worker process has its
+    own registry; scrape every process, or run one.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {labels: value}
+        self._summaries = {}   # name -> {labels: [count, sum]}
+        self._help = {}
+
+    def inc(self, name, value=1, help=None, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name, seconds, count=1, help=None, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            entry = self._summaries.setdefault(name, {}).setdefault(key, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+            if help:
+                self._help.setdefault(name, help)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_label_text(labels)} {value}")
+            for name, series in sorted(self._summaries.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} summary")
+                for labels, (count, total) in sorted(series.items()):
+                    lines.append(f"{name}_count{_label_text(labels)} {count}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {total:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class RuleStats:
+    """
+    Per-rule evaluation counts, hits and time, filled in by
+    iter_suspicious_events. Plain dicts keyed by rule name, so shards
+    scanned in worker processes can send theirs back to be merged.
+    """
+
+    __slots__ = ("evaluations", "hits", "seconds")
+
+    def __init__(self):
+        self.evaluations = {}
+        self.hits = {}
+        self.seconds = {}
+
+    def as_dict(self):
+        return {"evaluations": self.evaluations, "hits": self.hits, "seconds": self.seconds}
+
+    def merge(self, data):
+        """Add another RuleStats' as_dict() into this one."""
+        for field in self.__slots__:
+            mine = getattr(self, field)
+            for rule, value in data[field].items():
+                mine[rule] = mine.get(rule, 0) + value
+
+
+class PipelineMetrics:
+    """
+    Timings for one scan: seconds and call counts per stage (also fed
+    to REGISTRY as they happen) and RuleStats for the analyzer (fed to
+    REGISTRY by publish() when the scan ends).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()   # S3 fetch threads report concurrently
+        self.stages = {}                # stage -> [calls, seconds]
+        self.rules = RuleStats()
+
+    def observe(self, stage, seconds, count=1):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+        REGISTRY.observe(
+            "cloudtrail_stage_seconds", seconds, count,
+            help="Time spent per scan pipeline stage", stage=stage,
+        )
+
+    def observe_all(self, timings):
+        """Record a {stage: seconds} dict, e.g. returned by a worker."""
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def publish(self):
+        """Add this scan's per-rule stats to the process-wide registry."""
+        rules = self.rules
+        for rule, count in rules.evaluations.items():
+            REGISTRY.inc("cloudtrail_rule_evaluations_total", count,
+                         help="Events evaluated per detection rule", rule=rule)
+            REGISTRY.inc("cloudtrail_rule_seconds_total", rules.seconds.get(rule, 0.0),
+                         help="Time spent evaluating each detection rule", rule=rule)
+        for rule, count in rules.hits.items():
+            REGISTRY.inc("cloudtrail_rule_hits_total", count,
+                         help="Alerts raised per detection rule", rule=rule)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {
+                stage: {"calls": calls, "seconds": round(seconds, 4)}
+                for stage, (calls, seconds) in self.stages.items()
+            }
+        stats = self.rules
+        rules = {
+            rule: {
+                "evaluations": stats.evaluations.get(rule, 0),
+                "hits": stats.hits.get(rule, 0),
+                "seconds": round(stats.seconds.get(rule, 0.0), 4),
+            }
+            for rule in {*stats.evaluations, *stats.hits}
+        }
+        return {"stages": stages, "rules": rules}
+
+
+def timed_iter(iterable, stage, pipeline_metrics):
+    """
+    Yield from `iterable`, recording the time spent waiting on each item
+    (e.g. S3 list pages) under `stage`. Pass-through when not timing.
+    """
+    if pipeline_metrics is None:
+        yield from iterable
+        return
+
+    iterator = iter(iterable)
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        pipeline_metrics.observe(stage, clock() - start)
+        yield item
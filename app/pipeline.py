@@ -0,0 +1,201 @@
+import time
+
+from flask import current_app
+
+from app.analyzer import iter_suspicious_events
+from app.aws_ingestion import iter_cloudtrail_from_s3, load_checkpoints, save_checkpoints
+from app.columnar import iter_suspicious_events_columnar
+from app.metrics import REGISTRY, PipelineMetrics, enabled as metrics_enabled
+from app.records import iter_compact_alerts
+from app.replay import load_replay_guard, save_replay_guard
+from app.scanner import iter_cloudtrail_logs, scan_logs_parallel
+from app.utils import store_alerts
+from app.windows import WindowedDetector, window_settings
+
+
+class ScanProgress:
+    """
+    Counters for one scan run. Readers, the analyzer stage and storage
+    call the add_* methods; `on_update` (if given) is invoked at most once
+    per `interval` seconds so callers can publish progress cheaply.
+    With METRICS_ENABLED, `metrics` (app.metrics.PipelineMetrics)
+    collects stage timings and per-rule stats; otherwise it is None and
+    nothing is timed.
+    """
+
+    def __init__(self, on_update=None, interval=1.0):
+        self.files_read = 0
+        self.events_processed = 0
+        self.alerts_stored = 0
+        self.duplicates_skipped = 0
+        self.events_replayed = 0
+        self.metrics = PipelineMetrics() if metrics_enabled() else None
+        self.started_at = time.time()
+        self._on_update = on_update
+        self._interval = interval
+        self._last_update = 0.0
+
+    def add_files(self, count):
+        self.files_read += count
+        self._maybe_update()
+
+    def add_events(self, count):
+        self.events_processed += count
+        self._maybe_update()
+
+    def add_alerts(self, count, duplicates=0):
+        self.alerts_stored += count
+        self.duplicates_skipped += duplicates
+        self._maybe_update()
+
+    def add_replayed(self, count):
+        self.events_replayed += count
+        self._maybe_update()
+
+    def _maybe_update(self):
+        if self._on_update is None:
+            return
+        now = time.time()
+        if now - self._last_update >= self._interval:
+            self._last_update = now
+            self._on_update(self)
+
+    def snapshot(self):
+        """Return the counters plus derived throughput (and metrics) as a dict."""
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        data = {
+            "filesRead": self.files_read,
+            "eventsProcessed": self.events_processed,
+            "alertsStored": self.alerts_stored,
+            "duplicatesSkipped": self.duplicates_skipped,
+            "eventsReplayed": self.events_replayed,
+            "elapsedSeconds": round(elapsed, 3),
+            "eventsPerSecond": round(self.events_processed / elapsed, 1),
+        }
+        if self.metrics is not None:
+            data["metrics"] = self.metrics.snapshot()
+        return data
+
+    def publish_metrics(self, kind):
+        """Add this scan's totals and rule stats to the /metrics registry."""
+        if self.metrics is None:
+            return
+        self.metrics.publish()
+        REGISTRY.inc("cloudtrail_scans_total", help="Scans run", kind=kind)
+        REGISTRY.inc("cloudtrail_files_read_total", self.files_read,
+                     help="Log files read", kind=kind)
+        REGISTRY.inc("cloudtrail_events_processed_total", self.events_processed,
+                     help="CloudTrail events processed", kind=kind)
+        REGISTRY.inc("cloudtrail_alerts_stored_total", self.alerts_stored,
+                     help="Alerts inserted", kind=kind)
+        REGISTRY.inc("cloudtrail_alerts_duplicate_total", self.duplicates_skipped,
+                     help="Alerts skipped as already stored", kind=kind)
+        REGISTRY.inc("cloudtrail_events_replayed_total", self.events_replayed,
+                     help="Events dropped by the replay guard as already analyzed", kind=kind)
+
+
+def _tag_scan(alerts, scan_id):
+    """Lazily tag each alert with the scanId of the current run."""
+    for alert in alerts:
+        alert["scanId"] = scan_id
+        yield alert
+
+
+def _detect(events, progress=None, guard=None):
+    """
+    Run the per-event rules plus the window rules over a stream of events,
+    in columnar batches when ANALYZER_BATCH_SIZE > 0 (for large backfills).
+    Events the replay guard (app.replay.ReplayGuard) has seen are dropped first.
+    Per-rule stats go to progress.metrics when enabled (per-event mode only).
+    Per-event alerts come out as CompactAlerts, expanded by store_alerts.
+    """
+    if guard is not None:
+        events = guard.filter(events, progress)
+
+    detector = WindowedDetector.from_settings(window_settings(current_app.config))
+    batch_size = current_app.config.get("ANALYZER_BATCH_SIZE", 0)
+    if batch_size > 0:
+        return iter_suspicious_events_columnar(events, batch_size, window_detector=detector)
+
+    if progress is not None and progress.metrics is not None:
+        return iter_suspicious_events(events, window_detector=detector, rule_stats=progress.metrics.rules)
+    return iter_compact_alerts(events, window_detector=detector)
+
+
+def run_local_scan(scan_id, progress=None, log_folder=None, time_range=None, store=None):
+    """
+    Read -> detect -> store for the local log folder.
+    Uses the process pool when LOCAL_SCAN_WORKERS > 1; the replay guard
+    (REPLAY_GUARD_ENABLED) only applies to the serial stream, since pool
+    workers analyze their shards independently.
+    `time_range` (app.timerange.TimeRange) limits the scan to its events;
+    `store` replaces store_alerts (e.g. a write_alerts_ndjson partial).
+    Returns store_alerts' {"inserted", "duplicates"} counts.
+    """
+    progress = progress or ScanProgress()
+    store = store or store_alerts
+    log_folder = log_folder or current_app.config.get("LOCAL_LOG_FOLDER", "sample_logs")
+    workers = current_app.config.get("LOCAL_SCAN_WORKERS", 1)
+
+    guard = None
+    if workers > 1:
+        # Parse + detect in worker processes, shard by shard
+        alerts = scan_logs_parallel(
+            log_folder,
+            workers=workers,
+            shard_size=current_app.config.get("LOCAL_SCAN_SHARD_SIZE", 64),
+            progress=progress,
+            window_settings=window_settings(current_app.config),
+            time_range=time_range,
+        )
+    else:
+        # Stream: read file by file -> detect lazily
+        guard = load_replay_guard(current_app.config)
+        events = iter_cloudtrail_logs(log_folder, progress=progress, time_range=time_range)
+        alerts = _detect(events, progress, guard)
+
+    try:
+        result = store(_tag_scan(alerts, scan_id), progress=progress)
+    finally:
+        progress.publish_metrics("local")
+
+    # Like the S3 checkpoint: only remember events once their alerts are stored
+    save_replay_guard(guard, current_app.config)
+
+    return result
+
+
+def run_s3_scan(scan_id, progress=None, full=False, time_range=None, store=None, checkpoints=True):
+    """
+    Read -> detect -> store for the configured S3 bucket/prefix.
+    Only objects added since the last scan are read unless `full` is set
+    (which also starts from an empty replay guard); the checkpoint and
+    the replay guard are saved once the alerts are stored.
+    With `checkpoints` off, or a `time_range` (app.timerange.TimeRange,
+    which skips objects, so it must not move the checkpoint), every
+    object under the prefix is read and the checkpoint is left alone.
+    `store` replaces store_alerts (e.g. a write_alerts_ndjson partial).
+    Returns store_alerts' {"inserted", "duplicates"} counts.
+    """
+    progress = progress or ScanProgress()
+    store = store or store_alerts
+    bucket = current_app.config.get("CLOUDTRAIL_S3_BUCKET")
+    watermarks = None
+    if checkpoints and time_range is None:
+        watermarks = {} if full else load_checkpoints(bucket)
+    guard = load_replay_guard(current_app.config, fresh=full)
+
+    # Stream: read object by object -> detect lazily -> store in batches
+    events = iter_cloudtrail_from_s3(watermarks=watermarks, progress=progress, time_range=time_range)
+    alerts = _detect(events, progress, guard)
+    try:
+        result = store(_tag_scan(alerts, scan_id), progress=progress)
+    finally:
+        progress.publish_metrics("s3")
+
+    # Only advance the checkpoint once the alerts are safely stored
+    if watermarks is not None:
+        save_checkpoints(bucket, watermarks)
+    save_replay_guard(guard, current_app.config)
+
+    return result
@@ -1,3 +1,5 @@
+from app.jsonencode import dumps
+
 PLAYBOOKS = {
     "Failed Console Login": {
         "title": "Failed Console Login",
@@ -75,8 +77,34 @@ PLAYBOOKS = {
             "Restrict KMS admin permissions and require approvals.",
             "Investigate for broader compromise indicators."
         ]
+    },
+    "Console Login Brute Force": {
+        "title": "Console Login Brute Force",
+        "risk": "Password guessing or credential stuffing against console users.",
+        "actions": [
+            "Block or rate-limit the source IP (WAF / network ACL / security tooling).",
+            "Identify every user targeted from the IP and enforce MFA.",
+            "Check for a successful ConsoleLogin from the same IP after the failures.",
+            "Reset passwords for targeted users if any login succeeded.",
+            "Alert on repeated failures across accounts for the same IP."
+        ]
+    },
+    "IAM Change Burst": {
+        "title": "IAM Change Burst",
+        "risk": "Automated privilege escalation or persistence via many IAM changes.",
+        "actions": [
+            "Confirm whether the user was running an approved deployment/automation.",
+            "List the IAM changes in the window (users, keys, policies created/attached).",
+            "Disable newly created access keys and users if unauthorized.",
+            "Rotate the acting user's credentials and review its source IPs.",
+            "Require change approval for IAM modifications."
+        ]
     }
 }
 
+# Encoded once at startup and spliced into /api/alerts responses as bytes
+PLAYBOOKS_JSON = {name: dumps(playbook) for name, playbook in PLAYBOOKS.items()}
+
+
 def get_playbook(rule_name: str):
     return PLAYBOOKS.get(rule_name)
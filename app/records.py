@@ -0,0 +1,106 @@
+import sys
+
+from app.analyzer import candidate_rules
+
+
+def _intern(value):
+    """sys.intern for strings; anything else (e.g. a null field) as is."""
+    return sys.intern(value) if type(value) is str else value
+
+
+class EventRecord:
+    """
+    The fields an alert reports, extracted from a raw CloudTrail event in
+    one pass. eventSource, eventName and awsRegion come from small
+    vocabularies and are interned, so records share those strings.
+    `raw` keeps the event for the alert's rawEvent.
+    """
+
+    __slots__ = (
+        "source", "name", "region", "user", "user_type",
+        "source_ip", "time", "event_id", "raw",
+    )
+
+    def __init__(self, event):
+        get = event.get
+        user_identity = get("userIdentity") or {}
+        self.source = _intern(get("eventSource", ""))
+        self.name = _intern(get("eventName", ""))
+        self.region = _intern(get("awsRegion", "Unknown"))
+        self.user = user_identity.get("userName", "Unknown")
+        self.user_type = user_identity.get("type", "Unknown")
+        self.source_ip = get("sourceIPAddress", "Unknown")
+        self.time = get("eventTime")
+        self.event_id = get("eventID", None)
+        self.raw = event
+
+
+class CompactAlert(EventRecord):
+    """
+    An alert kept as the matched rule plus its EventRecord fields until
+    it is stored: store_alerts expands it with to_dict(). One object per
+    alert (rather than alert + record) keeps the garbage collector's
+    work per alert down. Fields set on it (e.g. scanId) are kept in
+    `extra` and added to the document.
+    """
+
+    __slots__ = ("rule", "extra")
+
+    def __init__(self, event, rule):
+        EventRecord.__init__(self, event)
+        self.rule = rule
+        self.extra = None
+
+    def __setitem__(self, key, value):
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def to_dict(self):
+        """The alert dictionary Rule.build_alert would have produced."""
+        rule = self.rule
+        alert = {
+            "user": self.user,
+            "userType": self.user_type,
+            "sourceIP": self.source_ip,
+            "eventName": self.name,
+            "eventSource": self.source,
+            "eventTime": self.time,
+            "awsRegion": self.region,
+            "eventId": self.event_id,
+            "rawEvent": self.raw,
+            "rule": rule.name,
+            "description": rule.description.format(event_name=self.name),
+            "category": rule.category,
+            "severity": rule.severity,
+            "score": rule.score,
+        }
+        if self.extra:
+            alert.update(self.extra)
+        return alert
+
+
+def expand_alert(alert):
+    """Alert dictionary for a CompactAlert; dictionaries are returned as they are."""
+    return alert if isinstance(alert, dict) else alert.to_dict()
+
+
+def iter_compact_alerts(events, window_detector=None):
+    """
+    iter_suspicious_events yielding CompactAlerts: the same alerts in the
+    same order (window rule alerts stay dictionaries). Fields are only
+    extracted for events a rule matched; the others are only looked at
+    by the dispatch index and the rules.
+    """
+    for event in events:
+        for rule in candidate_rules(event.get("eventSource", ""), event.get("eventName", "")):
+            if rule.match(event):
+                yield CompactAlert(event, rule)
+
+        if window_detector is not None:
+            yield from window_detector.observe(event)
+
+
+def detect_compact(events):
+    """List-returning counterpart of iter_compact_alerts."""
+    return list(iter_compact_alerts(events))
@@ -0,0 +1,455 @@
+import hashlib
+import json
+import math
+import os
+import sys
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # optional: not on Windows, where saves are not locked
+    fcntl = None
+
+_MAGIC = b"CTREPLAY1\n"
+
+# Sectorized Bloom filter layout: an ID's bits all fall in one block of 4
+# 64-bit words (4 word reads instead of one memory probe per bit). In
+# each word it sets the bits of one mask, picked by 12 bits of its hash
+# from that word's table of 4096 masks
+_WORDS = 4
+_WORD_BITS = 64
+_PATTERNS = 4096
+
+# num_hashes -> mask tables (one per word)
+_PATTERN_TABLES = {}
+
+
+def _hash(event_id):
+    """128-bit hash of an eventID: low bits pick the block, high bits the masks."""
+    return int.from_bytes(hashlib.blake2b(event_id.encode("utf-8"), digest_size=16).digest(), "little")
+
+
+def _word_hashes(num_hashes):
+    """Bits set per word, so they add up to num_hashes."""
+    return [num_hashes // _WORDS + (i < num_hashes % _WORDS) for i in range(_WORDS)]
+
+
+def _pattern_tables(num_hashes):
+    """
+    Masks for each word, derived from blake2b rather than `random` so
+    filters saved to disk read back the same in any Python version.
+    """
+    tables = _PATTERN_TABLES.get(num_hashes)
+    if tables is None:
+        tables = []
+        for word, bits_set in enumerate(_word_hashes(num_hashes)):
+            table = []
+            for pattern in range(_PATTERNS):
+                positions = set()
+                draw = 0
+                while len(positions) < bits_set:
+                    seed = b"%d:%d:%d:%d" % (num_hashes, word, pattern, draw)
+                    positions.add(hashlib.blake2b(seed, digest_size=1).digest()[0] % _WORD_BITS)
+                    draw += 1
+                table.append(sum(1 << p for p in positions))
+            tables.append(table)
+        _PATTERN_TABLES[num_hashes] = tables
+    return tables
+
+
+def _blocked_error_rate(capacity, num_blocks, num_hashes):
+    """
+    Expected false-positive rate of a full filter: blocks hold a Poisson
+    number of IDs, so some fill up more than average and the classic
+    Bloom filter estimate would be too optimistic.
+    """
+    load = capacity / num_blocks
+    word_hashes = _word_hashes(num_hashes)
+    rate = 0.0
+    p_ids = math.exp(-load)
+    for ids in range(int(load * 4) + 50):
+        if ids:
+            p_ids *= load / ids
+        hit = 1.0
+        for bits_set in word_hashes:
+            hit *= (1 - (1 - 1 / _WORD_BITS) ** (ids * bits_set)) ** bits_set
+        rate += p_ids * hit
+    return rate
+
+
+class BloomFilter:
+    """
+    Fixed-size blocked Bloom filter for `capacity` IDs (hashed with _hash)
+    at `error_rate`. Sized by _blocked_error_rate, which takes 20-50%
+    more memory than a classic Bloom filter for the same rate in return
+    for a few word operations per lookup.
+    """
+
+    __slots__ = (
+        "capacity", "error_rate", "num_hashes", "num_blocks", "count", "loaded_count", "seq", "words", "_tables",
+    )
+
+    def __init__(self, capacity, error_rate, num_hashes=None, num_blocks=None, count=0, words=None, seq=0):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_hashes = num_hashes or max(_WORDS, round(-math.log2(error_rate)))
+        if num_blocks is None:
+            classic_bits = -capacity * math.log(error_rate) / math.log(2) ** 2
+            num_blocks = max(1, math.ceil(classic_bits / (_WORDS * _WORD_BITS)))
+            while _blocked_error_rate(capacity, num_blocks, self.num_hashes) > error_rate:
+                num_blocks = math.ceil(num_blocks * 1.05)
+        self.num_blocks = num_blocks
+        self.count = count
+        self.loaded_count = count
+        self.seq = seq  # position in its ScalableBloomFilter chain, counting dropped filters
+        self.words = words if words is not None else array("Q", bytes(num_blocks * _WORDS * 8))
+        self._tables = _pattern_tables(self.num_hashes)
+
+    @property
+    def nbytes(self):
+        return self.num_blocks * _WORDS * 8
+
+    @property
+    def key(self):
+        """Parameters two filters must share for their words to be ORed."""
+        return (self.capacity, self.error_rate, self.num_hashes, self.num_blocks)
+
+    def union(self, other):
+        """
+        Add the IDs of `other` (same key and seq) by ORing its words in. Its count
+        already includes whatever both had when this one was loaded, so
+        only what was added here since is counted on top.
+        """
+        merged = int.from_bytes(self.words, "little") | int.from_bytes(other.words, "little")
+        self.words = array("Q", merged.to_bytes(self.nbytes, "little"))
+        self.count = max(self.count, other.count, other.count + self.count - self.loaded_count)
+
+    def __contains__(self, h):
+        t0, t1, t2, t3 = self._tables
+        words = self.words
+        i = (h % self.num_blocks) * _WORDS
+        mask = t0[(h >> 64) & 4095]
+        if words[i] & mask != mask:
+            return False
+        mask = t1[(h >> 76) & 4095]
+        if words[i + 1] & mask != mask:
+            return False
+        mask = t2[(h >> 88) & 4095]
+        if words[i + 2] & mask != mask:
+            return False
+        mask = t3[(h >> 100) & 4095]
+        return words[i + 3] & mask == mask
+
+    def add(self, h):
+        """Set an ID's bits; returns True if they were all set already."""
+        t0, t1, t2, t3 = self._tables
+        words = self.words
+        i = (h % self.num_blocks) * _WORDS
+        m0 = t0[(h >> 64) & 4095]
+        m1 = t1[(h >> 76) & 4095]
+        m2 = t2[(h >> 88) & 4095]
+        m3 = t3[(h >> 100) & 4095]
+        w0, w1, w2, w3 = words[i], words[i + 1], words[i + 2], words[i + 3]
+        if w0 & m0 == m0 and w1 & m1 == m1 and w2 & m2 == m2 and w3 & m3 == m3:
+            return True
+        words[i] = w0 | m0
+        words[i + 1] = w1 | m1
+        words[i + 2] = w2 | m2
+        words[i + 3] = w3 | m3
+        self.count += 1
+        return False
+
+    def to_bytes(self):
+        """The words as little-endian bytes (the file format)."""
+        if sys.byteorder == "little":
+            return self.words.tobytes()
+        words = array("Q", self.words)
+        words.byteswap()
+        return words.tobytes()
+
+    @staticmethod
+    def words_from_bytes(data):
+        words = array("Q")
+        words.frombytes(data)
+        if sys.byteorder != "little":
+            words.byteswap()
+        return words
+
+
+class ScalableBloomFilter:
+    """
+    A chain of Bloom filters (Almeida et al.): when the newest one is
+    full, a new one with GROWTH times the capacity and TIGHTENING times
+    the error rate is added, so the overall false-positive rate stays
+    below `error_rate` as IDs are added.
+    Memory is bounded by `max_bytes`: filters stop growing once one
+    would take more than a quarter of it, and the oldest filters (the IDs
+    seen longest ago) are dropped when the chain goes over it, so only
+    the last few filters' worth of IDs are kept. The filters added after
+    growth stops share the error budget the growing ones left (the last
+    growing filter's rate), split by how many of them fit in max_bytes,
+    so the chain stays below `error_rate` however long it runs.
+    Each filter has a sequence number (its seq) so that copies of the
+    chain saved by concurrent scans can be merged filter by filter.
+    """
+
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, initial_capacity, error_rate, max_bytes, filters=None):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.filters = filters or [
+            BloomFilter(initial_capacity, error_rate * (1 - self.TIGHTENING))
+        ]
+
+    @property
+    def nbytes(self):
+        return sum(f.nbytes for f in self.filters)
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def __contains__(self, h):
+        return any(h in f for f in self.filters)
+
+    def add(self, h):
+        """Add an ID hash; returns True if it was (probably) already present."""
+        filters = self.filters
+        if len(filters) > 1:
+            for f in filters[:-1]:
+                if h in f:
+                    return True
+
+        newest = filters[-1]
+        if newest.add(h):
+            return True
+        if newest.count >= newest.capacity:
+            self._grow(newest)
+        return False
+
+    def _grow(self, newest):
+        capacity = newest.capacity * self.GROWTH
+        error_rate = newest.error_rate * self.TIGHTENING
+        if BloomFilter(capacity, error_rate, words=array("Q")).nbytes > self.max_bytes // 4:
+            capacity = newest.capacity
+            if len(self.filters) > 1 and self.filters[-2].capacity == capacity:
+                error_rate = newest.error_rate  # growth had stopped already
+            else:
+                error_rate = self._saturated_error_rate(newest)
+        self.filters.append(BloomFilter(capacity, error_rate, seq=newest.seq + 1))
+        self._trim()
+
+    def _saturated_error_rate(self, newest):
+        """
+        Error rate of the filters added once growth stops: the newest
+        filter's rate (what the geometric series of tightening rates has
+        left of error_rate) split between as many filters of its capacity
+        as max_bytes holds.
+        """
+        filters = max(1, self.max_bytes // newest.nbytes)
+        while True:
+            size = BloomFilter(newest.capacity, newest.error_rate / filters, words=array("Q")).nbytes
+            fitting = max(1, self.max_bytes // size)
+            if fitting >= filters:
+                return newest.error_rate / filters
+            filters = fitting
+
+    def _trim(self):
+        while len(self.filters) > 1 and self.nbytes > self.max_bytes:
+            self.filters.pop(0)
+
+    def merge(self, other):
+        """
+        Add the IDs of `other`, another copy of this chain (as a concurrent
+        scan saved it). Filters are paired by seq and ORed; those only one
+        copy has are kept if they are newer than the other copy's oldest,
+        and dropped if the other copy already retired them.
+        """
+        oldest = max(self.filters[0].seq, other.filters[0].seq)
+        by_seq = {b.seq: b for b in self.filters}
+        for theirs in other.filters:
+            mine = by_seq.get(theirs.seq)
+            if mine is None:
+                by_seq[theirs.seq] = theirs
+            elif mine.key == theirs.key:
+                mine.union(theirs)
+        self.filters = [by_seq[seq] for seq in sorted(by_seq) if seq >= oldest]
+
+        newest = self.filters[-1]
+        if newest.count >= newest.capacity:
+            self._grow(newest)
+        self._trim()
+
+    def dump(self, f):
+        header = {
+            "initial_capacity": self.initial_capacity,
+            "error_rate": self.error_rate,
+            "filters": [
+                {
+                    "capacity": b.capacity, "error_rate": b.error_rate, "count": b.count,
+                    "num_hashes": b.num_hashes, "num_blocks": b.num_blocks, "seq": b.seq,
+                }
+                for b in self.filters
+            ],
+        }
+        f.write(_MAGIC)
+        f.write(json.dumps(header).encode("utf-8") + b"\n")
+        for b in self.filters:
+            f.write(b.to_bytes())
+
+    @classmethod
+    def load(cls, f, max_bytes):
+        """Read a filter written by dump(); raises ValueError if the file is not one."""
+        if f.readline() != _MAGIC:
+            raise ValueError("not a replay guard file")
+        header = json.loads(f.readline())
+        filters = []
+        for i, spec in enumerate(header["filters"]):
+            size = spec["num_blocks"] * _WORDS * 8
+            data = f.read(size)
+            if len(data) != size:
+                raise ValueError("truncated replay guard file")
+            filters.append(BloomFilter(
+                spec["capacity"], spec["error_rate"], spec["num_hashes"], spec["num_blocks"],
+                spec["count"], BloomFilter.words_from_bytes(data), spec.get("seq", i),
+            ))
+        return cls(header["initial_capacity"], header["error_rate"], max_bytes, filters)
+
+
+class ReplayGuard:
+    """
+    Seen-eventID filter placed in front of the analyzer, so events
+    CloudTrail delivered twice (or that an overlapping scan already
+    analyzed) are dropped before rule evaluation.
+    Recent IDs are kept exactly in an LRU of `lru_size`; older ones in a
+    ScalableBloomFilter, which may (at its false-positive rate) report an
+    unseen event as seen, which then is not analyzed.
+    Events without an eventID always pass.
+    """
+
+    def __init__(self, bloom, lru_size=100000):
+        self.bloom = bloom
+        self.lru_size = lru_size
+        self._recent = OrderedDict()
+        self.duplicates = 0
+
+    def seen(self, event_id):
+        """Record an eventID; returns True if it was seen before."""
+        recent = self._recent
+        if event_id in recent:
+            recent.move_to_end(event_id)
+            return True
+
+        recent[event_id] = None
+        if len(recent) > self.lru_size:
+            recent.popitem(last=False)
+        return self.bloom.add(_hash(event_id))
+
+    def filter(self, events, progress=None):
+        """
+        Yield the events not seen before; duplicates are counted on
+        `progress`. Same logic as seen(), inlined for the event loop.
+        """
+        recent = self._recent
+        lru_size = self.lru_size
+        bloom_add = self.bloom.add
+
+        for event in events:
+            event_id = event.get("eventID")
+            if event_id:
+                if event_id in recent:
+                    recent.move_to_end(event_id)
+                    duplicate = True
+                else:
+                    recent[event_id] = None
+                    if len(recent) > lru_size:
+                        recent.popitem(last=False)
+                    duplicate = bloom_add(_hash(event_id))
+
+                if duplicate:
+                    self.duplicates += 1
+                    if progress is not None:
+                        progress.add_replayed(1)
+                    continue
+            yield event
+
+
+@contextmanager
+def _locked(path):
+    """
+    Hold an exclusive lock on `path`.lock while reading or writing the
+    file at `path`, so concurrent scans take turns (a no-op without fcntl).
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _read_bloom(path, max_bytes):
+    """The ScalableBloomFilter saved at `path`, or None if there is no usable file."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return ScalableBloomFilter.load(f, max_bytes)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Ignoring unreadable replay guard file {path}: {exc}")
+        return None
+
+
+def load_replay_guard(config, fresh=False):
+    """
+    Return a ReplayGuard with the IDs persisted at REPLAY_GUARD_PATH (or
+    an empty one if `fresh`, or there is no usable file), or None when
+    REPLAY_GUARD_ENABLED is off.
+    """
+    if not config.get("REPLAY_GUARD_ENABLED", False):
+        return None
+
+    max_bytes = config.get("REPLAY_GUARD_MAX_BYTES", 64 * 1024 * 1024)
+    path = config.get("REPLAY_GUARD_PATH", "replay_guard.bin")
+    bloom = None
+    if not fresh and os.path.exists(path):
+        with _locked(path):
+            bloom = _read_bloom(path, max_bytes)
+
+    if bloom is None:
+        bloom = ScalableBloomFilter(
+            config.get("REPLAY_GUARD_CAPACITY", 1000000),
+            config.get("REPLAY_GUARD_FP_RATE", 0.0001),
+            max_bytes,
+        )
+    return ReplayGuard(bloom, config.get("REPLAY_GUARD_LRU_SIZE", 100000))
+
+
+def save_replay_guard(guard, config):
+    """
+    Persist the guard's Bloom filter so the next scan skips these IDs.
+    Under the file lock, the IDs saved since this guard was loaded (by a
+    concurrent scan) are merged in first, so neither scan's are lost.
+    Written to a temporary file and renamed, so a crash never leaves a
+    half-written file.
+    """
+    if guard is None:
+        return
+
+    path = config.get("REPLAY_GUARD_PATH", "replay_guard.bin")
+    tmp_path = f"{path}.{os.getpid()}.{id(guard)}.tmp"
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _locked(path):
+        saved = _read_bloom(path, guard.bloom.max_bytes)
+        if saved is not None:
+            guard.bloom.merge(saved)
+        with open(tmp_path, "wb") as f:
+            guard.bloom.dump(f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,366 @@
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from bson import json_util
+from flask import current_app
+from pymongo import UpdateOne
+
+from app.cache import bump_alerts_generation
+from app.db import ALERT_INDEXES, NEVER_EXPIRES, get_db
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: only needed for ALERTS_ARCHIVE_TARGET=parquet
+    pyarrow = None
+
+ARCHIVE_PREFIX = "alerts_archive_"
+
+# Oldest first, walking the (ingestedAt, _id) index backwards
+_ARCHIVE_SORT = [("ingestedAt", 1), ("_id", 1)]
+
+
+def month_start(moment):
+    """Truncate a datetime to the start of its month."""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    """Start of the month after the one starting at `start`."""
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def archive_collection_name(month):
+    return f"{ARCHIVE_PREFIX}{month:%Y_%m}"
+
+
+def alert_partitions(db, since=None):
+    """
+    Collections holding alerts ingested at or after `since` (None = any
+    time): the hot alerts collection, then the monthly archive
+    collections overlapping the window, newest first. Alerts archived
+    to files are not queryable.
+    """
+    query = {"collection": {"$exists": True}}
+    if since is not None:
+        query["month"] = {"$gte": month_start(since)}
+    archives = db.alert_archives.find(query, {"collection": 1}).sort("month", -1)
+    return [db.alerts] + [db[doc["collection"]] for doc in archives]
+
+
+def archive_partition_for(db, moment):
+    """The archive collection for the month of `moment`, or None if not archived there."""
+    doc = db.alert_archives.find_one(
+        {"_id": f"{moment:%Y-%m}", "collection": {"$exists": True}}, {"collection": 1}
+    )
+    return db[doc["collection"]] if doc else None
+
+
+def archivable_months(db, now=None, after_days=None):
+    """
+    Months whose alerts are due for archiving: every month, from the
+    oldest alert in the hot collection, that ended more than
+    ALERTS_ARCHIVE_AFTER_DAYS ago.
+    """
+    if after_days is None:
+        after_days = current_app.config.get("ALERTS_ARCHIVE_AFTER_DAYS", 90)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=after_days)
+
+    oldest = db.alerts.find_one(
+        {"ingestedAt": {"$type": "date"}}, {"ingestedAt": 1}, sort=_ARCHIVE_SORT
+    )
+    if oldest is None:
+        return []
+
+    months = []
+    month = month_start(oldest["ingestedAt"])
+    while next_month(month) <= cutoff:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def _month_query(month):
+    return {"ingestedAt": {"$gte": month, "$lt": next_month(month)}}
+
+
+def _raw_event_ids(alerts):
+    return list({a["rawEventId"] for a in alerts if a.get("rawEventId")})
+
+
+def _prune_raw_events(db, raw_event_ids):
+    """
+    Delete the given raw events that no stored alert refers to any more.
+    An alert's rawEventId is its eventKey, so references are looked up
+    on the (eventKey, rule) index of each partition.
+    """
+    orphans = set(raw_event_ids)
+    for partition in alert_partitions(db):
+        if not orphans:
+            return
+        referenced = partition.find({"eventKey": {"$in": list(orphans)}}, {"eventKey": 1})
+        orphans -= {a["eventKey"] for a in referenced}
+    if orphans:
+        db.raw_events.delete_many({"_id": {"$in": list(orphans)}})
+
+
+def _month_hours(month):
+    return {"hour": {"$gte": month, "$lt": next_month(month)}}
+
+
+def _pin_raw_events(db, alerts):
+    """Keep the raw events of alerts archived to a collection past the alerts TTL."""
+    ids = _raw_event_ids(alerts)
+    if ids:
+        db.raw_events.update_many({"_id": {"$in": ids}}, {"$set": {"lastReferenced": NEVER_EXPIRES}})
+
+
+def release_dropped_archives(db, batch_size=1000):
+    """
+    Forget archive collections that were dropped by hand: take them out
+    of the catalog, and let their months' counters and the raw events
+    no other archive refers to expire as usual (deleting those no stored
+    alert refers to at all).
+    """
+    from app.utils import _batched
+
+    existing = set(db.list_collection_names())
+    dropped = [
+        doc for doc in db.alert_archives.find({"collection": {"$exists": True}})
+        if doc["collection"] not in existing
+    ]
+    if not dropped:
+        return
+    for doc in dropped:
+        print(f"Archive collection {doc['collection']} is gone, releasing its raw events and counters.")
+        db.alert_archives.update_one({"_id": doc["_id"]}, {"$unset": {"collection": ""}})
+        pinned = db.alert_stats.find({**_month_hours(doc["month"]), "lastIngestedAt": NEVER_EXPIRES}, {"hour": 1})
+        for batch in _batched(pinned, batch_size):
+            db.alert_stats.bulk_write([
+                UpdateOne({"_id": d["_id"]}, {"$set": {"lastIngestedAt": d["hour"] + timedelta(hours=1)}})
+                for d in batch
+            ], ordered=False)
+
+    archives = alert_partitions(db)[1:]
+    pinned = db.raw_events.find({"lastReferenced": NEVER_EXPIRES}, {"_id": 1})
+    for batch in _batched(pinned, batch_size):
+        released = {d["_id"] for d in batch}
+        for archive in archives:
+            released -= {a["eventKey"] for a in archive.find({"eventKey": {"$in": list(released)}}, {"eventKey": 1})}
+        if released:
+            db.raw_events.update_many({"_id": {"$in": list(released)}}, {"$set": {"lastReferenced": datetime.utcnow()}})
+            _prune_raw_events(db, released)
+
+
+def backfill_expiry_fields(db, batch_size=1000):
+    """
+    Run when the raw_events and alert_stats TTL indexes are set up: give
+    documents stored before the fields they expire on existed a value.
+    Counters expire with the last alert their hour can hold; raw events
+    ALERTS_TTL_DAYS from now, when every alert that may refer to them
+    has expired too. Neither expires for months archived to collections.
+    """
+    from app.utils import _batched
+
+    release_dropped_archives(db, batch_size)
+    for doc in db.alert_archives.find({"collection": {"$exists": True}}):
+        db.alert_stats.update_many(_month_hours(doc["month"]), {"$set": {"lastIngestedAt": NEVER_EXPIRES}})
+        for batch in _batched(db[doc["collection"]].find({}, {"rawEventId": 1}), batch_size):
+            _pin_raw_events(db, batch)
+
+    unset = db.alert_stats.find({"lastIngestedAt": {"$exists": False}}, {"hour": 1})
+    for batch in _batched(unset, batch_size):
+        db.alert_stats.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"lastIngestedAt": doc["hour"] + timedelta(hours=1)}})
+            for doc in batch
+        ], ordered=False)
+    db.raw_events.update_many(
+        {"lastReferenced": {"$exists": False}}, {"$set": {"lastReferenced": datetime.utcnow()}}
+    )
+
+
+def _archive_to_collection(db, month, batch_size):
+    """
+    Move one month of alerts into its archive collection, batch by batch:
+    each batch is upserted by _id and then deleted from the hot
+    collection, so an interrupted run can simply be repeated. The TTL
+    (ALERTS_TTL_DAYS) only applies to the hot collection, so the month's
+    raw events and counters are exempted from it.
+    """
+    # Imported here: app.utils routes its queries through this module
+    from app.utils import _batched, _bulk_upsert
+
+    name = archive_collection_name(month)
+    archive = db[name]
+    for index_name, keys, *options in ALERT_INDEXES:
+        archive.create_index(keys, name=index_name, **(options[0] if options else {}))
+
+    # Listed in the catalog first, so queries see moved alerts straight away
+    db.alert_archives.update_one(
+        {"_id": f"{month:%Y-%m}"},
+        {"$set": {"month": month, "collection": name}},
+        upsert=True,
+    )
+
+    moved = 0
+    for batch in _batched(db.alerts.find(_month_query(month)).sort(_ARCHIVE_SORT), batch_size):
+        _bulk_upsert(archive, [
+            UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": doc}, upsert=True) for doc in batch
+        ])
+        _pin_raw_events(db, batch)
+        db.alerts.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        moved += len(batch)
+
+    db.alert_stats.update_many(_month_hours(month), {"$set": {"lastIngestedAt": NEVER_EXPIRES}})
+    return moved
+
+
+# Parquet columns for alert documents; anything else goes to "extra" as JSON
+_PARQUET_FIELDS = (
+    ("_id", "string"), ("ingestedAt", "timestamp"), ("scanId", "string"),
+    ("rule", "string"), ("severity", "string"), ("category", "string"),
+    ("description", "string"), ("score", "int64"), ("user", "string"),
+    ("userType", "string"), ("sourceIP", "string"), ("eventName", "string"),
+    ("eventSource", "string"), ("eventTime", "string"), ("awsRegion", "string"),
+    ("eventId", "string"), ("eventKey", "string"), ("windowKey", "string"),
+    ("windowCount", "int64"), ("windowMinutes", "float64"),
+)
+
+
+def _parquet_schema():
+    types = {
+        "string": pyarrow.string(), "int64": pyarrow.int64(),
+        "float64": pyarrow.float64(), "timestamp": pyarrow.timestamp("ms"),
+    }
+    fields = [pyarrow.field(name, types[kind]) for name, kind in _PARQUET_FIELDS]
+    fields += [pyarrow.field("rawEvent", pyarrow.string()), pyarrow.field("extra", pyarrow.string())]
+    return pyarrow.schema(fields)
+
+
+def _parquet_row(doc):
+    row = {name: doc.get(name) for name, _ in _PARQUET_FIELDS}
+    row["_id"] = str(doc["_id"])
+    row["rawEvent"] = json_util.dumps(doc["rawEvent"]) if "rawEvent" in doc else None
+    known = {name for name, _ in _PARQUET_FIELDS} | {"rawEvent"}
+    extra = {k: v for k, v in doc.items() if k not in known}
+    row["extra"] = json_util.dumps(extra) if extra else None
+    return row
+
+
+def _write_ndjson(path, batches):
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for batch in batches:
+            for doc in batch:
+                f.write(json_util.dumps(doc) + "\n")
+            count += len(batch)
+    return count
+
+
+def _write_parquet(path, batches):
+    count = 0
+    schema = _parquet_schema()
+    with pyarrow.parquet.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in batches:
+            writer.write_table(pyarrow.Table.from_pylist([_parquet_row(d) for d in batch], schema=schema))
+            count += len(batch)
+    return count
+
+
+def _archive_to_file(db, month, target, archive_dir, batch_size):
+    """
+    Write one month of alerts, with their raw events, to a compressed
+    file, then delete them from the hot collection batch by batch, taking
+    them out of the alert_stats counters and deleting the raw events no
+    other alert refers to. Each run writes a new file, so repeating an
+    interrupted run never overwrites archived data.
+    """
+    # Imported here: app.stats and app.utils route their queries through this module
+    from app.stats import remove_alert_stats
+    from app.utils import _batched, hydrate_raw_events
+
+    os.makedirs(archive_dir, exist_ok=True)
+    suffix = "parquet" if target == "parquet" else "ndjson.gz"
+    path = os.path.join(archive_dir, f"alerts-{month:%Y-%m}-{datetime.utcnow():%Y%m%dT%H%M%S}.{suffix}")
+    tmp_path = path + ".tmp"
+
+    # The month is over, so no alert can be added to it while we write
+    query = _month_query(month)
+    batches = (
+        hydrate_raw_events(batch)
+        for batch in _batched(db.alerts.find(query).sort(_ARCHIVE_SORT), batch_size)
+    )
+    write = _write_parquet if target == "parquet" else _write_ndjson
+    count = write(tmp_path, batches)
+    if not count:
+        os.remove(tmp_path)
+        return 0
+    os.replace(tmp_path, path)
+
+    db.alert_archives.update_one(
+        {"_id": f"{month:%Y-%m}"},
+        {"$set": {"month": month}, "$push": {"files": path}},
+        upsert=True,
+    )
+
+    fields = {"scanId": 1, "scanIds": 1, "ingestedAt": 1, "rule": 1, "severity": 1, "rawEventId": 1}
+    for batch in _batched(db.alerts.find(query, fields).sort(_ARCHIVE_SORT), batch_size):
+        db.alerts.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        remove_alert_stats(db, batch)
+        _prune_raw_events(db, _raw_event_ids(batch))
+    return count
+
+
+def archive_alerts(target=None, now=None):
+    """
+    Roll every month due for archiving (see archivable_months) out of the
+    hot alerts collection into ALERTS_ARCHIVE_TARGET:
+    - "collection": one alerts_archive_YYYY_MM collection per month,
+      still served by get_recent_alerts for windows that overlap it
+    - "ndjson" / "parquet": compressed files under ALERTS_ARCHIVE_DIR
+      (with raw events embedded), for cold storage
+    Alert counters (alert_stats) keep counting alerts archived to
+    collections; alerts archived to files are taken out of them, and
+    their raw events deleted unless another alert still refers to them.
+    Raw events and counters of collection archives are pinned
+    (NEVER_EXPIRES) while the collection exists; drop one and the next
+    run releases them (release_dropped_archives).
+    Cached alert responses are invalidated.
+    Returns {"YYYY-MM": alerts archived}.
+    """
+    config = current_app.config
+    target = target or config.get("ALERTS_ARCHIVE_TARGET", "collection")
+    if target == "parquet" and pyarrow is None:
+        print("pyarrow not installed, archiving alerts as NDJSON instead of Parquet.")
+        target = "ndjson"
+    if target not in ("collection", "ndjson", "parquet"):
+        raise ValueError(f"Unknown archive target: {target}")
+
+    ttl_days = config.get("ALERTS_TTL_DAYS", 0)
+    after_days = config.get("ALERTS_ARCHIVE_AFTER_DAYS", 90)
+    if ttl_days and ttl_days <= after_days + 31:
+        print(
+            f"ALERTS_TTL_DAYS={ttl_days} may expire alerts before they are archived "
+            f"(archived once their month is {after_days} days old)."
+        )
+
+    db = get_db()
+    batch_size = config.get("ALERTS_ARCHIVE_BATCH_SIZE", 1000)
+    release_dropped_archives(db, batch_size)
+    archived = {}
+    for month in archivable_months(db, now, after_days):
+        if db.alerts.find_one(_month_query(month), {"_id": 1}) is None:
+            continue
+        if target == "collection":
+            count = _archive_to_collection(db, month, batch_size)
+        else:
+            count = _archive_to_file(db, month, target, config.get("ALERTS_ARCHIVE_DIR", "archive"), batch_size)
+        db.alert_archives.update_one({"_id": f"{month:%Y-%m}"}, {
+            "$inc": {"count": count}, "$set": {"archivedAt": datetime.utcnow()},
+        })
+        archived[f"{month:%Y-%m}"] = count
+
+    if archived:
+        bump_alerts_generation(db)
+    return archived
@@ -1,12 +1,30 @@
-from flask import Blueprint, jsonify, request, session
+from flask import Blueprint, Response, jsonify, request, session, current_app, stream_with_context
 from datetime import datetime
-import uuid
+import base64
+import json
+import re
+import zlib
 
-from app.scanner import read_cloudtrail_logs
-from app.analyzer import detect_suspicious_events
-from app.utils import store_alerts, get_recent_alerts
-from app.aws_ingestion import read_cloudtrail_from_s3
-from app.playbooks import get_playbook 
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.cache import CachedResponse, bump_alerts_generation, cached_response
+from app.jobs import submit_scan, get_scan_job
+from app.live import get_broker
+from app.utils import (
+    get_recent_alerts,
+    get_alert,
+    find_alerts,
+    count_alerts,
+    explain_alert_queries,
+    get_raw_event,
+    hydrate_raw_events,
+    iter_hydrated,
+)
+from app.jsonencode import dumps
+from app.playbooks import PLAYBOOKS_JSON, get_playbook
+from app.retention import archive_alerts
+from app.stats import get_alert_stats, rebuild_alert_stats
 
 api_bp = Blueprint("api", __name__)
 
@@ -23,66 +41,77 @@ def require_login():
 @api_bp.route("/scan", methods=["POST"])
 def scan_logs():
     """
-    Trigger scanning of CloudTrail logs in the sample_logs folder,
-    analyze them, store alerts in MongoDB, and return count + scanId.
+    Queue a background scan of CloudTrail logs in the local log folder
+    and return its scanId immediately; poll /api/scans/<scanId> for progress.
     """
     guard = require_login()
     if guard:
         return guard
 
-    events = read_cloudtrail_logs()
-    alerts = detect_suspicious_events(events)
-
-    # Tag this batch with a unique scanId
-    scan_id = str(uuid.uuid4())
-    for alert in alerts:
-        alert["scanId"] = scan_id
-
-    store_alerts(alerts)
+    scan_id = submit_scan(current_app._get_current_object(), "local")
 
     return jsonify({
-        "status": "success",
-        "alerts_detected": len(alerts),
+        "status": "queued",
         "scanId": scan_id
-    })
+    }), 202
 
 
 @api_bp.route("/scan_s3", methods=["POST"])
 def scan_s3_logs():
     """
-    Trigger scanning of CloudTrail logs from S3,
-    analyze them, store alerts in MongoDB, and return count + scanId.
+    Queue a background scan of CloudTrail logs from S3 and return its
+    scanId immediately; poll /api/scans/<scanId> for progress.
+    Only objects added since the last scan are read, unless ?full=1.
     """
     guard = require_login()
     if guard:
         return guard
 
-    events = read_cloudtrail_from_s3()
-    alerts = detect_suspicious_events(events)
+    full = request.args.get("full", "").lower() in ("1", "true", "yes")
+    scan_id = submit_scan(current_app._get_current_object(), "s3", full=full)
 
-    # Tag this batch with a unique scanId
-    scan_id = str(uuid.uuid4())
-    for alert in alerts:
-        alert["scanId"] = scan_id
+    return jsonify({
+        "status": "queued",
+        "scanId": scan_id,
+        "incremental": not full,
+    }), 202
 
-    store_alerts(alerts)
 
-    return jsonify({
-        "status": "success",
-        "alerts_detected": len(alerts),
-        "scanId": scan_id
-    })
+@api_bp.route("/scans/<scan_id>", methods=["GET"])
+def scan_status(scan_id):
+    """
+    Report a scan job's status (queued / running / completed / failed)
+    and progress: files read, events processed, alerts stored, throughput.
+    """
+    guard = require_login()
+    if guard:
+        return guard
 
+    job = get_scan_job(scan_id)
+    if job is None:
+        return jsonify({"error": "Scan not found"}), 404
 
-def _serialize_alert(alert):
+    data = {"scanId": job.pop("_id")}
+    for key, value in job.items():
+        data[key] = value.isoformat() if isinstance(value, datetime) else value
+    return jsonify(data)
+
+
+def _serialize_alert(alert, with_playbook=True, hydrate=False):
     """
     Convert MongoDB document to something JSON-safe:
     - ObjectId -> str
     - datetime -> ISO string
-    Also attaches a playbook (if rule matches one).
+    Also attaches a playbook (if rule matches one and with_playbook is set),
+    and with hydrate=True loads the referenced raw event if not embedded.
     """
     data = dict(alert)
 
+    if hydrate and "rawEvent" not in data and data.get("rawEventId"):
+        raw_event = get_raw_event(data["rawEventId"])
+        if raw_event is not None:
+            data["rawEvent"] = raw_event
+
     # ObjectId -> string
     if "_id" in data:
         data["_id"] = str(data["_id"])
@@ -93,43 +122,403 @@ def _serialize_alert(alert):
         data["ingestedAt"] = ia.isoformat()
 
     # Attach playbook (derived at view time; not required in DB)
-    pb = get_playbook(data.get("rule", ""))
+    pb = get_playbook(data.get("rule", "")) if with_playbook else None
     if pb:
         data["playbook"] = pb
 
     return data
 
 
+def _encode_alerts(alerts, playbooks="inline"):
+    """
+    Fast path for list responses: encode the stored alert documents
+    straight to JSON bytes (app.jsonencode.dumps, no per-alert copy) and
+    splice in the playbooks pre-encoded at startup. `playbooks` is:
+    - "inline": an array of alerts, each with its "playbook" (the same
+      shape as _serialize_alert)
+    - "table": {"alerts": [...], "playbooks": {rule: playbook}}, each
+      playbook sent once however many alerts reference its rule
+    - "none": an array of alerts without playbooks
+    """
+    if playbooks == "table":
+        rules = sorted({a.get("rule") for a in alerts} & PLAYBOOKS_JSON.keys())
+        table = b",".join(dumps(rule) + b":" + PLAYBOOKS_JSON[rule] for rule in rules)
+        return b'{"alerts":' + dumps(alerts) + b',"playbooks":{' + table + b"}}"
+    if playbooks == "none":
+        return dumps(alerts)
+
+    parts = []
+    for alert in alerts:
+        encoded = dumps(alert)
+        playbook = PLAYBOOKS_JSON.get(alert.get("rule"))
+        if playbook is not None:
+            # Replace the closing brace with the playbook member
+            encoded = encoded[:-1] + b',"playbook":' + playbook + b"}"
+        parts.append(encoded)
+    return b"[" + b",".join(parts) + b"]"
+
+
+def _alert_filters():
+    """Parse the shared alert filter query params."""
+    hours_back = request.args.get("hours_back")
+
+    try:
+        hours_back = int(hours_back) if hours_back is not None else None
+    except ValueError:
+        hours_back = None
+
+    return {
+        "severity": request.args.get("severity"),
+        "rule": request.args.get("rule"),
+        "hours_back": hours_back,
+        "scan_id": request.args.get("scan_id"),
+    }
+
+
+def _filters_key(filters):
+    """Normalized, hashable form of _alert_filters() for cache keys."""
+    return tuple(filters[name] or None for name in ("severity", "rule", "hours_back", "scan_id"))
+
+
+def _conditional_response(cached):
+    """
+    Build a JSON response from a CachedResponse, carrying its ETag, or a
+    304 Not Modified if the client's If-None-Match already matches.
+    """
+    response = Response(cached.body, mimetype="application/json", headers=cached.headers)
+    response.set_etag(cached.etag)
+    response.headers["Cache-Control"] = "private, no-cache"  # always revalidate
+    return response.make_conditional(request)
+
+
+def _encode_cursor(alert):
+    """Opaque keyset cursor pointing just after the given alert."""
+    payload = json.dumps({
+        "t": alert["ingestedAt"].isoformat(),
+        "id": str(alert["_id"]),
+    })
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    """Inverse of _encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+    except (KeyError, TypeError, InvalidId, UnicodeError, json.JSONDecodeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+# A field name or dotted path of them; "$" would be a projection operator
+_FIELD_PATH = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$")
+
+# Fields find_alerts always returns alongside the requested ones
+_PROJECTED_FIELDS = ("_id", "ingestedAt", "rule", "rawEventId")
+
+
+def _parse_fields(value):
+    """
+    Parse the comma-separated `fields` param into a list (None if empty);
+    raises ValueError on anything MongoDB would reject as a projection:
+    operators, empty path segments, or a path inside another one.
+    """
+    fields = [f.strip() for f in value.split(",") if f.strip()] if value else None
+    if not fields:
+        return None
+    for field in fields:
+        if not _FIELD_PATH.match(field):
+            raise ValueError(f"Invalid field: {field}")
+    paths = set(fields) | set(_PROJECTED_FIELDS)
+    for field in paths:
+        parent = field
+        while "." in parent:
+            parent = parent.rsplit(".", 1)[0]
+            if parent in paths:
+                raise ValueError(f"Field {field} overlaps {parent}")
+    return fields
+
+
 @api_bp.route("/alerts", methods=["GET"])
 def list_alerts():
     """
-    Return recent alerts from MongoDB as JSON.
+    Return one page of recent alerts from MongoDB as JSON (newest first).
     Optional query params:
       - severity (e.g. High, Critical)
       - rule (exact rule name)
       - hours_back (int)
       - scan_id (alerts belonging to a specific scan run)
+      - limit (page size, default ALERTS_PAGE_SIZE, capped at ALERTS_MAX_PAGE_SIZE)
+      - cursor (X-Next-Cursor value from the previous page)
+      - fields (comma-separated projection, e.g. to omit rawEvent in list views)
+      - playbooks: inline (default, each alert carries its playbook), table
+        (returns {"alerts": [...], "playbooks": {rule: playbook}}) or none
+    Response headers:
+      - X-Next-Cursor: present when another page may follow
+      - X-Total-Count: total matches (first page only)
+      - ETag: send it back as If-None-Match to get 304 while unchanged
+    Responses are cached per filter set until the next alert write
+    (or ALERTS_CACHE_TTL, for the sliding hours_back window).
     """
     guard = require_login()
     if guard:
         return guard
 
-    severity = request.args.get("severity")
-    rule = request.args.get("rule")
-    hours_back = request.args.get("hours_back")
-    scan_id = request.args.get("scan_id")
+    filters = _alert_filters()
 
+    page_size = current_app.config.get("ALERTS_PAGE_SIZE", 500)
+    max_page_size = current_app.config.get("ALERTS_MAX_PAGE_SIZE", 5000)
     try:
-        hours_back = int(hours_back) if hours_back is not None else None
+        limit = int(request.args.get("limit", page_size))
     except ValueError:
-        hours_back = None
+        limit = page_size
+    limit = max(1, min(limit, max_page_size))
+
+    after = None
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            after = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    try:
+        fields = _parse_fields(request.args.get("fields"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    playbooks = request.args.get("playbooks", "inline")
+    if playbooks not in ("inline", "table", "none"):
+        return jsonify({"error": "playbooks must be inline, table or none"}), 400
+
+    def build():
+        alerts = get_recent_alerts(limit=limit, after=after, fields=fields, **filters)
+        if fields is None or "rawEvent" in fields:
+            hydrate_raw_events(alerts)
+
+        headers = {}
+        if len(alerts) == limit:
+            headers["X-Next-Cursor"] = _encode_cursor(alerts[-1])
+        if after is None:
+            headers["X-Total-Count"] = str(count_alerts(**filters))
+
+        return CachedResponse(_encode_alerts(alerts, playbooks), headers)
+
+    key = ("alerts", *_filters_key(filters), limit, cursor, tuple(sorted(fields)) if fields else None, playbooks)
+    return _conditional_response(cached_response(key, build))
+
+
+def _iter_ndjson(alerts, chunk_size=64 * 1024):
+    """
+    Encode alerts as newline-delimited JSON, yielding ~chunk_size byte
+    chunks so memory stays constant however many alerts are exported.
+    """
+    buffer = []
+    buffered = 0
+    for alert in alerts:
+        line = dumps(alert)
+        buffer.append(line)
+        buffered += len(line) + 1
+        if buffered >= chunk_size:
+            yield b"\n".join(buffer) + b"\n"
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b"\n".join(buffer) + b"\n"
+
+
+def _gzip_stream(chunks):
+    """Compress a byte stream incrementally into a single gzip member."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
 
-    alerts = get_recent_alerts(
-        severity=severity,
-        rule=rule,
-        hours_back=hours_back,
-        scan_id=scan_id,
+@api_bp.route("/alerts/export", methods=["GET"])
+def export_alerts():
+    """
+    Stream all matching alerts as newline-delimited JSON (one alert per line),
+    straight from the MongoDB cursor, for SIEM hand-off.
+    Supports the same filters as /api/alerts (severity, rule, hours_back, scan_id).
+    Add gzip=1 to download a compressed .ndjson.gz file instead, and
+    include_raw=0 to skip loading each alert's raw event.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    filters = _alert_filters()
+    use_gzip = request.args.get("gzip", "").lower() in ("1", "true", "yes")
+    include_raw = request.args.get("include_raw", "1").lower() in ("1", "true", "yes")
+    batch_size = current_app.config.get("ALERTS_EXPORT_BATCH_SIZE", 1000)
+
+    alerts = find_alerts(**filters, batch_size=batch_size)
+    if include_raw:
+        alerts = iter_hydrated(alerts, batch_size)
+    body = _iter_ndjson(alerts)
+
+    if use_gzip:
+        body = _gzip_stream(body)
+        mimetype = "application/gzip"
+        filename = "alerts.ndjson.gz"
+    else:
+        mimetype = "application/x-ndjson"
+        filename = "alerts.ndjson"
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def _sse(event, data):
+    """Format one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@api_bp.route("/alerts/stream", methods=["GET"])
+def alert_stream():
+    """
+    Push newly stored alerts to the dashboard as Server-Sent Events,
+    instead of it re-fetching /api/alerts.
+    Optional query params: scan_id, severity.
+    Events:
+      - alert: one new alert (list-view fields; details via /api/alerts/<id>)
+      - resync: the client fell behind and should reload its view
+    A comment line is sent every ALERTS_STREAM_HEARTBEAT seconds to keep
+    the connection open. Each client holds a worker thread, so serve this
+    with a threaded or async worker class.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    scan_id = request.args.get("scan_id")
+    severity = request.args.get("severity")
+    heartbeat = current_app.config.get("ALERTS_STREAM_HEARTBEAT", 15)
+    broker = get_broker(current_app._get_current_object())
+    sub = broker.subscribe()
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if sub.lagged:
+                    sub.resync()
+                    yield _sse("resync", {})
+
+                alert = sub.get(heartbeat)
+                if alert is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if scan_id and alert.get("scanId") != scan_id:
+                    continue
+                if severity and alert.get("severity") != severity:
+                    continue
+                yield _sse("alert", _serialize_alert(alert, with_playbook=False))
+        finally:
+            broker.unsubscribe(sub)
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    serialized = [_serialize_alert(a) for a in alerts]
-    return jsonify(serialized)
+
+@api_bp.route("/alerts/stats", methods=["GET"])
+def alert_stats():
+    """
+    Summary counts for the dashboard cards and charts, served from the
+    pre-aggregated alert_stats counters (cost does not grow with the
+    number of alerts).
+    Supports the same filters as /api/alerts (severity, rule, hours_back,
+    scan_id); hours_back is applied at hour granularity.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    filters = _alert_filters()
+
+    def build():
+        stats = get_alert_stats(**filters)
+        stats["byHour"] = [
+            {"hour": hour.isoformat(), "count": count} for hour, count in stats["byHour"]
+        ]
+        return CachedResponse(current_app.json.dumps(stats).encode("utf-8"))
+
+    return _conditional_response(cached_response(("stats", *_filters_key(filters)), build))
+
+
+@api_bp.route("/alerts/stats/rebuild", methods=["POST"])
+def alert_stats_rebuild():
+    """
+    Recompute the alert_stats counters from the alerts collection, e.g.
+    after upgrading with alerts already stored.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    counters = rebuild_alert_stats()
+    bump_alerts_generation()
+    return jsonify({"counters": counters})
+
+
+@api_bp.route("/alerts/archive", methods=["POST"])
+def alerts_archive():
+    """
+    Move the months of alerts older than ALERTS_ARCHIVE_AFTER_DAYS out of
+    the hot collection (see app.retention.archive_alerts). Optional
+    ?target=collection|ndjson|parquet overrides ALERTS_ARCHIVE_TARGET.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    try:
+        archived = archive_alerts(request.args.get("target"))
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"archived": archived, "alerts": sum(archived.values())})
+
+
+@api_bp.route("/alerts/<alert_id>", methods=["GET"])
+def alert_detail(alert_id):
+    """
+    Return a single alert including its full rawEvent and playbook.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    try:
+        alert = get_alert(ObjectId(alert_id))
+    except InvalidId:
+        return jsonify({"error": "Invalid alert id"}), 400
+
+    if alert is None:
+        return jsonify({"error": "Alert not found"}), 404
+
+    return jsonify(_serialize_alert(alert, hydrate=True))
+
+
+@api_bp.route("/diagnostics/query_plans", methods=["GET"])
+def query_plans():
+    """
+    Report explain() plans for the standard /api/alerts filters,
+    flagging collection scans and in-memory sorts.
+    """
+    guard = require_login()
+    if guard:
+        return guard
+
+    plans = explain_alert_queries()
+    return jsonify({
+        "plans": plans,
+        "regressions": [p["shape"] for p in plans if p["collectionScan"] or p["inMemorySort"]],
+    })
@@ -0,0 +1,32 @@
+import hmac
+
+from flask import Blueprint, Response, abort, current_app, request, session
+
+from app.metrics import REGISTRY
+
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def _valid_token(authorization):
+    """Check an Authorization header against METRICS_TOKEN in constant time."""
+    token = current_app.config.get("METRICS_TOKEN")
+    if not token:
+        return False
+    return hmac.compare_digest(authorization.encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+
+
+@metrics_bp.route("/metrics")
+def metrics():
+    """
+    Prometheus text exposition of the pipeline metrics for this process
+    (stage timings, per-rule evaluations/hits/time, scan totals).
+    404 unless METRICS_ENABLED. Open to a logged-in session, or to
+    scrapers sending "Authorization: Bearer <METRICS_TOKEN>" if one is set.
+    """
+    if not current_app.config.get("METRICS_ENABLED"):
+        abort(404)
+
+    if not session.get("user") and not _valid_token(request.headers.get("Authorization", "")):
+        abort(401)
+
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
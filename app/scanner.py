@@ -1,23 +1,196 @@
-import json
+import gzip
+import multiprocessing
 import os
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from app.analyzer import iter_suspicious_events
+from app.jsonparse import iter_records, load_records
+from app.metrics import RuleStats
+
+# What a corrupt, truncated or non-UTF-8 log file raises while parsing
+_PARSE_ERRORS = (ValueError, OSError, EOFError, zlib.error)
+
+
+def _is_log_file(filename):
+    return filename.endswith(".json") or filename.endswith(".json.gz")
+
+
+def iter_log_files(log_folder="sample_logs", time_range=None):
+    """
+    Yield paths of all CloudTrail log files (.json / .json.gz) under the
+    folder, recursing into sub-directories (e.g. YYYY/MM/DD), in sorted order.
+    With a `time_range` (app.timerange.TimeRange), files in date
+    directories outside it are skipped.
+    """
+    if not os.path.isdir(log_folder):
+        return
+
+    for root, dirs, files in os.walk(log_folder):
+        dirs.sort()
+        for filename in sorted(files):
+            if not _is_log_file(filename):
+                continue
+            file_path = os.path.join(root, filename)
+            if time_range is None or time_range.covers_path(file_path.replace(os.sep, "/")):
+                yield file_path
+
+
+def _open_log_file(file_path):
+    """Open a log file as a binary stream, decompressing .gz on the fly."""
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rb")
+    return open(file_path, "rb")
+
+
+def load_log_file(file_path, timings=None):
+    """
+    Parse one CloudTrail log file (plain or gzipped) and return its records.
+    Invalid files are skipped with a message.
+    `timings` (a dict) collects decompress/parse seconds, see app.jsonparse.
+    """
+    try:
+        with _open_log_file(file_path) as f:
+            return load_records(f, size_hint=os.path.getsize(file_path), timings=timings)
+    except _PARSE_ERRORS:
+        print(f"Skipping invalid JSON file: {file_path}")
+        return []
+
+
+def iter_log_file(file_path, timings=None):
+    """
+    Yield the records of one CloudTrail log file (plain or gzipped).
+    Large files are decoded record by record straight from the
+    decompression stream (see app.jsonparse). A file that turns out to be
+    invalid part-way stops with a message after the records read so far.
+    """
+    try:
+        with _open_log_file(file_path) as f:
+            yield from iter_records(f, size_hint=os.path.getsize(file_path), timings=timings)
+    except _PARSE_ERRORS:
+        print(f"Skipping invalid JSON file: {file_path}")
+
+
+def iter_cloudtrail_logs(log_folder="sample_logs", progress=None, time_range=None):
+    """
+    Yield CloudTrail events from every log file in the given folder,
+    one file at a time, so at most a single file is held in memory.
+    Each file is expected to be a JSON with a top-level key 'Records'.
+    `progress` (a ScanProgress) is told about every file read, and gets
+    its decompress/parse timings when metrics are enabled.
+    With a `time_range` (app.timerange.TimeRange) only events in it are
+    yielded and counted.
+    """
+    pipeline_metrics = progress.metrics if progress is not None else None
+
+    for file_path in iter_log_files(log_folder, time_range):
+        timings = {} if pipeline_metrics is not None else None
+        count = 0
+        records = iter_log_file(file_path, timings)
+        if time_range is not None:
+            records = time_range.filter(records)
+        for record in records:
+            count += 1
+            yield record
+        if progress is not None:
+            progress.add_files(1)
+            progress.add_events(count)
+        if timings:
+            pipeline_metrics.observe_all(timings)
+
 
 def read_cloudtrail_logs(log_folder="sample_logs"):
     """
     Read all JSON files in the given folder and return a list of CloudTrail events.
     Each file is expected to be a JSON with a top-level key 'Records'.
     """
-    events = []
-    if not os.path.isdir(log_folder):
-        return events
-
-    for filename in os.listdir(log_folder):
-        if filename.endswith(".json"):
-            file_path = os.path.join(log_folder, filename)
-            with open(file_path, "r") as f:
-                try:
-                    data = json.load(f)
-                    if isinstance(data, dict) and "Records" in data:
-                        events.extend(data["Records"])
-                except json.JSONDecodeError:
-                    print(f"Skipping invalid JSON file: {file_path}")
-    return events
+    return list(iter_cloudtrail_logs(log_folder))
+
+
+def _scan_shard(file_paths, window_settings=None, timed=False, time_range=None):
+    """
+    Worker-process task: parse a shard of files and run detection on them
+    (on the events in `time_range`, if given).
+    Window (rate) rules only see the events within this shard.
+    Returns (alerts, events processed, timings, rule stats); the last two
+    are None unless `timed` (see app.metrics).
+    """
+    # Imported here: app.windows depends on the analyzer, not the scanner
+    from app.windows import WindowedDetector
+
+    detector = WindowedDetector.from_settings(window_settings) if window_settings else None
+    timings = {} if timed else None
+    rule_stats = RuleStats() if timed else None
+    alerts = []
+    event_count = 0
+    for file_path in file_paths:
+        records = load_log_file(file_path, timings)
+        if time_range is not None:
+            records = list(time_range.filter(records))
+        event_count += len(records)
+        alerts.extend(iter_suspicious_events(
+            records, window_detector=detector, rule_stats=rule_stats,
+        ))
+    return alerts, event_count, timings, rule_stats.as_dict() if timed else None
+
+
+def _iter_shards(file_paths, shard_size):
+    shard = []
+    for file_path in file_paths:
+        shard.append(file_path)
+        if len(shard) >= shard_size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def scan_logs_parallel(log_folder="sample_logs", workers=None, shard_size=64, progress=None,
+                       window_settings=None, time_range=None):
+    """
+    Scan a log folder on a process pool: files are sharded across worker
+    processes, which parse them and run detection, and the alerts are
+    yielded back in file order as shards complete.
+    At most 2 * workers shards are in flight, so memory stays bounded.
+    `progress` (a ScanProgress) is updated as each shard completes,
+    including the workers' timings when metrics are enabled.
+    `window_settings` (app.windows.window_settings) enables rate rules
+    per shard; shards are contiguous runs of sorted files.
+    `time_range` (app.timerange.TimeRange) limits the scan to its events.
+    """
+    workers = workers or os.cpu_count() or 1
+    window = workers * 2
+    pending = deque()
+
+    # spawn: forking a threaded web worker is not safe
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+    pipeline_metrics = progress.metrics if progress is not None else None
+    timed = pipeline_metrics is not None
+
+    def _collect(shard, future):
+        alerts, event_count, timings, rule_stats = future.result()
+        if progress is not None:
+            progress.add_files(len(shard))
+            progress.add_events(event_count)
+        if timed:
+            pipeline_metrics.observe_all(timings)
+            pipeline_metrics.rules.merge(rule_stats)
+        return alerts
+
+    try:
+        for shard in _iter_shards(iter_log_files(log_folder, time_range), shard_size):
+            pending.append((shard, pool.submit(_scan_shard, shard, window_settings, timed, time_range)))
+            if len(pending) >= window:
+                yield from _collect(*pending.popleft())
+
+        while pending:
+            yield from _collect(*pending.popleft())
+    finally:
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=True)
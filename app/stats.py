@@ -0,0 +1,179 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from app.db import NEVER_EXPIRES, get_db
+from app.retention import alert_partitions
+
+
+def hour_bucket(moment):
+    """Truncate a datetime to the start of its hour."""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _stats_key(alert):
+    return (
+        alert.get("scanId"),
+        hour_bucket(alert["ingestedAt"]),
+        alert.get("rule"),
+        alert.get("severity"),
+    )
+
+
+def record_alert_stats(db, alerts, rescan=False):
+    """
+    Add newly stored alerts to the alert_stats counters: one document per
+    (scanId, hour of ingestedAt, rule, severity, rescan) holding a count,
+    bumped with a single bulk of $inc upserts per batch, and the latest
+    ingestedAt counted, which their TTL index expires them on.
+    Only pass alerts that were actually inserted, so duplicates skipped
+    by store_alerts are not counted twice; or, with `rescan`, alerts
+    already stored that a later scan (their scanId here) found again:
+    those only count towards that scan's stats, not the overall totals.
+    """
+    counts = Counter()
+    latest = {}
+    for alert in alerts:
+        key = _stats_key(alert)
+        counts[key] += 1
+        latest[key] = max(latest.get(key, alert["ingestedAt"]), alert["ingestedAt"])
+    if not counts:
+        return
+
+    db.alert_stats.bulk_write([
+        UpdateOne(
+            {"scanId": scan_id, "hour": hour, "rule": rule, "severity": severity, "rescan": rescan},
+            {"$inc": {"count": count}, "$max": {"lastIngestedAt": latest[scan_id, hour, rule, severity]}},
+            upsert=True,
+        )
+        for (scan_id, hour, rule, severity), count in counts.items()
+    ], ordered=False)
+
+
+def remove_alert_stats(db, alerts):
+    """
+    Take alerts deleted from the database (archived to files) back out of
+    the alert_stats counters: the count of the scan that stored each one,
+    and the rescan count of every later scan that found it again.
+    Counters left at zero are deleted.
+    """
+    counts = Counter()
+    for alert in alerts:
+        scan_id = alert.get("scanId")
+        # scanIds may no longer list the first scan (see ALERT_SCAN_IDS_MAX)
+        for seen_by in {scan_id, *(alert.get("scanIds") or [])}:
+            counts[(seen_by, *_stats_key(alert)[1:], seen_by != scan_id)] += 1
+    if not counts:
+        return
+
+    db.alert_stats.bulk_write([
+        UpdateOne(
+            {"scanId": scan_id, "hour": hour, "rule": rule, "severity": severity, "rescan": rescan},
+            {"$inc": {"count": -count}},
+        )
+        for (scan_id, hour, rule, severity, rescan), count in counts.items()
+    ], ordered=False)
+    db.alert_stats.delete_many({
+        "hour": {"$in": list({key[1] for key in counts})}, "count": {"$lte": 0},
+    })
+
+
+def build_stats_query(severity=None, rule=None, hours_back=None, scan_id=None):
+    """
+    Filter on alert_stats equivalent to build_alert_query. hours_back is
+    applied at hour granularity: the bucket containing the cut-off counts
+    in full.
+    """
+    query = {}
+
+    if severity:
+        query["severity"] = severity
+
+    if rule:
+        query["rule"] = rule
+
+    if scan_id:
+        query["scanId"] = scan_id
+    else:
+        # Alerts found again by later scans are counted once, under the first
+        query["rescan"] = {"$ne": True}
+
+    if hours_back is not None:
+        since = datetime.utcnow() - timedelta(hours=hours_back)
+        query["hour"] = {"$gte": hour_bucket(since)}
+
+    return query
+
+
+def get_alert_stats(severity=None, rule=None, hours_back=None, scan_id=None):
+    """
+    Summarize the alerts matching the filters from the pre-aggregated
+    counters, without touching the alerts collection.
+    Returns {"total", "bySeverity", "byRule", "byHour"}; byHour is a
+    list of (hour, count) pairs, oldest first.
+    """
+    db = get_db()
+    pipeline = [
+        {"$match": build_stats_query(severity, rule, hours_back, scan_id)},
+        {"$group": {
+            "_id": {"rule": "$rule", "severity": "$severity", "hour": "$hour"},
+            "count": {"$sum": "$count"},
+        }},
+    ]
+
+    by_severity = Counter()
+    by_rule = Counter()
+    by_hour = Counter()
+    for row in db.alert_stats.aggregate(pipeline):
+        key, count = row["_id"], row["count"]
+        by_severity[key["severity"]] += count
+        by_rule[key["rule"]] += count
+        by_hour[key["hour"]] += count
+
+    return {
+        "total": sum(by_severity.values()),
+        "bySeverity": dict(by_severity),
+        "byRule": dict(by_rule),
+        "byHour": sorted(by_hour.items()),
+    }
+
+
+def rebuild_alert_stats():
+    """
+    Recompute alert_stats from the alerts collection and its archive
+    collections (e.g. for alerts stored before the counters existed). Run
+    it while no scan is storing alerts; needs MongoDB 5.0+ ($dateTrunc).
+    Returns the number of counter documents written.
+    """
+    db = get_db()
+    # Counters of alerts archived to collections must outlive the alerts TTL
+    pinned = [{"$set": {"lastIngestedAt": NEVER_EXPIRES}}]
+    pipeline = [{"$set": {"lastIngestedAt": "$ingestedAt"}}] + [
+        {"$unionWith": {"coll": archive.name, "pipeline": pinned}} for archive in alert_partitions(db)[1:]
+    ] + [
+        # One row per scan that found the alert; only the first is not a rescan.
+        # scanIds may no longer list the first (see ALERT_SCAN_IDS_MAX)
+        {"$set": {"seenBy": {"$setUnion": [["$scanId"], {"$ifNull": ["$scanIds", []]}]}}},
+        {"$unwind": "$seenBy"},
+        {"$group": {
+            "_id": {
+                "scanId": "$seenBy",
+                "hour": {"$dateTrunc": {"date": "$ingestedAt", "unit": "hour"}},
+                "rule": "$rule",
+                "severity": "$severity",
+                "rescan": {"$ne": ["$seenBy", "$scanId"]},
+            },
+            "count": {"$sum": 1},
+            "lastIngestedAt": {"$max": "$lastIngestedAt"},
+        }},
+    ]
+    docs = [
+        {**row["_id"], "count": row["count"], "lastIngestedAt": row["lastIngestedAt"]}
+        for row in db.alerts.aggregate(pipeline)
+    ]
+
+    db.alert_stats.delete_many({})
+    if docs:
+        db.alert_stats.insert_many(docs)
+    return len(docs)
@@ -0,0 +1,70 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+# CloudTrail writes logs under .../YYYY/MM/DD/ (the delivery day, in UTC)
+_DAY_DIR = re.compile(r"(?:^|/)(\d{4})/(\d{2})/(\d{2})/")
+_EVENT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def parse_date(value):
+    """
+    Parse a YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS] command-line value as a
+    naive UTC datetime; raises ValueError otherwise. A trailing Z or UTC
+    offset (+02:00) is converted to UTC.
+    """
+    parsed = datetime.fromisoformat(value.rstrip("Z"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class TimeRange:
+    """
+    A [since, until) window on eventTime (naive UTC datetimes, either end
+    may be None), for backfills over part of a log archive.
+    Events are compared as eventTime strings, which CloudTrail always
+    writes as YYYY-MM-DDTHH:MM:SSZ, so nothing is parsed per event;
+    events without an eventTime are left out.
+    Plain data, so it can be sent to scan worker processes.
+    """
+
+    def __init__(self, since=None, until=None):
+        if since is not None and until is not None and since >= until:
+            raise ValueError("the start of a time range must be before its end")
+        self.since = since
+        self.until = until
+        self._since = since.strftime(_EVENT_TIME_FORMAT) if since else None
+        self._until = until.strftime(_EVENT_TIME_FORMAT) if until else None
+
+    def covers_path(self, path):
+        """
+        False if a log file/key can hold no event in range, judged by its
+        YYYY/MM/DD directory. Files are delivered up to a few minutes
+        after their events, so the day before is allowed for. Paths
+        without a date directory are always read.
+        """
+        match = _DAY_DIR.search(path)
+        if match is None:
+            return True
+        try:
+            day = datetime(*map(int, match.groups()))
+        except ValueError:
+            return True
+        if self.since is not None and day + timedelta(days=1) <= self.since:
+            return False
+        if self.until is not None and day - timedelta(days=1) >= self.until:
+            return False
+        return True
+
+    def filter(self, events):
+        """Yield the events whose eventTime falls in the range."""
+        since, until = self._since, self._until
+        for event in events:
+            event_time = event.get("eventTime")
+            if not event_time:
+                continue
+            if since is not None and event_time < since:
+                continue
+            if until is not None and event_time >= until:
+                continue
+            yield event
@@ -1,23 +1,340 @@
+import hashlib
+import heapq
+import json
+import time
 from datetime import datetime, timedelta
+from itertools import islice
+
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.cache import bump_alerts_generation
 from app.db import get_db
+from app.jsonencode import dumps
+from app.live import publish_new_alerts
+from app.metrics import STAGE_MONGO_ALERTS, STAGE_MONGO_RAW_EVENTS, STAGE_MONGO_STATS
+from app.records import expand_alert
+from app.retention import alert_partitions, archive_partition_for
+from app.stats import record_alert_stats
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _batched(iterable, size):
+    """Yield lists of at most `size` items from any iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def event_key(event):
+    """
+    Stable identity for a CloudTrail event: its eventID, or a SHA-1 of the
+    canonical JSON when the record has none (e.g. hand-written samples).
+    """
+    event_id = event.get("eventID")
+    if event_id:
+        return event_id
+    canonical = json.dumps(event, sort_keys=True, separators=(",", ":"), default=str)
+    return "sha1:" + hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _bulk_upsert(collection, ops):
+    """
+    Run insert-if-absent upserts unordered, so one duplicate does not stop
+    the rest. Returns {index into `ops`: new _id} for the documents
+    actually inserted.
+    """
+    try:
+        return collection.bulk_write(ops, ordered=False).upserted_ids
+    except BulkWriteError as exc:
+        # Concurrent scans can race on the same key; those are duplicates too
+        errors = exc.details.get("writeErrors", [])
+        if any(e.get("code") != DUPLICATE_KEY_ERROR for e in errors):
+            raise
+        return {u["index"]: u["_id"] for u in exc.details.get("upserted", [])}
 
 
-def store_alerts(alerts):
+def _store_raw_events(db, raw_events):
     """
-    Store a list of alert dictionaries in MongoDB.
-    Each alert already contains its rawEvent.
+    Store each raw event once in the content-addressed raw_events
+    collection (_id = eventKey); events already stored only have their
+    lastReferenced time moved up, which their TTL index expires them on.
     """
-    if not alerts:
+    if not raw_events:
         return
 
+    now = datetime.utcnow()
+    _bulk_upsert(db.raw_events, [
+        UpdateOne(
+            {"_id": key},
+            {"$setOnInsert": {"event": event, "firstSeen": now}, "$max": {"lastReferenced": now}},
+            upsert=True,
+        )
+        for key, event in raw_events.items()
+    ])
+
+
+def _record_rescans(db, docs, upserted):
+    """
+    Add each duplicate's scanId to the scanIds of the alert already
+    stored, so a scan that finds nothing new still lists (and counts)
+    the alerts it saw. Only the last ALERT_SCAN_IDS_MAX scans are kept,
+    so re-scanning the same logs over and over does not grow the alert. Returns those stored alerts, tagged with the new
+    scanId, that this scan had not seen before.
+    """
+    wanted = {}
+    for i, doc in enumerate(docs):
+        if i not in upserted and doc.get("scanId"):
+            wanted.setdefault(doc["scanId"], set()).add((doc["eventKey"], doc["rule"]))
+
+    keep = current_app.config.get("ALERT_SCAN_IDS_MAX", 20)
+    seen_again = []
+    for scan_id, keys in wanted.items():
+        found = [
+            alert for alert in db.alerts.find(
+                {"eventKey": {"$in": list({key for key, _ in keys})}, "scanIds": {"$ne": scan_id}},
+                {"eventKey": 1, "rule": 1, "severity": 1, "ingestedAt": 1},
+            )
+            if (alert["eventKey"], alert.get("rule")) in keys
+        ]
+        if found:
+            db.alerts.update_many(
+                {"_id": {"$in": [alert["_id"] for alert in found]}, "scanIds": {"$ne": scan_id}},
+                {"$push": {"scanIds": {"$each": [scan_id], "$slice": -keep}}},
+            )
+            seen_again.extend({**alert, "scanId": scan_id} for alert in found)
+    return seen_again
+
+
+def store_alerts(alerts, batch_size=None, progress=None):
+    """
+    Store alerts in MongoDB: dictionaries, or app.records.CompactAlerts,
+    which are expanded into documents here.
+    Accepts any iterable (including a generator) and writes it in bounded,
+    unordered bulk upserts keyed on (eventKey, rule), so re-scanning the
+    same logs never duplicates alerts. An alert keeps the scanId of the
+    scan that first stored it; scanIds lists the last ALERT_SCAN_IDS_MAX
+    scans that found it, and is what scan_id filters match.
+    Each alert arrives with its rawEvent embedded; the raw event is stored
+    once in raw_events and the alert document keeps only a rawEventId
+    reference (the caller's dicts are not modified).
+    Newly inserted alerts are added to the alert_stats counters and
+    published to live dashboards, and any batch that inserts something
+    invalidates cached alert responses.
+    `progress` (a ScanProgress) is updated after every batch, and gets
+    the Mongo write timings when metrics are enabled.
+    Returns {"inserted": n, "duplicates": n}.
+    """
+    if batch_size is None:
+        batch_size = current_app.config.get("STORE_BATCH_SIZE", 1000)
+
+    pipeline_metrics = progress.metrics if progress is not None else None
+    clock = time.perf_counter
+
+    db = None
+    inserted = 0
+    duplicates = 0
+
+    for batch in _batched(alerts, batch_size):
+        if db is None:
+            db = get_db()
+
+        docs = []
+        raw_events = {}
+
+        # Enrich with ingestedAt timestamp and the dedup key,
+        # and split the raw event out into its own collection
+        for alert in batch:
+            # A copy: the caller's dicts are not modified
+            doc = dict(expand_alert(alert))
+            if "ingestedAt" not in doc:
+                doc["ingestedAt"] = datetime.utcnow()
+            if "eventKey" not in doc:
+                doc["eventKey"] = event_key(doc["rawEvent"])
+            if doc.get("scanId"):
+                doc["scanIds"] = [doc["scanId"]]
+            raw_event = doc.pop("rawEvent", None)
+            if raw_event is not None:
+                raw_events.setdefault(doc["eventKey"], raw_event)
+                doc["rawEventId"] = doc["eventKey"]
+            docs.append(doc)
+
+        # Raw events first, so every stored alert's reference resolves
+        start = clock()
+        _store_raw_events(db, raw_events)
+        raw_done = clock()
+
+        upserted = _bulk_upsert(db.alerts, [
+            UpdateOne(
+                {"eventKey": doc["eventKey"], "rule": doc["rule"]},
+                {"$setOnInsert": doc},
+                upsert=True,
+            )
+            for doc in docs
+        ])
+        seen_again = _record_rescans(db, docs, upserted) if len(upserted) < len(docs) else []
+        alerts_done = clock()
+        new_docs = [{**docs[i], "_id": _id} for i, _id in upserted.items()]
+        record_alert_stats(db, new_docs)
+        record_alert_stats(db, seen_again, rescan=True)
+        if pipeline_metrics is not None:
+            pipeline_metrics.observe(STAGE_MONGO_RAW_EVENTS, raw_done - start)
+            pipeline_metrics.observe(STAGE_MONGO_ALERTS, alerts_done - raw_done)
+            pipeline_metrics.observe(STAGE_MONGO_STATS, clock() - alerts_done)
+        if new_docs or seen_again:
+            bump_alerts_generation(db)
+        if new_docs:
+            publish_new_alerts(current_app, new_docs)
+
+        batch_inserted = len(upserted)
+        inserted += batch_inserted
+        duplicates += len(batch) - batch_inserted
+        if progress is not None:
+            progress.add_alerts(batch_inserted, len(batch) - batch_inserted)
+
+    return {"inserted": inserted, "duplicates": duplicates}
+
+
+def write_alerts_ndjson(alerts, f, batch_size=None, progress=None):
+    """
+    store_alerts counterpart for runs without MongoDB: write alerts to the
+    binary file `f` as newline-delimited JSON, one document per alert as
+    store_alerts would build it (ingestedAt, eventKey) but with the
+    rawEvent embedded, so the file stands on its own.
+    Alerts are deduplicated on (eventKey, rule) within the run.
+    Returns {"inserted": n, "duplicates": n}.
+    """
+    if batch_size is None:
+        batch_size = current_app.config.get("STORE_BATCH_SIZE", 1000)
+
+    seen = set()
+    written = 0
+    duplicates = 0
+
+    for batch in _batched(alerts, batch_size):
+        now = datetime.utcnow()
+        lines = []
+        for alert in batch:
+            doc = dict(expand_alert(alert))
+            doc.setdefault("ingestedAt", now)
+            if doc.get("scanId"):
+                doc["scanIds"] = [doc["scanId"]]
+            if "eventKey" not in doc:
+                doc["eventKey"] = event_key(doc["rawEvent"])
+
+            key = (doc["eventKey"], doc["rule"])
+            if key in seen:
+                continue
+            seen.add(key)
+            lines.append(dumps(doc))
+
+        if lines:
+            f.write(b"\n".join(lines) + b"\n")
+        written += len(lines)
+        duplicates += len(batch) - len(lines)
+        if progress is not None:
+            progress.add_alerts(len(lines), len(batch) - len(lines))
+
+    return {"inserted": written, "duplicates": duplicates}
+
+
+def build_alert_query(severity=None, rule=None, hours_back=None, scan_id=None):
+    """Build the MongoDB filter used by get_recent_alerts."""
+    query = {}
+
+    if severity:
+        query["severity"] = severity
+
+    if rule:
+        query["rule"] = rule
+
+    if scan_id:
+        query["scanIds"] = scan_id
+
+    if hours_back is not None:
+        query["ingestedAt"] = {"$gte": _since(hours_back)}
+
+    return query
+
+
+def _since(hours_back):
+    return None if hours_back is None else datetime.utcnow() - timedelta(hours=hours_back)
+
+
+def _alert_sort_key(alert):
+    return alert.get("ingestedAt") or datetime.min, alert["_id"]
+
+
+# Newest first; _id breaks ties between alerts stored in the same batch
+ALERT_SORT = [("ingestedAt", -1), ("_id", -1)]
+
+
+def find_alerts(
+    severity=None,
+    rule=None,
+    hours_back=None,
+    scan_id=None,
+    after=None,
+    limit=None,
+    fields=None,
+    batch_size=None,
+):
+    """
+    Return an iterator over alerts matching the filters, newest first.
+    - after: (ingestedAt, _id) of the last alert on the previous page;
+      only alerts strictly after it in sort order are returned (keyset
+      pagination, so deep pages cost the same as the first one)
+    - fields: list of field names to return (None = whole document)
+    - batch_size: Mongo cursor batch size
+    Only the hot alerts collection is queried unless the window reaches
+    into archived months (see app.retention); then each partition is
+    queried with the same filter and sort and the results are merged.
+    """
     db = get_db()
+    query = build_alert_query(severity, rule, hours_back, scan_id)
 
-    # Enrich with ingestedAt timestamp
-    for alert in alerts:
-        if "ingestedAt" not in alert:
-            alert["ingestedAt"] = datetime.utcnow()
+    if after is not None:
+        after_time, after_id = after
+        query["$or"] = [
+            {"ingestedAt": {"$lt": after_time}},
+            {"ingestedAt": after_time, "_id": {"$lt": after_id}},
+        ]
 
-    db.alerts.insert_many(alerts)
+    projection = None
+    if fields:
+        # Always keep what the cursor and the playbook lookup need
+        projection = {f: 1 for f in {*fields, "ingestedAt", "rule"}}
+        if "rawEvent" in projection:
+            projection["rawEventId"] = 1
+
+    cursors = []
+    for collection in alert_partitions(db, _since(hours_back)):
+        cursor = collection.find(query, projection).sort(ALERT_SORT)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        cursors.append(cursor)
+
+    if len(cursors) == 1:
+        return cursors[0]
+    # Every partition is already sorted, so merging them stays lazy
+    return islice(heapq.merge(*cursors, key=_alert_sort_key, reverse=True), limit)
+
+
+def count_alerts(severity=None, rule=None, hours_back=None, scan_id=None):
+    """Count alerts matching the filters (served from the same indexes)."""
+    db = get_db()
+    query = build_alert_query(severity, rule, hours_back, scan_id)
+    return sum(
+        collection.count_documents(query)
+        for collection in alert_partitions(db, _since(hours_back))
+    )
 
 
 def get_recent_alerts(
@@ -26,6 +343,8 @@ def get_recent_alerts(
     rule=None,
     hours_back=None,
     scan_id=None,        # supports per-scan filtering
+    after=None,
+    fields=None,
 ):
     """
     Fetch recent alerts from MongoDB with optional filters:
@@ -34,26 +353,131 @@ def get_recent_alerts(
     - hours_back: only alerts in the last N hours
     - scan_id: only alerts from a particular scan run
     - limit: max number of results (None = no limit)
+    - after / fields: see find_alerts
+    Windows reaching into archived months also read the archive
+    collections for those months.
+    """
+    return list(find_alerts(
+        severity=severity,
+        rule=rule,
+        hours_back=hours_back,
+        scan_id=scan_id,
+        after=after,
+        limit=limit,
+        fields=fields,
+    ))
+
+
+def get_alert(alert_id):
+    """
+    Fetch a single alert document by ObjectId: from the hot collection,
+    else from the archive for the month the ObjectId was created in (an
+    alert's _id is created when it is stored), else any archive.
     """
     db = get_db()
-    query = {}
+    alert = db.alerts.find_one({"_id": alert_id})
+    if alert is not None:
+        return alert
 
-    if severity:
-        query["severity"] = severity
+    archive = archive_partition_for(db, alert_id.generation_time.replace(tzinfo=None))
+    if archive is not None:
+        alert = archive.find_one({"_id": alert_id})
+        if alert is not None:
+            return alert
 
-    if rule:
-        query["rule"] = rule
+    for collection in alert_partitions(db)[1:]:
+        alert = collection.find_one({"_id": alert_id})
+        if alert is not None:
+            return alert
+    return None
 
-    if scan_id:
-        query["scanId"] = scan_id
 
-    if hours_back is not None:
-        since = datetime.utcnow() - timedelta(hours=hours_back)
-        query["ingestedAt"] = {"$gte": since}
+def get_raw_event(raw_event_id):
+    """Fetch one stored raw CloudTrail event by its key, or None."""
+    doc = get_db().raw_events.find_one({"_id": raw_event_id})
+    return doc["event"] if doc else None
+
+
+def hydrate_raw_events(alerts):
+    """
+    Attach rawEvent to alerts that only hold a rawEventId reference,
+    with a single query for the whole list. Alerts stored before raw
+    events were split out already embed theirs and are left as they are.
+    """
+    missing = {
+        a["rawEventId"] for a in alerts
+        if "rawEvent" not in a and a.get("rawEventId")
+    }
+    if not missing:
+        return alerts
+
+    db = get_db()
+    found = {
+        doc["_id"]: doc["event"]
+        for doc in db.raw_events.find({"_id": {"$in": list(missing)}})
+    }
+    for alert in alerts:
+        if "rawEvent" not in alert and alert.get("rawEventId") in found:
+            alert["rawEvent"] = found[alert["rawEventId"]]
+    return alerts
+
+
+def iter_hydrated(alerts, batch_size=500):
+    """Lazily hydrate raw events for a stream of alerts, batch by batch."""
+    for batch in _batched(alerts, batch_size):
+        yield from hydrate_raw_events(batch)
+
+
+def _summarize_plan(explain):
+    """
+    Reduce an explain() document to the parts worth watching:
+    the stage chain of the winning plan, the index used, and docs examined.
+    """
+    winning = explain.get("queryPlanner", {}).get("winningPlan", {})
+    winning = winning.get("queryPlan", winning)  # SBE wraps the classic plan
 
-    cursor = db.alerts.find(query).sort("ingestedAt", -1)
+    stages = []
+    index_name = None
+    node = winning
+    while node:
+        stages.append(node.get("stage"))
+        index_name = index_name or node.get("indexName")
+        node = node.get("inputStage") or (node.get("inputStages") or [None])[0]
+
+    stats = explain.get("executionStats", {})
+    return {
+        "stages": stages,
+        "index": index_name,
+        "collectionScan": "COLLSCAN" in stages,
+        "inMemorySort": "SORT" in stages,
+        "nReturned": stats.get("nReturned"),
+        "totalKeysExamined": stats.get("totalKeysExamined"),
+        "totalDocsExamined": stats.get("totalDocsExamined"),
+    }
+
+
+def explain_alert_queries():
+    """
+    Run explain() for the standard dashboard filter shapes and return a
+    summary per shape, so missing or unused indexes show up as
+    COLLSCAN / in-memory SORT stages.
+    """
+    db = get_db()
+    latest = db.alerts.find_one({}, {"scanId": 1}, sort=ALERT_SORT) or {}
+    scan_id = latest.get("scanId", "example-scan-id")
 
-    if limit is not None:
-        cursor = cursor.limit(limit)
+    shapes = {
+        "all": {},
+        "severity": {"severity": "High"},
+        "rule": {"rule": "Root Account Activity"},
+        "hours_back": {"hours_back": 24},
+        "scan_id": {"scan_id": scan_id},
+        "scan_id+severity": {"scan_id": scan_id, "severity": "High"},
+    }
 
-    return list(cursor)
+    plans = []
+    for name, filters in shapes.items():
+        query = build_alert_query(**filters)
+        explain = db.alerts.find(query).sort(ALERT_SORT).explain()
+        plans.append({"shape": name, "filters": filters, **_summarize_plan(explain)})
+    return plans
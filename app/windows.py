@@ -0,0 +1,211 @@
+from collections import OrderedDict, deque
+
+from app.analyzer import Rule, _parse_iso_time
+
+
+class WindowCounter:
+    """
+    Per-key event counts over a sliding time window, kept as fixed-size
+    time buckets. Memory is bounded two ways: each key holds at most
+    window / bucket buckets, and at most `max_keys` keys are tracked
+    (least recently seen keys are evicted first).
+    """
+
+    def __init__(self, window_seconds, bucket_seconds=60, max_keys=100000):
+        self.window = window_seconds
+        self.bucket = max(1, min(bucket_seconds, window_seconds))
+        self.max_keys = max_keys
+        # key -> [deque of [bucket_start, count], total, last_alert_ts]
+        self._keys = OrderedDict()
+        self._latest = 0.0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, key, ts):
+        """
+        Count one event for `key` at epoch seconds `ts` and return the
+        key's state (buckets, total in window, last alert time).
+        """
+        state = self._keys.get(key)
+        if state is None:
+            state = [deque(), 0, None]
+            self._keys[key] = state
+        else:
+            self._keys.move_to_end(key)
+
+        buckets = state[0]
+        # A bucket expires once it ends before the window starts
+        horizon = ts - self.window
+        while buckets and buckets[0][0] + self.bucket <= horizon:
+            state[1] -= buckets.popleft()[1]
+
+        bucket_start = ts - (ts % self.bucket)
+        if buckets and buckets[-1][0] == bucket_start:
+            buckets[-1][1] += 1
+        elif buckets and buckets[-1][0] > bucket_start:
+            # Late event: count it in the newest bucket still in the window
+            buckets[-1][1] += 1
+        else:
+            buckets.append([bucket_start, 1])
+        state[1] += 1
+
+        if ts > self._latest:
+            self._latest = ts
+        self._evict()
+        return state
+
+    def _evict(self):
+        """Drop keys beyond max_keys and keys idle for a whole window."""
+        while len(self._keys) > self.max_keys:
+            self._keys.popitem(last=False)
+
+        horizon = self._latest - self.window
+        while self._keys:
+            oldest_key = next(iter(self._keys))
+            buckets = self._keys[oldest_key][0]
+            if buckets and buckets[-1][0] + self.bucket > horizon:
+                break
+            self._keys.popitem(last=False)
+
+
+class WindowRule(Rule):
+    """
+    A rate rule: fires when `threshold` matching events share the same
+    key (from `key_func`) within `window_seconds`. It fires at most once per
+    key per window, on the event that crosses the threshold.
+    """
+
+    __slots__ = ("key_func", "threshold", "window_seconds")
+
+    def __init__(self, name, description, category, severity, score, match,
+                 key_func, threshold, window_seconds, event_source=None):
+        super().__init__(name, description, category, severity, score, match,
+                         event_source=event_source)
+        self.key_func = key_func
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+
+    def build_alert(self, event, key=None, count=None):
+        alert = super().build_alert(event)
+        alert["windowKey"] = key
+        alert["windowCount"] = count
+        alert["windowMinutes"] = self.window_seconds / 60
+        return alert
+
+
+def _is_failed_login(event):
+    return (
+        event.get("eventName") == "ConsoleLogin"
+        and (event.get("responseElements") or {}).get("ConsoleLogin") == "Failure"
+    )
+
+
+# IAM write operations; reads (Get*/List*/...) are not counted
+_IAM_WRITE_PREFIXES = (
+    "Create", "Delete", "Attach", "Detach", "Put", "Add", "Remove", "Update",
+)
+
+
+def _is_iam_change(event):
+    return event.get("eventName", "").startswith(_IAM_WRITE_PREFIXES)
+
+
+def _source_ip(event):
+    return event.get("sourceIPAddress", "Unknown")
+
+
+def _user_name(event):
+    return (event.get("userIdentity") or {}).get("userName", "Unknown")
+
+
+def window_settings(config):
+    """Extract the (picklable) window detection settings from app config."""
+    return {
+        "enabled": config.get("WINDOW_DETECTIONS_ENABLED", True),
+        "bucket_seconds": config.get("WINDOW_BUCKET_SECONDS", 60),
+        "max_keys": config.get("WINDOW_MAX_KEYS", 100000),
+        "failed_login_threshold": config.get("WINDOW_FAILED_LOGIN_THRESHOLD", 5),
+        "failed_login_minutes": config.get("WINDOW_FAILED_LOGIN_MINUTES", 10),
+        "iam_burst_threshold": config.get("WINDOW_IAM_BURST_THRESHOLD", 10),
+        "iam_burst_minutes": config.get("WINDOW_IAM_BURST_MINUTES", 5),
+    }
+
+
+def build_window_rules(settings):
+    """The built-in rate rules, parameterised from window_settings()."""
+    return [
+        WindowRule(
+            "Console Login Brute Force",
+            "Repeated console sign-in failures from one source IP.",
+            "Authentication", "Critical", 90,
+            _is_failed_login,
+            key_func=_source_ip,
+            threshold=settings["failed_login_threshold"],
+            window_seconds=settings["failed_login_minutes"] * 60,
+            event_source="signin.amazonaws.com",
+        ),
+        WindowRule(
+            "IAM Change Burst",
+            "Burst of IAM changes by a single user.",
+            "Privilege Escalation", "High", 80,
+            _is_iam_change,
+            key_func=_user_name,
+            threshold=settings["iam_burst_threshold"],
+            window_seconds=settings["iam_burst_minutes"] * 60,
+            event_source="iam.amazonaws.com",
+        ),
+    ]
+
+
+class WindowedDetector:
+    """
+    Stateful detection layered on top of detect_suspicious_events:
+    feed it every event (in roughly time order) via observe(), and it
+    returns alerts for windowed rate rules.
+    """
+
+    def __init__(self, rules, bucket_seconds=60, max_keys=100000):
+        self.rules = rules
+        self.counters = [
+            WindowCounter(r.window_seconds, bucket_seconds, max_keys) for r in rules
+        ]
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a detector from window_settings(), or None if disabled."""
+        if not settings.get("enabled"):
+            return None
+        return cls(
+            build_window_rules(settings),
+            bucket_seconds=settings["bucket_seconds"],
+            max_keys=settings["max_keys"],
+        )
+
+    def observe(self, event):
+        """Count one event and return any window alerts it triggers."""
+        event_source = event.get("eventSource", "")
+        alerts = []
+
+        for rule, counter in zip(self.rules, self.counters):
+            if rule.event_source is not None and rule.event_source != event_source:
+                continue
+            if not rule.match(event):
+                continue
+
+            event_time = _parse_iso_time(event.get("eventTime"))
+            if event_time is None:
+                continue
+            ts = event_time.timestamp()
+
+            key = rule.key_func(event)
+            state = counter.add(key, ts)
+            last_alert = state[2]
+
+            if state[1] >= rule.threshold and (
+                last_alert is None or ts - last_alert >= rule.window_seconds
+            ):
+                state[2] = ts
+                alerts.append(rule.build_alert(event, key=key, count=state[1]))
+
+        return alerts
@@ -0,0 +1,78 @@
+"""
+/api/alerts serialization benchmark: the previous path (_serialize_alert
+per alert, then Flask's JSON provider) against _encode_alerts with
+playbooks inline, as a side table and left out. Reports payload bytes
+(plain and gzipped) and encode time per page, for whole stored alerts
+and for the dashboard's list fields.
+
+    python -m benchmarks.bench_alert_serialization --alerts 500 --repeat 20
+"""
+import argparse
+import gzip
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from flask import Flask
+
+from app.analyzer import detect_suspicious_events
+from app.jsonencode import orjson
+from app.routes.api import _encode_alerts, _serialize_alert
+from app.utils import event_key
+from benchmarks.synthetic import generate_events
+
+LIST_FIELDS = ("rule", "severity", "user", "sourceIP", "eventName", "awsRegion", "eventTime", "scanId")
+
+
+def stored_alerts(count, seed):
+    """`count` alerts as find_alerts returns them (ObjectId, datetime, hydrated rawEvent)."""
+    alerts = []
+    events = 2000
+    while len(alerts) < count:
+        alerts = detect_suspicious_events(generate_events(events, suspicious_ratio=0.2, seed=seed))
+        events *= 2
+    now = datetime.utcnow()
+    for alert in alerts:
+        alert.update(_id=ObjectId(), ingestedAt=now, scanId="bench",
+                     eventKey=event_key(alert["rawEvent"]), rawEventId=event_key(alert["rawEvent"]))
+    return alerts[:count]
+
+
+def best_ms(encode, alerts, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(alerts)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alerts", type=int, default=500, help="alerts per page")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    alerts = stored_alerts(args.alerts, args.seed)
+    listed = [{k: a[k] for k in ("_id", "ingestedAt", *LIST_FIELDS) if k in a} for a in alerts]
+    cases = {
+        "previous": lambda page: app.json.dumps([_serialize_alert(a) for a in page]).encode("utf-8"),
+        "inline": lambda page: _encode_alerts(page, "inline"),
+        "table": lambda page: _encode_alerts(page, "table"),
+        "none": lambda page: _encode_alerts(page, "none"),
+    }
+
+    print(f"encoder={'orjson' if orjson is not None else 'json'} alerts/page={len(alerts)}")
+    with app.app_context():
+        for shape, page in (("full", alerts), ("list", listed)):
+            for name, encode in cases.items():
+                body = encode(page)
+                print(f"{shape:<5} {name:<9} bytes={len(body):>9,} gzip={len(gzip.compress(body)):>8,} "
+                      f"encode={best_ms(encode, page, args.repeat):7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Latency benchmark for GET /api/alerts against the configured MONGO_URI.
+
+    python -m benchmarks.bench_alerts_latency --requests 200
+
+Run it once on each revision you want to compare; the database must be
+reachable and should already hold some alerts.
+"""
+import argparse
+import statistics
+import time
+
+from app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--query", default="severity=High&hours_back=24")
+    args = parser.parse_args()
+
+    app = create_app()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = app.config["ADMIN_USERNAME"]
+
+    url = "/api/alerts?" + args.query
+    client.get(url)  # warm-up
+
+    timings = []
+    for _ in range(args.requests):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.status_code
+
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(
+        f"requests={len(timings)} mean={statistics.mean(timings):.1f}ms "
+        f"p50={statistics.median(timings):.1f}ms p95={p95:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
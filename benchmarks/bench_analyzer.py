@@ -0,0 +1,37 @@
+"""
+Throughput benchmark for app.analyzer.detect_suspicious_events.
+
+    python -m benchmarks.bench_analyzer --events 200000
+"""
+import argparse
+import time
+
+from app.analyzer import detect_suspicious_events
+from benchmarks.synthetic import generate_events
+
+
+def run(events, repeat=3):
+    """Return (best events/sec, alert count) over `repeat` runs."""
+    best = None
+    alerts = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        alerts = detect_suspicious_events(events)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(events) / best, len(alerts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    events = generate_events(args.events)
+    rate, alert_count = run(events, repeat=args.repeat)
+    print(f"events={len(events)} alerts={alert_count} events/sec={rate:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Per-event vs columnar batch detection on a large synthetic event set.
+Events are generated and checked chunk by chunk so the full set never
+has to fit in memory; only detection time is measured.
+
+    python -m benchmarks.bench_columnar --events 10000000 --chunk 500000
+"""
+import argparse
+import random
+import time
+
+from app.analyzer import detect_suspicious_events
+from app.columnar import detect_suspicious_events_columnar, np
+from benchmarks.synthetic import generate_event
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=10000000)
+    parser.add_argument("--chunk", type=int, default=500000)
+    parser.add_argument("--batch-size", type=int, default=65536)
+    args = parser.parse_args()
+
+    if np is None:
+        print("NumPy is not installed; columnar mode would fall back to per-event")
+
+    rng = random.Random(0)
+    per_event = columnar = 0.0
+    done = alerts = 0
+
+    while done < args.events:
+        count = min(args.chunk, args.events - done)
+        events = [generate_event(rng) for _ in range(count)]
+
+        start = time.perf_counter()
+        expected = detect_suspicious_events(events)
+        per_event += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = detect_suspicious_events_columnar(events, batch_size=args.batch_size)
+        columnar += time.perf_counter() - start
+
+        if actual != expected:
+            raise SystemExit(f"columnar output differs from detect_suspicious_events near event {done}")
+
+        done += count
+        alerts += len(expected)
+
+    print(f"events={done} alerts={alerts} (outputs identical)")
+    print(f"per-event  {done / per_event:>12,.0f} events/s")
+    print(f"columnar   {done / columnar:>12,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compares detect_suspicious_events (alert dicts) with detect_compact
+(CompactAlerts over slotted EventRecords): events/sec and the memory
+held per alert by the returned list.
+
+    python -m benchmarks.bench_compact_records --events 200000 --root-ratio 0.2
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from app.analyzer import detect_suspicious_events
+from app.records import detect_compact
+from benchmarks.synthetic import generate_events
+
+
+def best_rate(detect, events, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        detect(events)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(events) / best
+
+
+def retained_bytes(detect, events):
+    """Bytes still allocated by detect()'s result (the events already exist)."""
+    gc.collect()
+    tracemalloc.start()
+    alerts = detect(events)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, len(alerts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--suspicious-ratio", type=float, default=0.05)
+    parser.add_argument("--root-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    events = generate_events(args.events, suspicious_ratio=args.suspicious_ratio, root_ratio=args.root_ratio)
+    expected = detect_suspicious_events(events)
+    if [a.to_dict() for a in detect_compact(events)] != expected:
+        raise SystemExit("detect_compact output differs from detect_suspicious_events")
+
+    for name, detect in (("dicts", detect_suspicious_events), ("compact", detect_compact)):
+        rate = best_rate(detect, events, args.repeat)
+        size, alert_count = retained_bytes(detect, events)
+        print(
+            f"{name:<8} events={len(events)} alerts={alert_count} events/sec={rate:,.0f} "
+            f"bytes/alert={size / max(alert_count, 1):,.0f} bytes/event={size / len(events):,.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Parse throughput and peak memory for large gzipped CloudTrail files:
+the old text-then-json.loads path vs each installed parser backend
+(whole file) vs incremental record-by-record decoding.
+
+    python -m benchmarks.bench_json_parsing --files 4 --events-per-file 100000
+
+Times are the best of --repeat passes. Peak memory is measured with tracemalloc, so it counts Python-level
+allocations (decompressed text, parsed records), not C-library buffers.
+"""
+import argparse
+import gc
+import gzip
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app import jsonparse
+from benchmarks.synthetic import generate_events
+
+
+def _legacy(path):
+    # What the scanner did before: decompress to one str, then json.loads
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)["Records"]
+
+
+def _whole(backend):
+    def parse(path):
+        with gzip.open(path, "rb") as f:
+            return jsonparse.BACKENDS[backend](f.read())["Records"]
+    return parse
+
+
+def _decompress_only(path):
+    with gzip.open(path, "rb") as f:
+        f.read()
+    return 0
+
+
+def _streamed(path):
+    with gzip.open(path, "rb") as f:
+        return sum(1 for _ in jsonparse.iter_records_stream(f))
+
+
+def _run(parse, paths):
+    count = 0
+    for path in paths:
+        records = parse(path)
+        count += records if isinstance(records, int) else len(records)
+        del records
+    return count
+
+
+def _measure(parse, paths, repeat):
+    """Best of `repeat` timed passes, then one under tracemalloc for the peak."""
+    elapsed = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        count = _run(parse, paths)
+        elapsed = min(elapsed, time.perf_counter() - start)
+
+    tracemalloc.start()
+    _run(parse, paths)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--events-per-file", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        paths = []
+        raw_bytes = 0
+        for i in range(args.files):
+            payload = json.dumps({
+                "Records": generate_events(args.events_per_file, seed=i)
+            }).encode("utf-8")
+            raw_bytes += len(payload)
+            path = os.path.join(root, f"log_{i:04d}.json.gz")
+            with gzip.open(path, "wb") as f:
+                f.write(payload)
+            paths.append(path)
+
+        stored = sum(os.path.getsize(p) for p in paths)
+        print(f"files={len(paths)} decompressed={raw_bytes / 1e6:.1f}MB gzipped={stored / 1e6:.1f}MB")
+
+        modes = [("gunzip only", _decompress_only), ("legacy text+json", _legacy)]
+        modes += [(f"whole {name}", _whole(name)) for name in jsonparse.BACKENDS]
+        modes.append(("streamed records", _streamed))
+
+        for label, parse in modes:
+            count, elapsed, peak = _measure(parse, paths, args.repeat)
+            print(
+                f"{label:<18} events={count} seconds={elapsed:.2f} "
+                f"MB/s={raw_bytes / 1e6 / elapsed:,.1f} events/s={count / elapsed:,.0f} "
+                f"peak={peak / 1e6:,.1f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Scaling benchmark for the local scanner (serial vs process pool).
+
+    python -m benchmarks.bench_local_scanner --files 400 --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app.analyzer import iter_suspicious_events
+from app.scanner import iter_cloudtrail_logs, scan_logs_parallel
+from benchmarks.synthetic import write_log_archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=400)
+    parser.add_argument("--events-per-file", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shard-size", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"cpu_count={os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as root:
+        total = write_log_archive(root, args.files, args.events_per_file)
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            if workers <= 1:
+                alert_count = sum(1 for _ in iter_suspicious_events(iter_cloudtrail_logs(root)))
+            else:
+                alert_count = sum(1 for _ in scan_logs_parallel(root, workers, args.shard_size))
+            elapsed = time.perf_counter() - start
+            print(
+                f"workers={workers:<3} events={total} alerts={alert_count} "
+                f"seconds={elapsed:.2f} events/sec={total / elapsed:,.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Storage report for keeping raw events in their own collection.
+
+Compares the BSON size of alerts with an embedded rawEvent against
+reference-only alerts plus one raw_events document per distinct event.
+
+    python -m benchmarks.bench_raw_event_storage --events 200000
+    python -m benchmarks.bench_raw_event_storage --log-folder /path/to/logs
+"""
+import argparse
+from datetime import datetime
+
+import bson
+
+from app.analyzer import detect_suspicious_events
+from app.scanner import read_cloudtrail_logs
+from app.utils import event_key
+from benchmarks.synthetic import generate_events
+
+
+def measure(events):
+    alerts = detect_suspicious_events(events)
+    now = datetime.utcnow()
+
+    embedded = 0
+    referenced = 0
+    raw_events = {}
+
+    for alert in alerts:
+        key = event_key(alert["rawEvent"])
+        doc = {**alert, "ingestedAt": now, "scanId": "x" * 36, "eventKey": key}
+        embedded += len(bson.encode(doc))
+
+        raw_event = doc.pop("rawEvent")
+        doc["rawEventId"] = key
+        referenced += len(bson.encode(doc))
+        raw_events.setdefault(key, raw_event)
+
+    raw_bytes = sum(
+        len(bson.encode({"_id": key, "event": event, "firstSeen": now}))
+        for key, event in raw_events.items()
+    )
+    return len(alerts), len(raw_events), embedded, referenced, raw_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--log-folder", help="measure a real log folder instead of synthetic events")
+    args = parser.parse_args()
+
+    if args.log_folder:
+        events = read_cloudtrail_logs(args.log_folder)
+    else:
+        # Root activity overlapping IAM changes is what produces shared raw events
+        events = generate_events(args.events, suspicious_ratio=0.2, root_ratio=0.2)
+
+    alerts, distinct, embedded, referenced, raw_bytes = measure(events)
+    split = referenced + raw_bytes
+    print(f"alerts={alerts} distinct_raw_events={distinct}")
+    print(
+        f"alerts collection: embedded={embedded:,} referenced={referenced:,} "
+        f"({1 - referenced / max(embedded, 1):.1%} smaller)"
+    )
+    print(
+        f"total incl. raw_events: embedded={embedded:,} split={split:,} "
+        f"saved={embedded - split:,} ({(embedded - split) / max(embedded, 1):.1%})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Throughput benchmark for app.aws_ingestion against an in-memory S3 stand-in.
+
+    python -m benchmarks.bench_s3_ingestion --objects 500 --latency 0.02
+"""
+import argparse
+import time
+
+from flask import Flask
+
+from app.aws_ingestion import iter_cloudtrail_from_s3
+from app.config import Config
+from benchmarks.stub_s3 import StubS3Client
+from benchmarks.synthetic import generate_events
+
+
+def build_bucket(objects, events_per_object, latency):
+    s3 = StubS3Client(latency=latency)
+    events = generate_events(objects * events_per_object)
+    for i in range(objects):
+        key = f"AWSLogs/123456789012/CloudTrail/us-east-1/2024/12/10/file_{i:06d}.json.gz"
+        s3.put_log_file(key, events[i * events_per_object:(i + 1) * events_per_object])
+    return s3
+
+
+def run(app, s3, fetch_workers, parse_processes=0):
+    """Return (objects/sec, events/sec, event count) for one full read."""
+    app.config.update(S3_FETCH_WORKERS=fetch_workers, S3_PARSE_PROCESSES=parse_processes)
+    with app.app_context():
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_cloudtrail_from_s3(s3))
+        elapsed = time.perf_counter() - start
+    return len(s3.objects) / elapsed, count / elapsed, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--objects", type=int, default=500)
+    parser.add_argument("--events-per-object", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--parse-processes", type=int, default=0)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(CLOUDTRAIL_S3_BUCKET="bench-bucket", CLOUDTRAIL_S3_PREFIX="")
+    s3 = build_bucket(args.objects, args.events_per_object, args.latency)
+
+    for workers in args.workers:
+        objects_rate, events_rate, count = run(app, s3, workers, args.parse_processes)
+        print(
+            f"fetch_workers={workers:<3} parse_processes={args.parse_processes} "
+            f"events={count} objects/sec={objects_rate:,.0f} events/sec={events_rate:,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
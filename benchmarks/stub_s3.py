@@ -0,0 +1,77 @@
+import gzip
+import io
+import json
+import time
+
+
+class _StubBody:
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, *args):
+        return self._stream.read(*args)
+
+
+class _StubPaginator:
+    def __init__(self, client):
+        self._client = client
+
+    def paginate(self, Bucket, Prefix="", StartAfter="", Delimiter=None, PageSize=1000, **kwargs):
+        self._client.list_calls += 1
+        keys = sorted(
+            k for k in self._client.objects
+            if k.startswith(Prefix) and k > StartAfter
+        )
+
+        if Delimiter:
+            contents, common = [], []
+            for key in keys:
+                rest = key[len(Prefix):]
+                if Delimiter in rest:
+                    sub = Prefix + rest.split(Delimiter, 1)[0] + Delimiter
+                    if sub not in common:
+                        common.append(sub)
+                else:
+                    contents.append(key)
+            yield {
+                "Contents": [self._client.describe(k) for k in contents],
+                "CommonPrefixes": [{"Prefix": p} for p in common],
+            }
+            return
+
+        for i in range(0, len(keys), PageSize):
+            yield {"Contents": [self._client.describe(k) for k in keys[i:i + PageSize]]}
+
+
+class StubS3Client:
+    """
+    In-memory stand-in for a boto3 S3 client, supporting the calls the
+    ingestion code makes. `latency` (seconds) is added to every get_object
+    to model network round trips.
+    """
+
+    def __init__(self, latency=0.0):
+        self.objects = {}
+        self.latency = latency
+        self.list_calls = 0
+        self.get_calls = 0
+
+    def put_log_file(self, key, records, gz=True):
+        data = json.dumps({"Records": records}).encode("utf-8")
+        if gz:
+            data = gzip.compress(data)
+        self.objects[key] = (data, time.time())
+
+    def describe(self, key):
+        data, modified = self.objects[key]
+        return {"Key": key, "Size": len(data), "LastModified": modified}
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return _StubPaginator(self)
+
+    def get_object(self, Bucket, Key):
+        self.get_calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {"Body": _StubBody(self.objects[Key][0])}
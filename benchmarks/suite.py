@@ -0,0 +1,239 @@
+"""
+Benchmark suite for the scan hot paths, with stored baselines to catch
+regressions:
+
+  read_cloudtrail_logs       parse a synthetic log tree (plain + gzipped)
+  detect_suspicious_events   run the rules over an in-memory event list
+  detect_compact             the scan pipeline's detection (_detect's default
+                             path: CompactAlerts plus the window rules)
+  serialize_alert            _serialize_alert over stored-shape alerts
+  encode_alerts_inline       _encode_alerts (what /api/alerts sends), playbooks
+                             inline in each alert
+  encode_alerts_table        _encode_alerts with playbooks as a side table
+  store_alerts               bulk-store alerts into MongoDB
+
+    python -m benchmarks.suite                                  # mongomock
+    python -m benchmarks.suite --mongo-uri mongodb://localhost  # local mongod
+    python -m benchmarks.suite --save benchmarks/baselines/mine.json
+    python -m benchmarks.suite --compare benchmarks/baselines/mine.json
+
+Each case runs --rounds timed rounds after one warm-up; setup (fresh
+data, empty collections) is not timed. --compare exits with status 1 if
+any case's median is more than --max-regression slower than the
+baseline's. Baselines are only comparable on the same machine and
+parameters. Against mongomock, store_alerts mostly measures mongomock
+itself; it still catches regressions in the batching/bookkeeping around
+the writes, but use a local mongod for real numbers.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from flask import Flask
+
+from app.analyzer import detect_suspicious_events
+from app.config import Config
+from app.db import ensure_indexes, get_db, init_db
+from app.pipeline import _detect
+from app.routes.api import _encode_alerts, _serialize_alert
+from app.scanner import read_cloudtrail_logs
+from app.utils import event_key, store_alerts
+from benchmarks.synthetic import generate_events, write_log_archive
+
+# Collections store_alerts writes to, emptied before each round
+_STORE_COLLECTIONS = ("alerts", "raw_events", "alert_stats", "cache_state")
+
+
+def _build_app(mongo_uri):
+    """Minimal app for store_alerts: real MongoDB if a URI is given, else mongomock."""
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        MONGO_URI=mongo_uri or "mongodb://localhost",
+        MONGO_DB_NAME=f"cloudtrail_bench_{os.getpid()}",
+    )
+    init_db(app)
+
+    if not mongo_uri:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed: pip install mongomock, or pass --mongo-uri")
+        app.extensions["mongo"]["client"] = mongomock.MongoClient()
+
+    ensure_indexes(app)
+    return app
+
+
+def _stored_shape(alerts):
+    """Alerts as list_alerts reads them back: ObjectId, datetime, rawEventId."""
+    now = datetime.utcnow()
+    docs = []
+    for alert in alerts:
+        doc = dict(alert)
+        raw_event = doc.pop("rawEvent")
+        doc.update(_id=ObjectId(), ingestedAt=now, scanId="bench",
+                   eventKey=event_key(raw_event), rawEventId=event_key(raw_event))
+        docs.append(doc)
+    return docs
+
+
+def _time_case(body, setup, rounds):
+    """Run one warm-up and `rounds` timed calls of body(setup())."""
+    body(setup())
+    timings = []
+    for _ in range(rounds):
+        arg = setup()
+        start = time.perf_counter()
+        body(arg)
+        timings.append(time.perf_counter() - start)
+    return {
+        "rounds": rounds,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+        "stddev": statistics.stdev(timings) if rounds > 1 else 0.0,
+    }
+
+
+def run_suite(args):
+    """Return {case: stats} for every benchmark case."""
+    results = {}
+    events = generate_events(args.events, seed=args.seed)
+    alerts = detect_suspicious_events(events)
+
+    with tempfile.TemporaryDirectory() as root:
+        written = write_log_archive(root, args.files, args.events // args.files, seed=args.seed)
+        results["read_cloudtrail_logs"] = _time_case(
+            lambda folder: read_cloudtrail_logs(folder), lambda: root, args.rounds,
+        )
+        results["read_cloudtrail_logs"]["items"] = written
+
+    results["detect_suspicious_events"] = _time_case(
+        detect_suspicious_events, lambda: events, args.rounds,
+    )
+    results["detect_suspicious_events"]["items"] = len(events)
+
+    detect_app = Flask(__name__)
+    detect_app.config.from_object(Config)
+    detect_app.config["ANALYZER_BATCH_SIZE"] = 0  # per-event path, as by default
+    with detect_app.app_context():
+        results["detect_compact"] = _time_case(
+            lambda batch: list(_detect(batch)), lambda: events, args.rounds,
+        )
+    results["detect_compact"]["items"] = len(events)
+
+    docs = _stored_shape(alerts)
+    results["serialize_alert"] = _time_case(
+        lambda batch: [_serialize_alert(a) for a in batch], lambda: docs, args.rounds,
+    )
+    results["serialize_alert"]["items"] = len(docs)
+
+    for layout in ("inline", "table"):
+        case = f"encode_alerts_{layout}"
+        results[case] = _time_case(
+            lambda batch, layout=layout: _encode_alerts(batch, layout), lambda: docs, args.rounds,
+        )
+        results[case]["items"] = len(docs)
+
+    app = _build_app(args.mongo_uri)
+    with app.app_context():
+        db = get_db()
+
+        def fresh_alerts():
+            for name in _STORE_COLLECTIONS:
+                db[name].delete_many({})
+            return [dict(a, scanId="bench") for a in copy.deepcopy(to_store)]
+
+        to_store = alerts[:args.store_alerts]
+        try:
+            results["store_alerts"] = _time_case(store_alerts, fresh_alerts, args.rounds)
+            results["store_alerts"]["items"] = len(to_store)
+        finally:
+            if args.mongo_uri:
+                db.client.drop_database(db.name)
+
+    return results
+
+
+def compare(results, baseline, max_regression):
+    """Return [(case, baseline median, median, ratio)] for regressed cases."""
+    regressions = []
+    for case, stats in results.items():
+        before = baseline["results"].get(case)
+        if before is None:
+            continue
+        ratio = stats["median"] / before["median"]
+        if ratio > 1 + max_regression:
+            regressions.append((case, before["median"], stats["median"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--store-alerts", type=int, default=500,
+                        help="alerts stored per store_alerts round (mongomock upserts scale quadratically)")
+    parser.add_argument("--mongo-uri", help="benchmark store_alerts against this server (default: mongomock)")
+    parser.add_argument("--save", metavar="PATH", help="write the results as a baseline")
+    parser.add_argument("--compare", metavar="PATH", help="baseline to check the results against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed median slowdown vs the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    print(f"{'case':<26} {'median':>10} {'min':>10} {'stddev':>10} {'items/s':>14}")
+    for case, stats in results.items():
+        print(
+            f"{case:<26} {stats['median'] * 1000:>8.1f}ms {stats['min'] * 1000:>8.1f}ms "
+            f"{stats['stddev'] * 1000:>8.1f}ms {stats['items'] / stats['median']:>14,.0f}"
+        )
+
+    params = {
+        "events": args.events, "files": args.files, "rounds": args.rounds,
+        "store_alerts": args.store_alerts, "seed": args.seed,
+        "mongo": "mongod" if args.mongo_uri else "mongomock",
+    }
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": datetime.utcnow().isoformat(timespec="seconds"),
+                "machine": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(),
+                },
+                "params": params,
+                "results": results,
+            }, f, indent=2)
+        print(f"baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != params:
+            print(f"warning: baseline params {baseline.get('params')} differ from this run's {params}")
+        regressions = compare(results, baseline, args.max_regression)
+        for case, before, after, ratio in regressions:
+            print(f"REGRESSION {case}: median {before * 1000:.1f}ms -> {after * 1000:.1f}ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions beyond {args.max_regression:.0%} vs {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Synthetic CloudTrail data for benchmarks.
+
+    python -m benchmarks.synthetic --out /tmp/ct --files 100 --events-per-file 1000 \
+        --root-ratio 0.02 --failed-login-ratio 0.01 --public-acl-ratio 0.005 --gzip-ratio 0.5
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+
+# (eventSource, eventName) pairs drawn for ordinary, non-suspicious traffic
+_BENIGN = [
+    ("ec2.amazonaws.com", "DescribeInstances"),
+    ("ec2.amazonaws.com", "RunInstances"),
+    ("s3.amazonaws.com", "GetObject"),
+    ("s3.amazonaws.com", "ListBuckets"),
+    ("iam.amazonaws.com", "ListUsers"),
+    ("sts.amazonaws.com", "AssumeRole"),
+    ("kms.amazonaws.com", "Decrypt"),
+    ("signin.amazonaws.com", "ConsoleLogin"),
+    ("cloudtrail.amazonaws.com", "LookupEvents"),
+    ("lambda.amazonaws.com", "Invoke"),
+]
+
+# Events that trigger one of the detection rules
+_SUSPICIOUS = [
+    ("signin.amazonaws.com", "ConsoleLogin"),
+    ("cloudtrail.amazonaws.com", "StopLogging"),
+    ("iam.amazonaws.com", "AttachUserPolicy"),
+    ("iam.amazonaws.com", "CreateAccessKey"),
+    ("ec2.amazonaws.com", "AuthorizeSecurityGroupIngress"),
+    ("s3.amazonaws.com", "PutBucketAcl"),
+    ("kms.amazonaws.com", "ScheduleKeyDeletion"),
+]
+
+_REGIONS = ["us-east-1", "us-west-2", "eu-west-1", "ap-southeast-2"]
+_USERS = ["alice", "bob", "carol", "dave", "svc-deploy"]
+
+
+def _benign_picker(source_weights):
+    """
+    Return a function drawing a benign (eventSource, eventName) pair,
+    with sources weighted by `source_weights` ({eventSource: weight};
+    unlisted sources get weight 0). None keeps the uniform mix.
+    Raises ValueError if no benign source is left with a positive weight.
+    """
+    if not source_weights:
+        return lambda rng: rng.choice(_BENIGN)
+
+    pairs = [p for p in _BENIGN if source_weights.get(p[0], 0) > 0]
+    if not pairs:
+        raise ValueError("no benign source has a positive weight")
+    weights = [source_weights[p[0]] for p in pairs]
+    return lambda rng: rng.choices(pairs, weights)[0]
+
+
+def generate_event(rng, suspicious_ratio=0.05, root_ratio=0.01,
+                   failed_login_ratio=0.0, public_acl_ratio=0.0, pick_benign=None):
+    """
+    Return one CloudTrail-shaped event dict.
+    - suspicious_ratio: share drawn from the rule-triggering event types
+    - root_ratio: share made by the root user (any event type)
+    - failed_login_ratio / public_acl_ratio: extra share forced to be a
+      failed console login / a public PutBucketAcl
+    - pick_benign: see _benign_picker (source mix of benign traffic)
+    """
+    suspicious = rng.random() < suspicious_ratio
+    if suspicious:
+        source, name = rng.choice(_SUSPICIOUS)
+    elif failed_login_ratio and rng.random() < failed_login_ratio:
+        source, name, suspicious = "signin.amazonaws.com", "ConsoleLogin", True
+    elif public_acl_ratio and rng.random() < public_acl_ratio:
+        source, name, suspicious = "s3.amazonaws.com", "PutBucketAcl", True
+    else:
+        source, name = pick_benign(rng) if pick_benign else rng.choice(_BENIGN)
+    root = rng.random() < root_ratio
+
+    event = {
+        "eventVersion": "1.08",
+        "userIdentity": {
+            "type": "Root" if root else "IAMUser",
+            "userName": "root" if root else rng.choice(_USERS),
+        },
+        "eventTime": "2024-12-%02dT%02d:%02d:%02dZ" % (
+            rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59)
+        ),
+        "eventSource": source,
+        "eventName": name,
+        "awsRegion": rng.choice(_REGIONS),
+        "sourceIPAddress": "10.%d.%d.%d" % (
+            rng.randint(0, 255), rng.randint(0, 255), rng.randint(1, 254)
+        ),
+        "eventID": "%032x" % rng.getrandbits(128),
+        "requestParameters": {},
+    }
+
+    if name == "ConsoleLogin":
+        event["responseElements"] = {
+            "ConsoleLogin": "Failure" if suspicious else "Success"
+        }
+    elif name == "AuthorizeSecurityGroupIngress":
+        event["requestParameters"] = {
+            "groupId": "sg-0123456789",
+            "ipPermissions": [{
+                "ipProtocol": "tcp", "fromPort": 22, "toPort": 22,
+                "ipRanges": [{"cidrIp": "0.0.0.0/0"}],
+            }],
+        }
+    elif name == "PutBucketAcl":
+        event["requestParameters"] = {
+            "bucketName": "example-bucket",
+            "AccessControlPolicy": {"AccessControlList": {"Grant": [{
+                "Grantee": {"URI": "http://acs.amazonaws.com/groups/global/AllUsers"},
+                "Permission": "READ",
+            }]}},
+        }
+
+    return event
+
+
+def generate_events(count, seed=0, source_weights=None, **kwargs):
+    """
+    Return a list of `count` synthetic CloudTrail events.
+    Keyword arguments are generate_event's mix settings; source_weights
+    is passed to _benign_picker.
+    """
+    rng = random.Random(seed)
+    if source_weights:
+        kwargs["pick_benign"] = _benign_picker(source_weights)
+    return [generate_event(rng, **kwargs) for _ in range(count)]
+
+
+def write_log_archive(root, files, events_per_file, gzip_ratio=0.5, seed=0, **mix):
+    """
+    Write `files` CloudTrail log files under a YYYY/MM/DD tree in `root`,
+    `gzip_ratio` of them as .json.gz (spread evenly), the rest as .json.
+    `mix` is passed to generate_events. Returns the number of events written.
+    """
+    events = generate_events(files * events_per_file, seed=seed, **mix)
+    gzipped = 0
+    for i in range(files):
+        day_dir = os.path.join(root, "2024", "12", "%02d" % (i % 28 + 1))
+        os.makedirs(day_dir, exist_ok=True)
+        payload = json.dumps({"Records": events[i * events_per_file:(i + 1) * events_per_file]})
+
+        if gzipped < round((i + 1) * gzip_ratio):
+            gzipped += 1
+            with gzip.open(os.path.join(day_dir, f"log_{i:06d}.json.gz"), "wt") as f:
+                f.write(payload)
+        else:
+            with open(os.path.join(day_dir, f"log_{i:06d}.json"), "w") as f:
+                f.write(payload)
+    return len(events)
+
+
+def _source_weights(values):
+    """Parse ["ec2.amazonaws.com=5", ...] into {source: weight}."""
+    weights = {}
+    for value in values or ():
+        source, _, weight = value.partition("=")
+        weights[source] = float(weight or 1)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory to write the log tree into")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--events-per-file", type=int, default=1000)
+    parser.add_argument("--gzip-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--suspicious-ratio", type=float, default=0.05)
+    parser.add_argument("--root-ratio", type=float, default=0.01)
+    parser.add_argument("--failed-login-ratio", type=float, default=0.0)
+    parser.add_argument("--public-acl-ratio", type=float, default=0.0)
+    parser.add_argument("--source-weight", action="append", metavar="SOURCE=WEIGHT",
+                        help="weight of an eventSource in benign traffic (repeatable)")
+    args = parser.parse_args()
+
+    try:
+        count = write_log_archive(
+            args.out, args.files, args.events_per_file,
+            gzip_ratio=args.gzip_ratio,
+            seed=args.seed,
+            suspicious_ratio=args.suspicious_ratio,
+            root_ratio=args.root_ratio,
+            failed_login_ratio=args.failed_login_ratio,
+            public_acl_ratio=args.public_acl_ratio,
+            source_weights=_source_weights(args.source_weight),
+        )
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(f"wrote {count} events in {args.files} files to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Offline batch scanner for backfills: runs the same read -> detect ->
+store pipeline as POST /api/scan, from the command line.
+
+    python scan.py local --folder /data/cloudtrail --workers 8
+    python scan.py s3 --prefix AWSLogs/123456789012/ --since 2024-01-01 --until 2024-02-01
+    python scan.py local --folder /data/cloudtrail --output alerts.ndjson.gz
+
+Alerts are stored in MongoDB (MONGO_URI) like a dashboard scan, or with
+--output written to a newline-delimited JSON file (gzipped for .gz, "-"
+for stdout) without connecting to MongoDB at all. Other settings come
+from the environment as for the web app. Progress and throughput are
+printed to stderr.
+"""
+import argparse
+import functools
+import gzip
+import sys
+import uuid
+
+from app import create_app
+from app.pipeline import ScanProgress, run_local_scan, run_s3_scan
+from app.timerange import TimeRange, parse_date
+from app.utils import write_alerts_ndjson
+
+
+def _print_progress(progress):
+    data = progress.snapshot()
+    print(
+        f"[{data['elapsedSeconds']:9.1f}s] files={data['filesRead']} events={data['eventsProcessed']} "
+        f"alerts={data['alertsStored']} duplicates={data['duplicatesSkipped']} "
+        f"replayed={data['eventsReplayed']} events/sec={data['eventsPerSecond']:,.0f}",
+        file=sys.stderr, flush=True,
+    )
+
+
+def _open_output(path):
+    if path == "-":
+        return sys.stdout.buffer
+    if path.endswith(".gz"):
+        return gzip.open(path, "wb")
+    return open(path, "wb")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", choices=("local", "s3"))
+    parser.add_argument("--folder", help="local log folder (default LOCAL_LOG_FOLDER)")
+    parser.add_argument("--bucket", help="S3 bucket (default CLOUDTRAIL_S3_BUCKET)")
+    parser.add_argument("--prefix", help="S3 key prefix (default CLOUDTRAIL_S3_PREFIX)")
+    parser.add_argument("--workers", type=int,
+                        help="local: worker processes (LOCAL_SCAN_WORKERS); s3: download threads (S3_FETCH_WORKERS)")
+    parser.add_argument("--batch-size", type=int, help="alerts per write (STORE_BATCH_SIZE)")
+    parser.add_argument("--since", type=parse_date, help="only events at or after this UTC time, YYYY-MM-DD[THH:MM]")
+    parser.add_argument("--until", type=parse_date, help="only events before this UTC time")
+    parser.add_argument("--output", help="write alerts to this NDJSON file instead of MongoDB")
+    parser.add_argument("--resume", action="store_true",
+                        help="s3: only read objects after the saved checkpoints, and advance them")
+    parser.add_argument("--scan-id", help="scanId tagged on the alerts (default: a new UUID)")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    if args.resume and (args.source != "s3" or args.output or args.since or args.until):
+        parser.error("--resume only applies to s3 scans stored in MongoDB, without --since/--until")
+    try:
+        args.time_range = TimeRange(args.since, args.until) if args.since or args.until else None
+    except ValueError as exc:
+        parser.error(str(exc))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    overrides = {}
+    if args.workers:
+        overrides["LOCAL_SCAN_WORKERS" if args.source == "local" else "S3_FETCH_WORKERS"] = args.workers
+    if args.batch_size:
+        overrides["STORE_BATCH_SIZE"] = args.batch_size
+    if args.bucket:
+        overrides["CLOUDTRAIL_S3_BUCKET"] = args.bucket
+    if args.prefix is not None:
+        overrides["CLOUDTRAIL_S3_PREFIX"] = args.prefix
+    if args.output:
+        # Nothing touches MongoDB; the replay guard tracks what was stored there
+        overrides.update(MONGO_ENSURE_INDEXES=False, SCAN_JOB_RECOVERY=False, REPLAY_GUARD_ENABLED=False)
+
+    app = create_app(overrides)
+    scan_id = args.scan_id or str(uuid.uuid4())
+    progress = ScanProgress(on_update=_print_progress, interval=args.progress_interval)
+
+    with app.app_context():
+        output = _open_output(args.output) if args.output else None
+        store = functools.partial(write_alerts_ndjson, f=output) if output else None
+        try:
+            if args.source == "local":
+                result = run_local_scan(
+                    scan_id, progress, log_folder=args.folder, time_range=args.time_range, store=store,
+                )
+            else:
+                result = run_s3_scan(
+                    scan_id, progress, time_range=args.time_range, store=store, checkpoints=args.resume,
+                )
+        finally:
+            if output is not None and output is not sys.stdout.buffer:
+                output.close()
+
+    _print_progress(progress)
+    print(
+        f"scanId={scan_id} alerts={result['inserted']} duplicates={result['duplicates']} "
+        f"-> {args.output or 'MongoDB'}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 let lastScanId = null;      // track latest scan
-let allAlerts = [];         // all alerts for current view (latest scan or filters)
+let allAlerts = [];         // alerts loaded so far for current view (latest scan or filters)
+let nextCursor = null;      // keyset cursor for the next server page (null = all loaded)
+let totalAlerts = 0;        // total matches reported by the server
 let currentPage = 1;        // current page index (1-based)
 let rowsPerPage = 50;       // default rows per page
+let playbooks = {};         // rule -> playbook, sent once per page (playbooks=table)
+
+const FETCH_PAGE_SIZE = 200; // alerts fetched per request
+// List view only needs these; rawEvent is fetched on demand in the details modal
+const LIST_FIELDS = "rule,severity,user,sourceIP,eventName,awsRegion,eventTime,scanId";
 
 function showOverlay() {
   const overlay = document.getElementById("scan-overlay");
@@ -25,6 +32,8 @@ function setLastUpdated() {
  */
 function resetDashboardInitial() {
   allAlerts = [];
+  nextCursor = null;
+  totalAlerts = 0;
   currentPage = 1;
 
   // Reset counters to 0
@@ -59,8 +68,63 @@ function resetDashboardInitial() {
   }
 }
 
+const SCAN_POLL_INTERVAL_MS = 1000;
+const SCAN_WAIT_TIMEOUT_MS = 60 * 60 * 1000; // give up on the overlay after an hour
+const SCAN_POLL_MAX_ERRORS = 5;              // consecutive failed polls before giving up
+const LIVE_RENDER_INTERVAL_MS = 500; // batch pushed alerts into one re-render
+
+let alertStream = null;     // EventSource on /api/alerts/stream
+let pendingLiveAlerts = []; // pushed alerts not yet merged into the table
+let liveRenderTimer = null;
+
+function sleep(ms) {
+  return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+function describeProgress(job) {
+  const p = job.progress || {};
+  return `Files: ${p.filesRead || 0} · Events: ${p.eventsProcessed || 0} · ` +
+    `Alerts: ${p.alertsStored || 0} · ${Math.round(p.eventsPerSecond || 0)} events/s`;
+}
+
+/**
+ * Poll the scan job status endpoint until the job finishes.
+ * Throws if the job is unknown, the status endpoint keeps failing,
+ * or the job is still not done after SCAN_WAIT_TIMEOUT_MS.
+ */
+async function waitForScan(scanId) {
+  const subtextEl = document.querySelector(".scan-overlay-subtext");
+  const deadline = Date.now() + SCAN_WAIT_TIMEOUT_MS;
+  let errors = 0;
+
+  while (Date.now() < deadline) {
+    let response = null;
+    try {
+      response = await fetch(`/api/scans/${scanId}`);
+    } catch (error) {
+      console.error(error);
+    }
+
+    if (response && response.status === 404) throw new Error("scan not found");
+    if (response && response.ok) {
+      errors = 0;
+      const job = await response.json();
+      if (subtextEl) subtextEl.textContent = describeProgress(job);
+      if (job.status === "completed" || job.status === "failed") return job;
+    } else if (++errors >= SCAN_POLL_MAX_ERRORS) {
+      throw new Error("scan status unavailable");
+    }
+
+    await sleep(SCAN_POLL_INTERVAL_MS);
+  }
+  throw new Error("timed out waiting for the scan to finish");
+}
+
 async function callScan(endpoint) {
   const resultEl = document.getElementById("scan-result");
+  const subtextEl = document.querySelector(".scan-overlay-subtext");
+  const defaultSubtext = subtextEl ? subtextEl.textContent : "";
+
   resultEl.textContent = "Scanning logs...";
   showOverlay();
   try {
@@ -71,18 +135,34 @@ async function callScan(endpoint) {
 
     // remember which scan this was
     lastScanId = data.scanId || null;
+    if (!lastScanId) throw new Error(data.error || "Scan was not queued");
+    if (isStreamOpen()) await loadAlerts(); // empty view for the new scan, then fill live
 
-    resultEl.textContent = `Scan complete. Alerts detected: ${data.alerts_detected}`;
-    await loadAlerts();
+    const job = await waitForScan(lastScanId);
+    if (job.status === "failed") {
+      resultEl.textContent = `Scan failed: ${job.error || "unknown error"}`;
+    } else {
+      resultEl.textContent = `Scan complete. New alerts: ${job.alerts_detected}` +
+        (job.duplicates ? ` (${job.duplicates} already stored, skipped)` : "") +
+        (job.progress && job.progress.eventsReplayed
+          ? ` (${job.progress.eventsReplayed} events already analyzed by an earlier scan)` : "");
+    }
+    // New alerts were pushed live while the scan ran; alerts it found
+    // already stored were not, so reload for those (or without a stream)
+    if (!isStreamOpen() || job.duplicates) await loadAlerts();
   } catch (error) {
     console.error(error);
-    resultEl.textContent = "Error while scanning logs.";
+    resultEl.textContent = `Error while scanning logs: ${error.message}`;
   } finally {
     hideOverlay();
+    if (subtextEl) subtextEl.textContent = defaultSubtext;
   }
 }
 
-function buildAlertsUrl() {
+/**
+ * Filter params shared by /api/alerts and /api/alerts/stats.
+ */
+function buildFilterParams() {
   const severity = document.getElementById("severity-filter").value;
   const hours = document.getElementById("hours-filter").value;
 
@@ -93,8 +173,17 @@ function buildAlertsUrl() {
   // restrict to last scan if we have an ID
   if (lastScanId) params.append("scan_id", lastScanId);
 
-  const query = params.toString();
-  return query ? "/api/alerts?" + query : "/api/alerts";
+  return params;
+}
+
+function buildAlertsUrl(cursor = null) {
+  const params = buildFilterParams();
+  params.append("limit", FETCH_PAGE_SIZE);
+  params.append("fields", LIST_FIELDS);
+  params.append("playbooks", "table");
+  if (cursor) params.append("cursor", cursor);
+
+  return "/api/alerts?" + params.toString();
 }
 
 function animateCount(element, value) {
@@ -114,44 +203,55 @@ function animateCount(element, value) {
   requestAnimationFrame(frame);
 }
 
-function updateSummaryCards(alerts) {
+/**
+ * Fill the summary cards from the server-side counters, so they cover
+ * every matching alert, not just the pages loaded so far.
+ */
+async function updateSummaryCards(animate = true) {
   const totalEl = document.getElementById("total-alerts");
   const highEl = document.getElementById("high-alerts");
   const medEl = document.getElementById("medium-alerts");
   const lowEl = document.getElementById("low-alerts");
   const countEl = document.getElementById("alert-count");
 
-  let high = 0, medium = 0, low = 0;
+  const response = await fetch("/api/alerts/stats?" + buildFilterParams().toString());
+  const stats = await response.json();
+  const bySeverity = stats.bySeverity || {};
 
-  alerts.forEach(a => {
-    if (a.severity === "Critical" || a.severity === "High") {
-      high++;
-    } else if (a.severity === "Medium") {
-      medium++;
-    } else if (a.severity === "Low") {
-      low++;
-    }
-  });
+  const high = (bySeverity.Critical || 0) + (bySeverity.High || 0);
+  const medium = bySeverity.Medium || 0;
+  const low = bySeverity.Low || 0;
 
-  if (totalEl) animateCount(totalEl, alerts.length);
-  if (highEl) animateCount(highEl, high);
-  if (medEl) animateCount(medEl, medium);
-  if (lowEl) animateCount(lowEl, low);
+  const show = animate ? animateCount : (el, value) => { el.textContent = value; };
+  if (totalEl) show(totalEl, stats.total || 0);
+  if (highEl) show(highEl, high);
+  if (medEl) show(medEl, medium);
+  if (lowEl) show(lowEl, low);
 
-  if (countEl) countEl.textContent = alerts.length;
+  if (countEl) countEl.textContent = stats.total || 0;
 }
 
-function showDetailsModal(alert) {
+async function showDetailsModal(alert) {
   const modal = document.getElementById("details-modal");
   const pre = document.getElementById("modal-json");
   const playbookEl = document.getElementById("modal-playbook");
 
+  // List rows omit rawEvent; fetch the full alert for the evidence view
+  if (!alert.rawEvent && alert._id) {
+    try {
+      const response = await fetch(`/api/alerts/${alert._id}`);
+      if (response.ok) alert = await response.json();
+    } catch (error) {
+      console.error(error);
+    }
+  }
+
   const pretty = JSON.stringify(alert.rawEvent || alert, null, 2);
   pre.textContent = pretty;
 
   // Playbook rendering (if present)
   if (playbookEl) {
-    const pb = alert.playbook;
+    const pb = alert.playbook || playbooks[alert.rule];
     if (pb) {
       const actions = (pb.actions || []).map((a, idx) => `${idx + 1}. ${a}`).join("\n");
       playbookEl.textContent = `${pb.title}\nRisk: ${pb.risk}\n\nRecommended Actions:\n${actions}`;
@@ -195,7 +295,7 @@ function renderAlertsTable() {
   const tableBody = document.querySelector("#alerts-table tbody");
   tableBody.innerHTML = "";
 
-  const total = allAlerts.length;
+  const total = Math.max(totalAlerts, allAlerts.length);
 
   if (!total) {
     const row = document.createElement("tr");
@@ -213,7 +313,7 @@ function renderAlertsTable() {
   if (currentPage > totalPages) currentPage = totalPages;
 
   const startIndex = (currentPage - 1) * rowsPerPage;
-  const endIndex = Math.min(startIndex + rowsPerPage, total);
+  const endIndex = Math.min(startIndex + rowsPerPage, allAlerts.length);
   const pageAlerts = allAlerts.slice(startIndex, endIndex);
 
   pageAlerts.forEach(alert => {
@@ -305,10 +405,7 @@ function updatePaginationControls(startIndex = 0, endIndex = 0, total = 0, total
       if (p === currentPage) {
         btn.classList.add("active");
       }
-      btn.addEventListener("click", () => {
-        currentPage = p;
-        renderAlertsTable();
-      });
+      btn.addEventListener("click", () => goToPage(p));
       pagesContainer.appendChild(btn);
     }
 
@@ -321,7 +418,42 @@ function updatePaginationControls(startIndex = 0, endIndex = 0, total = 0, total
 }
 
 /**
- * Fetch alerts from backend, then update summary + render table.
+ * Fetch the next server page of alerts (keyset cursor) and append it.
+ */
+async function fetchAlertsPage() {
+  const response = await fetch(buildAlertsUrl(nextCursor));
+  const page = await response.json();
+  Object.assign(playbooks, page.playbooks);
+
+  const total = response.headers.get("X-Total-Count");
+  if (total !== null) totalAlerts = parseInt(total, 10) || 0;
+  nextCursor = response.headers.get("X-Next-Cursor");
+
+  allAlerts = allAlerts.concat(page.alerts);
+}
+
+/**
+ * Make sure every row of the given page is loaded, fetching lazily.
+ */
+async function ensurePageLoaded(page) {
+  while (allAlerts.length < page * rowsPerPage && nextCursor) {
+    await fetchAlertsPage();
+  }
+}
+
+async function goToPage(page) {
+  try {
+    await ensurePageLoaded(page);
+  } catch (error) {
+    console.error(error);
+  }
+  currentPage = page;
+  renderAlertsTable();
+}
+
+/**
+ * Fetch the first page of alerts from backend, then update summary + render table.
+ * Later pages are fetched on demand as the user pages through the table.
  * If no scan has run yet, we do nothing (keep the "no scan" state).
  */
 async function loadAlerts() {
@@ -332,14 +464,13 @@ async function loadAlerts() {
   }
 
   try {
-    const url = buildAlertsUrl();
-    const response = await fetch(url);
-    const alerts = await response.json();
-
-    allAlerts = alerts;
+    allAlerts = [];
+    nextCursor = null;
+    totalAlerts = 0;
     currentPage = 1;
 
-    updateSummaryCards(allAlerts);
+    await Promise.all([fetchAlertsPage(), updateSummaryCards()]);
+
     setLastUpdated();
     renderAlertsTable();
   } catch (error) {
@@ -347,6 +478,59 @@ async function loadAlerts() {
   }
 }
 
+function isStreamOpen() {
+  return alertStream !== null && alertStream.readyState === EventSource.OPEN;
+}
+
+/**
+ * Does a pushed alert belong in the current view (latest scan + filters)?
+ */
+function matchesCurrentView(alert) {
+  const severity = document.getElementById("severity-filter").value;
+  if (!lastScanId || alert.scanId !== lastScanId) return false;
+  return !severity || alert.severity === severity;
+}
+
+/**
+ * Merge pushed alerts into the table (newest first) and refresh the cards.
+ */
+async function flushLiveAlerts() {
+  liveRenderTimer = null;
+  // Skip alerts a concurrent page fetch already returned
+  const loaded = new Set(allAlerts.map(a => a._id));
+  const fresh = pendingLiveAlerts.filter(a => matchesCurrentView(a) && !loaded.has(a._id));
+  pendingLiveAlerts = [];
+  if (!fresh.length) return;
+
+  allAlerts = fresh.reverse().concat(allAlerts);
+  totalAlerts += fresh.length;
+  renderAlertsTable();
+  setLastUpdated();
+  try {
+    await updateSummaryCards(false);
+  } catch (error) {
+    console.error(error);
+  }
+}
+
+/**
+ * Subscribe to newly stored alerts instead of re-fetching /api/alerts.
+ * EventSource reconnects by itself; a resync event means alerts were
+ * dropped for this client, so the view is reloaded once.
+ */
+function openAlertStream() {
+  if (!window.EventSource) return;
+
+  alertStream = new EventSource("/api/alerts/stream");
+  alertStream.addEventListener("alert", (e) => {
+    pendingLiveAlerts.push(JSON.parse(e.data));
+    if (!liveRenderTimer) {
+      liveRenderTimer = setTimeout(flushLiveAlerts, LIVE_RENDER_INTERVAL_MS);
+    }
+  });
+  alertStream.addEventListener("resync", () => loadAlerts());
+}
+
 document.addEventListener("DOMContentLoaded", () => {
   document.getElementById("scan-local-btn").addEventListener("click", () => {
     callScan("/api/scan");
@@ -383,27 +567,24 @@ document.addEventListener("DOMContentLoaded", () => {
     rowsSelect.addEventListener("change", (e) => {
       const value = parseInt(e.target.value, 10);
       rowsPerPage = isNaN(value) ? 50 : value;
-      currentPage = 1;
-      renderAlertsTable();
+      goToPage(1);
     });
   }
 
   if (prevBtn) {
     prevBtn.addEventListener("click", () => {
       if (currentPage > 1) {
-        currentPage--;
-        renderAlertsTable();
+        goToPage(currentPage - 1);
       }
     });
   }
 
   if (nextBtn) {
     nextBtn.addEventListener("click", () => {
-      const total = allAlerts.length;
+      const total = Math.max(totalAlerts, allAlerts.length);
       const totalPages = Math.max(1, Math.ceil(total / rowsPerPage));
       if (currentPage < totalPages) {
-        currentPage++;
-        renderAlertsTable();
+        goToPage(currentPage + 1);
       }
     });
   }
@@ -411,4 +592,5 @@ document.addEventListener("DOMContentLoaded", () => {
   // Initial state: no scans run yet -> everything zero, nice message
   resetDashboardInitial();
   // Important: DO NOT call loadAlerts() here, to avoid loading historic DB data
+  openAlertStream();
 });
@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip("mongomock")
+
+import app.db
+from app import create_app
+
+START = datetime(2024, 12, 5)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(app.db, "_create_client", lambda config: mongomock.MongoClient())
+    flask_app = create_app({
+        "MONGO_ENSURE_INDEXES": False,
+        "SCAN_JOB_RECOVERY": False,
+        "ALERTS_CACHE_ENABLED": False,
+    })
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = "admin"
+    with flask_app.app_context():
+        yield client, app.db.get_db()
+
+
+def _alerts(count, start, rule="Root Account Activity"):
+    # Three alerts per ingestedAt, as stored by one batch
+    return [
+        {"_id": ObjectId(), "ingestedAt": start + timedelta(minutes=i // 3), "rule": rule, "severity": "High"}
+        for i in range(count)
+    ]
+
+
+def _pages(client, limit, **params):
+    pages = []
+    cursor = None
+    while True:
+        query = {"limit": limit, "playbooks": "none", **params}
+        if cursor:
+            query["cursor"] = cursor
+        response = client.get("/api/alerts", query_string=query)
+        assert response.status_code == 200
+        pages.append([alert["_id"] for alert in json.loads(response.data)])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+def _newest_first(alerts):
+    return [str(a["_id"]) for a in sorted(alerts, key=lambda a: (a["ingestedAt"], a["_id"]), reverse=True)]
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 30, 100])
+def test_pages_cover_every_alert_once(api, limit):
+    client, db = api
+    alerts = _alerts(30, START)
+    db.alerts.insert_many(alerts)
+
+    pages = _pages(client, limit)
+    assert [alert_id for page in pages for alert_id in page] == _newest_first(alerts)
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_pages_merge_archive_collections(api):
+    client, db = api
+    hot = _alerts(20, START)
+    archived = _alerts(20, START - timedelta(days=40))
+    # Same ingestedAt in both collections: ties are broken by _id across them
+    archived += _alerts(5, START)
+    db.alerts.insert_many(hot)
+    db.alerts_archive_2024_10.insert_many(archived)
+    db.alert_archives.insert_one({"_id": "2024-10", "month": datetime(2024, 10, 1), "collection": "alerts_archive_2024_10"})
+
+    pages = _pages(client, 6, fields="rule")
+    assert [alert_id for page in pages for alert_id in page] == _newest_first(hot + archived)
+
+
+def test_filters_apply_to_every_page(api):
+    client, db = api
+    alerts = _alerts(20, START) + _alerts(20, START, rule="KMS Key Deactivated")
+    db.alerts.insert_many(alerts)
+
+    pages = _pages(client, 3, rule="KMS Key Deactivated")
+    expected = _newest_first([a for a in alerts if a["rule"] == "KMS Key Deactivated"])
+    assert [alert_id for page in pages for alert_id in page] == expected
+
+
+def test_invalid_cursor_is_rejected(api):
+    client, _ = api
+    response = client.get("/api/alerts", query_string={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,103 @@
+import copy
+
+from app.analyzer import detect_suspicious_events
+from benchmarks.synthetic import generate_events
+
+
+def _reference_alerts(events):
+    """The if-chain detector the dispatch index replaced, rule for rule."""
+    alerts = []
+    for event in events:
+        event_name = event.get("eventName", "")
+        event_source = event.get("eventSource", "")
+        user_identity = event.get("userIdentity", {})
+        request_params = event.get("requestParameters", {}) or {}
+        response_elements = event.get("responseElements", {}) or {}
+        base_alert = {
+            "user": user_identity.get("userName", "Unknown"),
+            "userType": user_identity.get("type", "Unknown"),
+            "sourceIP": event.get("sourceIPAddress", "Unknown"),
+            "eventName": event_name,
+            "eventSource": event_source,
+            "eventTime": event.get("eventTime"),
+            "awsRegion": event.get("awsRegion", "Unknown"),
+            "eventId": event.get("eventID", None),
+            "rawEvent": event,
+        }
+
+        def add(rule, description, category, severity, score):
+            alerts.append({
+                **base_alert, "rule": rule, "description": description,
+                "category": category, "severity": severity, "score": score,
+            })
+
+        if event_name == "ConsoleLogin" and response_elements.get("ConsoleLogin") == "Failure":
+            add("Failed Console Login", "Console sign-in failure detected.", "Authentication", "High", 70)
+        if user_identity.get("type", "Unknown") == "Root":
+            add("Root Account Activity", "AWS root account was used.", "Account Management", "Critical", 95)
+        if event_source == "cloudtrail.amazonaws.com" and event_name in ("StopLogging", "DeleteTrail"):
+            add("CloudTrail Logging Change", "CloudTrail logging was stopped or a trail was deleted.",
+                "Monitoring Evasion", "Critical", 90)
+        if event_source == "iam.amazonaws.com" and event_name in (
+            "CreateUser", "CreateAccessKey", "AttachUserPolicy", "PutUserPolicy", "AddUserToGroup",
+        ):
+            add("IAM Privilege Change", f"IAM operation '{event_name}' may indicate privilege escalation.",
+                "Privilege Escalation", "High", 80)
+        if event_source == "ec2.amazonaws.com" and event_name in (
+            "AuthorizeSecurityGroupIngress", "RevokeSecurityGroupIngress",
+        ):
+            ip_permissions = request_params.get("ipPermissions") or request_params.get("IpPermissions")
+            if isinstance(ip_permissions, list) and any(
+                (rng.get("cidrIp") or rng.get("CidrIp")) == "0.0.0.0/0"
+                for perm in ip_permissions
+                for rng in perm.get("ipRanges", []) + perm.get("IpRanges", [])
+            ):
+                add("Security Group Open to World", "Security group rule allows access from 0.0.0.0/0.",
+                    "Network Exposure", "High", 85)
+        if event_source == "s3.amazonaws.com" and event_name in ("PutBucketAcl", "PutBucketPolicy"):
+            acl_text = str(request_params)
+            if "AllUsers" in acl_text or "AuthenticatedUsers" in acl_text:
+                add("Public S3 Bucket Configuration", "S3 bucket ACL or policy may allow public access.",
+                    "Data Exposure", "High", 85)
+        if event_source == "kms.amazonaws.com" and event_name in ("DisableKey", "ScheduleKeyDeletion"):
+            add("KMS Key Deactivated", f"KMS key operation '{event_name}' detected.", "Encryption", "Medium", 65)
+    return alerts
+
+
+def _edge_events():
+    root = {"type": "Root", "userName": "root"}
+    return [
+        # Several rules on one event, in declaration order
+        {"eventSource": "cloudtrail.amazonaws.com", "eventName": "StopLogging", "userIdentity": root},
+        {"eventSource": "iam.amazonaws.com", "eventName": "CreateUser", "userIdentity": root},
+        # Failed logins count whatever the source
+        {"eventSource": "other.amazonaws.com", "eventName": "ConsoleLogin",
+         "userIdentity": {}, "responseElements": {"ConsoleLogin": "Failure"}},
+        {"eventSource": "signin.amazonaws.com", "eventName": "ConsoleLogin",
+         "userIdentity": {}, "responseElements": None},
+        # Trigger names from another service do not fire
+        {"eventSource": "ec2.amazonaws.com", "eventName": "CreateUser", "userIdentity": {}},
+        {"eventSource": "ec2.amazonaws.com", "eventName": "RevokeSecurityGroupIngress", "userIdentity": {},
+         "requestParameters": {"IpPermissions": [{"IpRanges": [{"CidrIp": "0.0.0.0/0"}]}]}},
+        {"eventSource": "ec2.amazonaws.com", "eventName": "AuthorizeSecurityGroupIngress", "userIdentity": {},
+         "requestParameters": {"ipPermissions": [{"ipRanges": [{"cidrIp": "10.0.0.0/8"}]}]}},
+        # The public-bucket heuristic also looks at keys
+        {"eventSource": "s3.amazonaws.com", "eventName": "PutBucketPolicy", "userIdentity": {},
+         "requestParameters": {"policy": {"AuthenticatedUsers": ["s3:GetObject"]}}},
+        {"eventSource": "s3.amazonaws.com", "eventName": "PutBucketAcl", "userIdentity": {},
+         "requestParameters": None},
+        {"eventSource": "kms.amazonaws.com", "eventName": "DisableKey", "userIdentity": {}},
+        {"userIdentity": {}},
+    ]
+
+
+def test_matches_reference_detector_on_synthetic_events():
+    events = generate_events(20000, seed=7, suspicious_ratio=0.2, root_ratio=0.05)
+    expected = _reference_alerts(copy.deepcopy(events))
+    assert len(expected) > 1000
+    assert detect_suspicious_events(events) == expected
+
+
+def test_matches_reference_detector_on_edge_cases():
+    events = _edge_events()
+    assert detect_suspicious_events(events) == _reference_alerts(copy.deepcopy(events))
@@ -0,0 +1,57 @@
+import pytest
+from flask import Flask
+
+from app.aws_ingestion import _lookback_start, iter_cloudtrail_from_s3
+from benchmarks.stub_s3 import StubS3Client
+
+PARTITION = "AWSLogs/123456789012/CloudTrail/us-east-1/"
+
+
+def _key(day, time, suffix):
+    return f"{PARTITION}2024/12/{day}/123456789012_CloudTrail_us-east-1_202412{day}T{time}Z_{suffix}.json.gz"
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(CLOUDTRAIL_S3_BUCKET="bucket", S3_FETCH_WORKERS=1, S3_CHECKPOINT_LOOKBACK_MINUTES=60)
+    with app.app_context():
+        yield app
+
+
+def _scan(s3, watermarks):
+    return [event["eventID"] for event in iter_cloudtrail_from_s3(s3, watermarks=watermarks)]
+
+
+def test_lookback_start():
+    assert _lookback_start(PARTITION, _key("05", "0030", "abc"), 60) == (
+        f"{PARTITION}2024/12/04/123456789012_CloudTrail_us-east-1_20241204T2330"
+    )
+    assert _lookback_start(PARTITION, f"{PARTITION}other.json", 60) == f"{PARTITION}other.json"
+    assert _lookback_start(PARTITION, _key("05", "0030", "abc"), 0) == _key("05", "0030", "abc")
+
+
+def test_resumed_scan_reads_late_deliveries_once(app):
+    s3 = StubS3Client()
+    s3.put_log_file(_key("05", "1000", "m"), [{"eventID": "a"}])
+    s3.put_log_file(_key("05", "1010", "m"), [{"eventID": "b"}])
+    watermarks = {}
+    assert _scan(s3, watermarks) == ["a", "b"]
+    assert watermarks[PARTITION]["lastKey"] == _key("05", "1010", "m")
+
+    # Delivered late: the same minute with a lower suffix, and an earlier minute
+    s3.put_log_file(_key("05", "1010", "a"), [{"eventID": "c"}])
+    s3.put_log_file(_key("05", "1005", "z"), [{"eventID": "d"}])
+    s3.put_log_file(_key("05", "1020", "m"), [{"eventID": "e"}])
+    assert _scan(s3, watermarks) == ["d", "c", "e"]
+    assert _scan(s3, watermarks) == []
+    assert watermarks[PARTITION]["lastKey"] == _key("05", "1020", "m")
+
+
+def test_recent_keys_stay_within_the_lookback(app):
+    s3 = StubS3Client()
+    for hour in range(10, 16):
+        s3.put_log_file(_key("05", f"{hour}00", "m"), [{"eventID": str(hour)}])
+    watermarks = {}
+    _scan(s3, watermarks)
+    assert watermarks[PARTITION]["recentKeys"] == [_key("05", "1400", "m"), _key("05", "1500", "m")]
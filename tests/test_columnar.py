@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.analyzer import detect_suspicious_events, iter_suspicious_events
+from app.columnar import detect_suspicious_events_columnar, iter_suspicious_events_columnar
+from app.windows import WindowedDetector, window_settings
+from benchmarks.synthetic import generate_events
+
+START = datetime(2024, 12, 5)
+
+
+def _events():
+    events = generate_events(5000, seed=3, suspicious_ratio=0.2, root_ratio=0.05, failed_login_ratio=0.05)
+    # Shapes the column extractors must treat like the match functions do
+    events += [
+        {"eventName": "ConsoleLogin", "userIdentity": None, "responseElements": None},
+        {"eventName": "ConsoleLogin", "responseElements": {"ConsoleLogin": "Failure"}},
+        {"userIdentity": {"type": "Root"}},
+        {},
+    ]
+    return events
+
+
+@pytest.mark.parametrize("batch_size", [1, 7, 1000, 65536])
+def test_matches_per_event_path(batch_size):
+    events = _events()
+    assert detect_suspicious_events_columnar(events, batch_size=batch_size) == detect_suspicious_events(events)
+
+
+@pytest.mark.parametrize("batch_size", [7, 1000])
+def test_matches_per_event_path_with_window_rules(batch_size):
+    events = generate_events(5000, seed=5, suspicious_ratio=0.3)
+    for i, event in enumerate(events):  # a few seconds apart, so rate rules fire
+        event["eventTime"] = (START + timedelta(seconds=5 * i)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    settings = window_settings({"WINDOW_FAILED_LOGIN_THRESHOLD": 2, "WINDOW_IAM_BURST_THRESHOLD": 2})
+
+    expected = list(iter_suspicious_events(events, window_detector=WindowedDetector.from_settings(settings)))
+    columnar = list(iter_suspicious_events_columnar(
+        events, batch_size=batch_size, window_detector=WindowedDetector.from_settings(settings),
+    ))
+    assert any("windowKey" in a for a in expected)
+    assert columnar == expected
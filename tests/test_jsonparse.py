@@ -0,0 +1,73 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from app.jsonparse import iter_records, iter_records_stream
+
+
+def _records(count):
+    return [
+        {"eventID": str(i), "eventName": "PutObject", "userIdentity": {"userName": "zoë-日本-🚀" * (i % 4)}}
+        for i in range(count)
+    ]
+
+
+def _document(records, **layout):
+    return json.dumps({"Records": records}, ensure_ascii=False, **layout).encode("utf-8")
+
+
+def _stream(data, chunk_size):
+    return list(iter_records_stream(io.BytesIO(data), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 20])
+def test_records_split_across_chunks(chunk_size):
+    records = _records(50)
+    assert _stream(_document(records), chunk_size) == records
+    assert _stream(_document(records, indent=2), chunk_size) == records
+
+
+def test_multibyte_characters_split_between_chunks():
+    records = [{"eventID": "1", "requestParameters": {"key": "€" * 3000}}]
+    data = _document(records)
+    # Every offset of the three-byte character lands on a chunk edge somewhere
+    for chunk_size in (4095, 4096, 4097):
+        assert _stream(data, chunk_size) == records
+
+
+def test_empty_and_other_layouts():
+    assert _stream(b'{"Records": []}', 3) == []
+    assert _stream(b'{"Records": [], "Digest": true}', 3) == []
+    # Records not the first key: parsed whole
+    assert _stream(b'{"Digest": 1, "Records": [{"eventID": "a"}]}', 3) == [{"eventID": "a"}]
+    assert _stream(b'{"NotRecords": [1]}', 3) == []
+
+
+@pytest.mark.parametrize("cut", [1, 12, 40, -3, -2])
+def test_truncated_documents_raise(cut):
+    data = _document(_records(5))[:cut]
+    with pytest.raises(ValueError):
+        _stream(data, 8)
+
+
+def test_reading_stops_at_the_end_of_the_records():
+    # Nothing after the closing bracket is read, so a missing final brace goes unnoticed
+    assert _stream(_document(_records(5))[:-1], 8) == _records(5)
+
+
+def test_truncated_record_yields_the_complete_ones_first():
+    data = _document(_records(5))
+    records = iter_records_stream(io.BytesIO(data[: data.index(b'{"eventID": "4"') + 10]), chunk_size=16)
+    assert [next(records)["eventID"] for _ in range(4)] == ["0", "1", "2", "3"]
+    with pytest.raises(ValueError):
+        next(records)
+
+
+def test_gzip_stream_matches_whole_document_parse():
+    records = _records(200)
+    data = gzip.compress(_document(records))
+    streamed = list(iter_records(gzip.GzipFile(fileobj=io.BytesIO(data)), stream_min_bytes=0))
+    whole = list(iter_records(gzip.GzipFile(fileobj=io.BytesIO(data)), size_hint=len(data)))
+    assert streamed == whole == records
@@ -0,0 +1,120 @@
+import io
+
+import pytest
+
+from app.replay import ScalableBloomFilter, _hash, load_replay_guard, save_replay_guard
+
+
+def _ids(prefix, count):
+    return [_hash(f"{prefix}-{i}") for i in range(count)]
+
+
+def _copy(bloom):
+    f = io.BytesIO()
+    bloom.dump(f)
+    f.seek(0)
+    return ScalableBloomFilter.load(f, bloom.max_bytes)
+
+
+def _false_positive_rate(bloom, count=100000):
+    unseen = _ids("unseen", count)
+    return sum(h in bloom for h in unseen) / len(unseen)
+
+
+def _config(tmp_path):
+    return {
+        "REPLAY_GUARD_ENABLED": True,
+        "REPLAY_GUARD_PATH": str(tmp_path / "guard" / "replay_guard.bin"),
+        "REPLAY_GUARD_CAPACITY": 1000,
+        "REPLAY_GUARD_FP_RATE": 0.01,
+        "REPLAY_GUARD_MAX_BYTES": 1024 * 1024,
+    }
+
+
+def test_dump_load_round_trip():
+    bloom = ScalableBloomFilter(1000, 0.01, 1024 * 1024)
+    seen = _ids("seen", 5000)  # enough to grow the chain
+    for h in seen:
+        bloom.add(h)
+    assert len(bloom.filters) > 1
+
+    f = io.BytesIO()
+    bloom.dump(f)
+    f.seek(0)
+    loaded = ScalableBloomFilter.load(f, 1024 * 1024)
+
+    assert loaded.initial_capacity == bloom.initial_capacity
+    assert loaded.error_rate == bloom.error_rate
+    assert [b.key for b in loaded.filters] == [b.key for b in bloom.filters]
+    assert [b.count for b in loaded.filters] == [b.count for b in bloom.filters]
+    assert [b.words for b in loaded.filters] == [b.words for b in bloom.filters]
+    assert all(h in loaded for h in seen)
+
+
+@pytest.mark.parametrize("data", [b"not a guard\n", b""])
+def test_load_rejects_other_files(data):
+    with pytest.raises(ValueError):
+        ScalableBloomFilter.load(io.BytesIO(data), 1024 * 1024)
+
+
+def test_false_positive_rate():
+    bloom = ScalableBloomFilter(20000, 0.01, 16 * 1024 * 1024)
+    for h in _ids("seen", 20000):
+        bloom.add(h)
+
+    f = io.BytesIO()
+    bloom.dump(f)
+    f.seek(0)
+    loaded = ScalableBloomFilter.load(f, 16 * 1024 * 1024)
+
+    unseen = _ids("unseen", 100000)
+    rate = sum(h in loaded for h in unseen) / len(unseen)
+    assert rate <= 0.01
+
+
+def test_concurrent_saves_keep_both_scans_ids(tmp_path):
+    config = _config(tmp_path)
+    first = load_replay_guard(config)
+    second = load_replay_guard(config)
+    first_ids = [f"first-{i}" for i in range(3000)]
+    second_ids = [f"second-{i}" for i in range(500)]
+    for event_id in first_ids:
+        first.seen(event_id)
+    for event_id in second_ids:
+        second.seen(event_id)
+    counted = len(first.bloom) + len(second.bloom)
+
+    save_replay_guard(first, config)
+    save_replay_guard(second, config)  # saved last, but must not drop first's IDs
+
+    bloom = load_replay_guard(config).bloom
+    assert all(_hash(event_id) in bloom for event_id in first_ids + second_ids)
+    assert len(bloom) >= counted
+
+
+def test_saturated_chain_stays_below_error_rate():
+    bloom = ScalableBloomFilter(2000, 0.001, 200000)
+    for h in _ids("seen", 100000):  # growth stops early, then the oldest filters are dropped
+        bloom.add(h)
+    assert bloom.filters[0].seq > 0
+    assert _false_positive_rate(bloom) <= 0.001
+
+
+def test_merge_with_copy_that_dropped_its_oldest_filters():
+    base = ScalableBloomFilter(2000, 0.001, 200000)
+    for h in _ids("base", 40000):
+        base.add(h)
+    grown, kept = _copy(base), _copy(base)
+    grown_ids = _ids("grown", 30000)
+    for h in grown_ids:
+        grown.add(h)
+    kept_ids = _ids("kept", 1000)
+    for h in kept_ids:
+        kept.add(h)
+    assert grown.filters[0].seq > kept.filters[0].seq
+
+    kept.merge(grown)
+
+    assert [b.seq for b in kept.filters] == [b.seq for b in grown.filters]
+    assert all(h in kept for h in grown_ids[-10000:] + kept_ids)
+    assert _false_positive_rate(kept) <= 0.001
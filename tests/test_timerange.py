@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pytest
+
+from app.timerange import TimeRange, parse_date
+
+DAY_DIR = "AWSLogs/123456789012/CloudTrail/us-east-1/2024/12/%02d/file.json.gz"
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-12-05", datetime(2024, 12, 5)),
+    ("2024-12-05T10:30", datetime(2024, 12, 5, 10, 30)),
+    ("2024-12-05T10:30:15", datetime(2024, 12, 5, 10, 30, 15)),
+    ("2024-12-05T10:30:15Z", datetime(2024, 12, 5, 10, 30, 15)),
+    ("2024-12-05T10:30:15+00:00", datetime(2024, 12, 5, 10, 30, 15)),
+    ("2024-12-05T10:30:00+02:00", datetime(2024, 12, 5, 8, 30)),
+    ("2024-12-05T01:00:00+05:30", datetime(2024, 12, 4, 19, 30)),  # previous UTC day
+    ("2024-12-31T23:30:00-01:00", datetime(2025, 1, 1, 0, 30)),     # next UTC year
+])
+def test_parse_date(value, expected):
+    parsed = parse_date(value)
+    assert parsed == expected
+    assert parsed.tzinfo is None
+
+
+@pytest.mark.parametrize("value", ["", "yesterday", "2024-13-01", "2024-12-05 10:30 PM"])
+def test_parse_date_rejects_other_values(value):
+    with pytest.raises(ValueError):
+        parse_date(value)
+
+
+def test_empty_range_is_rejected():
+    with pytest.raises(ValueError):
+        TimeRange(datetime(2024, 12, 5), datetime(2024, 12, 5))
+
+
+def test_covers_path_allows_for_late_delivery():
+    time_range = TimeRange(datetime(2024, 12, 5), datetime(2024, 12, 7))
+    covered = [day for day in range(1, 11) if time_range.covers_path(DAY_DIR % day)]
+    # Day 7 starts at `until`, but its files may hold events of late on the 6th
+    assert covered == [5, 6, 7]
+
+
+def test_covers_path_at_day_edges():
+    # Starting a minute before midnight: the 4th's files hold only earlier events
+    time_range = TimeRange(since=datetime(2024, 12, 5, 23, 59))
+    assert not time_range.covers_path(DAY_DIR % 4)
+    assert time_range.covers_path(DAY_DIR % 5)
+    # Ending a minute after midnight: the 2nd's files may hold events of the 1st
+    time_range = TimeRange(until=datetime(2024, 12, 1, 0, 1))
+    assert time_range.covers_path(DAY_DIR % 1)
+    assert time_range.covers_path(DAY_DIR % 2)
+    assert not time_range.covers_path(DAY_DIR % 3)
+
+
+def test_covers_path_with_offset_bounds():
+    # 01:00+05:30 on the 6th is 19:30 UTC on the 5th, and paths are UTC days
+    time_range = TimeRange(parse_date("2024-12-06T01:00:00+05:30"))
+    assert time_range.covers_path(DAY_DIR % 5)
+    assert not time_range.covers_path(DAY_DIR % 4)
+
+
+def test_covers_path_without_a_day_directory():
+    time_range = TimeRange(datetime(2024, 12, 5), datetime(2024, 12, 6))
+    assert time_range.covers_path("sample_logs/events.json")
+    assert time_range.covers_path("logs/2024/02/30/file.json")  # not a date
+
+
+def test_filter_is_half_open_on_event_time():
+    time_range = TimeRange(parse_date("2024-12-05T10:00:00+02:00"), datetime(2024, 12, 5, 9))
+    events = [
+        {"eventTime": "2024-12-05T07:59:59Z"},
+        {"eventTime": "2024-12-05T08:00:00Z"},
+        {"eventTime": "2024-12-05T08:59:59Z"},
+        {"eventTime": "2024-12-05T09:00:00Z"},
+        {},
+    ]
+    assert [e["eventTime"] for e in time_range.filter(events)] == ["2024-12-05T08:00:00Z", "2024-12-05T08:59:59Z"]
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+from app.windows import WindowCounter, WindowedDetector, window_settings
+
+START = datetime(2024, 12, 5, 10, 0)
+
+
+def _failed_login(minutes, ip="10.0.0.1"):
+    return {
+        "eventSource": "signin.amazonaws.com",
+        "eventName": "ConsoleLogin",
+        "eventTime": (START + timedelta(minutes=minutes)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "sourceIPAddress": ip,
+        "userIdentity": {"type": "IAMUser", "userName": "alice"},
+        "responseElements": {"ConsoleLogin": "Failure"},
+    }
+
+
+def _detector(**overrides):
+    settings = window_settings({
+        "WINDOW_FAILED_LOGIN_THRESHOLD": 3,
+        "WINDOW_FAILED_LOGIN_MINUTES": 10,
+        "WINDOW_BUCKET_SECONDS": 60,
+        **overrides,
+    })
+    return WindowedDetector.from_settings(settings)
+
+
+def _observe(detector, events):
+    return [[a["windowCount"] for a in detector.observe(e)] for e in events]
+
+
+def test_fires_on_the_event_that_crosses_the_threshold():
+    detector = _detector()
+    assert _observe(detector, [_failed_login(m) for m in (0, 1, 2)]) == [[], [], [3]]
+
+
+def test_spread_out_events_do_not_fire():
+    detector = _detector()
+    assert _observe(detector, [_failed_login(m) for m in (0, 11, 22, 33)]) == [[], [], [], []]
+
+
+def test_fires_once_per_window_per_key():
+    detector = _detector()
+    fired = _observe(detector, [_failed_login(m) for m in range(0, 15)])
+    # Third event at minute 2, then again once a window has passed since that alert
+    assert [m for m, alerts in enumerate(fired) if alerts] == [2, 12]
+
+
+def test_keys_are_counted_separately():
+    detector = _detector()
+    events = [_failed_login(m, ip) for m in (0, 1) for ip in ("10.0.0.1", "10.0.0.2")]
+    events.append(_failed_login(2, "10.0.0.2"))
+    fired = _observe(detector, events)
+    assert fired[-1] == [3] and not any(fired[:-1])
+
+
+def test_disabled_settings_build_no_detector():
+    assert _detector(WINDOW_DETECTIONS_ENABLED=False) is None
+
+
+def test_buckets_expire_after_the_window():
+    counter = WindowCounter(600, bucket_seconds=60)
+    for ts in (0, 30, 90):
+        counter.add("k", ts)
+    assert counter.add("k", 300)[1] == 4
+    assert counter.add("k", 660)[1] == 3  # the [0, 60) bucket ended before 660 - 600
+    assert counter.add("k", 1000)[1] == 2
+
+
+def test_late_events_count_in_the_newest_bucket():
+    counter = WindowCounter(600, bucket_seconds=60)
+    counter.add("k", 300)
+    state = counter.add("k", 100)
+    assert [b[0] for b in state[0]] == [300 - 300 % 60]
+    assert state[1] == 2
+
+
+def test_least_recently_seen_keys_are_evicted_first():
+    counter = WindowCounter(600, bucket_seconds=60, max_keys=2)
+    counter.add("a", 0)
+    counter.add("b", 10)
+    counter.add("a", 20)
+    counter.add("c", 30)
+    assert len(counter) == 2
+    assert counter.add("b", 40)[1] == 1  # forgotten, counted afresh
+
+
+def test_idle_keys_are_evicted():
+    counter = WindowCounter(600, bucket_seconds=60)
+    counter.add("a", 0)
+    counter.add("b", 500)
+    assert len(counter) == 2
+    counter.add("b", 700)
+    assert len(counter) == 1